@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Compare :py:class:`rajax.batch.BatchMatcher` with calling
+:py:meth:`rajax.dfa.LazyDFA.match_set` once per string.
+
+    python bench/batch.py [--count N] [--batch N] [-o results.json]
+
+A column of ``--count`` short request paths is matched against a small set of
+patterns, ``--batch`` strings per call, and the strings per second of both are
+printed. Building the table is timed separately. Needs NumPy.
+"""
+import json
+import optparse
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+import rajax
+from rajax import batch, cmd, parser
+from rajax.dfa import LazyDFA
+
+PATTERNS = [
+    '^/api/[0-9]+/items$',
+    '[.](png|jpg)$',
+    '[0-9][0-9][0-9][0-9][0-9]',
+    'admin',
+]
+
+
+def make_paths(count):
+    rnd = random.Random(0)
+    return ['/%s/%d/%s' % (rnd.choice(['api', 'static', 'users', 'admin']),
+                           rnd.randint(0, 99999),
+                           rnd.choice(['app.js', 'items', 'logo.png', 'a.jpg',
+                                       'settings/profile']))
+            for _ in xrange(count)]
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [opts]')
+    p.add_option('--count', type='int', default=1000000,
+                 help='Number of strings')
+    p.add_option('--batch', type='int', default=100000,
+                 help='Strings per BatchMatcher call')
+    p.add_option('-o', '--output', help='Write results as JSON to this file')
+    opts, _ = p.parse_args()
+
+    parser.debug = False
+    paths = make_paths(opts.count)
+    program = cmd.compile_set(PATTERNS, anchored=False)
+
+    t = time.time()
+    matcher = batch.BatchMatcher(program, anchored=False)
+    build = time.time() - t
+
+    t = time.time()
+    counts = numpy.zeros(len(PATTERNS), dtype=numpy.intp)
+    for i in xrange(0, len(paths), opts.batch):
+        counts += matcher.match_ids(paths[i:i + opts.batch]).sum(axis=0)
+    batch_seconds = time.time() - t
+
+    dfa = LazyDFA(program)
+    t = time.time()
+    dfa_counts = [0] * len(PATTERNS)
+    for path in paths:
+        for i in dfa.match_set(path, anchored=False):
+            dfa_counts[i] += 1
+    dfa_seconds = time.time() - t
+
+    if list(counts) != dfa_counts:
+        print >> sys.stderr, 'counts differ: %r, %r' % (list(counts),
+                                                        dfa_counts)
+    print '%d states, table built in %.3fs' % (len(matcher.table), build)
+    print '%-12s %14s' % ('', 'strings/s')
+    print '%-12s %14.0f' % ('BatchMatcher', len(paths) / batch_seconds)
+    print '%-12s %14.0f' % ('LazyDFA', len(paths) / dfa_seconds)
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'rajax': rajax.__version__,
+                    'numpy': numpy.__version__,
+                    'count': opts.count,
+                    'batch': opts.batch,
+                },
+                'results': {
+                    'states': len(matcher.table),
+                    'build_seconds': build,
+                    'batch_seconds': batch_seconds,
+                    'dfa_seconds': dfa_seconds,
+                    'counts': dfa_counts,
+                },
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Benchmark :py:func:`rajax.cmd.parse` over a generated corpus and check the
+results against a stored baseline.
+
+Each axis of the corpus grows one feature of a pattern: literal length,
+alternation width, nesting depth, bracket expression size, negated classes,
+stacked quantifiers and repetition counts. For every pattern the suite records
+the median and minimum compile time and the size of the program.
+
+    python bench/compile.py -o results.json
+    python bench/compile.py --save-baseline bench/baseline.json
+    python bench/compile.py --baseline bench/baseline.json --margin 0.2
+
+With ``--baseline``, the exit status is 1 if the fastest compile of any
+pattern got slower than in the baseline by more than ``--margin`` (a
+fraction), or its program got bigger by more than ``--size-margin``. Timings
+are only comparable on the same machine, so save the baseline where the
+comparison will run. A baseline recorded with another parser backend or
+optimization level is refused.
+"""
+import gc
+import json
+import optparse
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rajax
+from rajax import cmd, optimize, parser
+
+
+# Characters which are ordinary both inside and outside bracket expressions
+ORDINARY = [chr(c) for c in xrange(33, 127) if chr(c) not in '\\*+?()|[]^-.']
+
+
+def literal(n):
+    return 'ab' * (n // 2)
+
+
+def alternation(n):
+    return '|'.join('w%03d' % i for i in xrange(n))
+
+
+def nesting(n):
+    return '(a|' * n + 'b' + ')' * n
+
+
+def bracket(n):
+    return '[%s]' % ''.join(ORDINARY[i % len(ORDINARY)] for i in xrange(n))
+
+
+def negated_classes(n):
+    return r'[^\W\d]' * n
+
+
+def stacked_quantifiers(n):
+    s = 'a'
+    for i in xrange(n):
+        s = '(%s)%s' % (s, '*+?'[i % 3])
+    return s
+
+
+def repetition(n):
+    return '[a-z]{1,%d}' % n
+
+#: Settings in a report's ``meta`` which must match the baseline's
+COMPARED_META = ('backend', 'opt_level')
+
+#: ``(axis, pattern generator, sizes)``
+AXES = [
+    ('literal', literal, [8, 64, 512, 4096]),
+    ('alternation', alternation, [2, 16, 128, 1024]),
+    ('nesting', nesting, [2, 8, 32, 128]),
+    ('bracket', bracket, [4, 16, 64, 256]),
+    ('negated_classes', negated_classes, [1, 4, 16, 64]),
+    ('stacked_quantifiers', stacked_quantifiers, [1, 4, 16, 64]),
+    ('repetition', repetition, [4, 64, 1024, 65535]),
+]
+
+
+def corpus():
+    """``[(name, pattern)]``"""
+    return [('%s/%d' % (axis, n), make(n))
+            for axis, make, sizes in AXES for n in sizes]
+
+
+def time_compile(s, min_time, min_runs, **kwargs):
+    """Compile ``s`` repeatedly. Return ``(sorted times, program)``"""
+    times = []
+    total = 0
+    # Like timeit, keep collections triggered by earlier patterns out of it
+    gc.collect()
+    gc.disable()
+    try:
+        while total < min_time or len(times) < min_runs:
+            t = time.time()
+            program = cmd.parse(s, use_cache=False, **kwargs)
+            t = time.time() - t
+            times.append(t)
+            total += t
+    finally:
+        gc.enable()
+    return sorted(times), program
+
+
+def run(opts):
+    results = {}
+    for name, s in corpus():
+        times, program = time_compile(s, opts.min_time, opts.min_runs,
+                                      opt_level=opts.opt_level,
+                                      backend=opts.backend)
+        results[name] = {
+            'pattern_length': len(s),
+            'runs': len(times),
+            'median_us': times[len(times) // 2] * 1e6,
+            'min_us': times[0] * 1e6,
+            'program_size': len(program),
+        }
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'rajax': rajax.__version__,
+            'backend': opts.backend,
+            'opt_level': opts.opt_level,
+        },
+        'results': results,
+    }
+
+
+def check_meta(meta, baseline):
+    """
+    Raise ``ValueError`` if ``baseline`` was recorded with other
+    :py:data:`COMPARED_META` settings than ``meta``
+    """
+    old = baseline.get('meta', {})
+    diffs = ['%s is %s, baseline %s' % (key, meta.get(key), old.get(key))
+             for key in COMPARED_META if meta.get(key) != old.get(key)]
+    if diffs:
+        raise ValueError('baseline was recorded with other settings: %s'
+                         % ', '.join(diffs))
+
+
+def compare(report, baseline, margin, size_margin):
+    """
+    :return: List of regressions as human-readable strings
+    :raises ValueError: If the baseline isn't comparable, see
+                        :py:func:`check_meta`
+    """
+    check_meta(report['meta'], baseline)
+    regressions = []
+    for name, old in sorted(baseline['results'].iteritems()):
+        new = report['results'].get(name)
+        if new is None:
+            continue
+        # The minimum is much less noisy than the median
+        if new['min_us'] > old['min_us'] * (1 + margin):
+            regressions.append('%s: %.1fus, baseline %.1fus (+%.0f%%)' % (
+                name, new['min_us'], old['min_us'],
+                (new['min_us'] / old['min_us'] - 1) * 100))
+        if new['program_size'] > old['program_size'] * (1 + size_margin):
+            regressions.append('%s: %d instructions, baseline %d' % (
+                name, new['program_size'], old['program_size']))
+    return regressions
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [opts]')
+    p.add_option('-o', '--output', default='bench-compile.json',
+                 help='Write results as JSON to this file')
+    p.add_option('--baseline', help='Compare against this results file')
+    p.add_option('--save-baseline', metavar='FILE',
+                 help='Also write the results to FILE, to use as a baseline')
+    p.add_option('--margin', type='float', default=0.5,
+                 help='Allowed slowdown over the baseline, as a fraction')
+    p.add_option('--size-margin', type='float', default=0.0,
+                 help='Allowed growth of program size, as a fraction')
+    p.add_option('--min-time', type='float', default=0.2,
+                 help='Seconds to spend compiling each pattern')
+    p.add_option('--min-runs', type='int', default=5,
+                 help='Compiles of each pattern, at least')
+    p.add_option('-b', '--backend', default=cmd.DEFAULT_BACKEND,
+                 help='Parser backend')
+    p.add_option('-O', '--optimize', type='int', dest='opt_level',
+                 default=optimize.DEFAULT_LEVEL, help='Optimization level')
+    opts, _ = p.parse_args()
+
+    baseline = None
+    if opts.baseline:
+        # Checked before the long run, which would be wasted
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+        try:
+            check_meta({'backend': opts.backend, 'opt_level': opts.opt_level},
+                       baseline)
+        except ValueError as e:
+            p.error(str(e))
+
+    parser.debug = False
+    report = run(opts)
+
+    print '%-26s %8s %12s %12s %8s' % (
+        'pattern', 'length', 'median us', 'min us', 'size')
+    for name, _ in corpus():
+        r = report['results'][name]
+        print '%-26s %8d %12.1f %12.1f %8d' % (
+            name, r['pattern_length'], r['median_us'], r['min_us'],
+            r['program_size'])
+
+    for path in filter(None, [opts.output, opts.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, opts.margin,
+                              opts.size_margin)
+        if regressions:
+            print
+            print 'Regressions against %s:' % opts.baseline
+            for r in regressions:
+                print '  ' + r
+            sys.exit(1)
+        print
+        print 'No regressions against %s' % opts.baseline
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Measure the throughput of ``rajax grep`` in MB/s on a generated log file.
+
+    python bench/grep.py [--size MB] [--file PATH] [-o results.json]
+
+The file is made of web-server-like log lines and is kept at ``--file``, so
+that a multi-GB file (``--size 4096``) only has to be written once. Each
+pattern is counted with :py:meth:`rajax.grep.Grep.count` over a memory map of
+the file, as ``rajax grep -c`` does, and the same count is taken with Python's
+``re`` over the file's lines for comparison. Patterns that contain literal text
+are mostly ``str.find``; the ``classes`` pattern has none and runs the DFA on
+every line.
+"""
+import json
+import mmap
+import optparse
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rajax
+from rajax import grep, parser
+
+MB = 1 << 20
+
+#: ``(name, pattern)``
+PATTERNS = [
+    ('literal', 'timeout'),
+    ('rare_literal', 'segfault'),
+    ('literal_classes', 'user[0-9]+ (GET|POST) /api'),
+    ('anchored', '^10[.]0[.][0-9]+[.][0-9]+ .* 5[0-9][0-9] '),
+    ('classes', '[a-z][0-9][0-9][0-9][0-9][0-9]'),
+]
+
+STATUSES = ['200', '200', '200', '304', '404', '500', '503']
+PATHS = ['/', '/index.html', '/api/items', '/api/users', '/static/app.js']
+
+
+def make_block(rnd, size):
+    """About ``size`` bytes of log lines"""
+    lines = []
+    total = 0
+    while total < size:
+        line = '%s %s user%d %s %s %s %dms%s\n' % (
+            '10.0.%d.%d' % (rnd.randint(0, 255), rnd.randint(0, 255)),
+            time.strftime('%Y-%m-%dT%H:%M:%S',
+                          time.gmtime(rnd.randint(0, 1 << 30))),
+            rnd.randint(0, 99999), rnd.choice(['GET', 'GET', 'POST']),
+            rnd.choice(PATHS), rnd.choice(STATUSES), rnd.randint(1, 999),
+            rnd.choice(['', '', '', ' timeout', ' id=%d' % rnd.randint(0, 99)]))
+        lines.append(line)
+        total += len(line)
+    return ''.join(lines)
+
+
+def generate(path, size):
+    """Write ``size`` bytes of log lines to ``path`` unless it is already
+    that big"""
+    if os.path.exists(path) and os.path.getsize(path) >= size:
+        return
+    rnd = random.Random(0)
+    # Cycling through a few distinct blocks is much faster than generating
+    # every line, and still gives the DFA varied input
+    blocks = [make_block(rnd, MB) for _ in xrange(16)]
+    written = 0
+    with open(path, 'wb') as f:
+        while written < size:
+            block = blocks[(written // MB) % len(blocks)]
+            f.write(block)
+            written += len(block)
+
+
+def time_rajax(pattern, path):
+    g = grep.Grep(pattern)
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            t = time.time()
+            count = g.count(buf)
+            return count, time.time() - t
+        finally:
+            buf.close()
+
+
+def time_re(pattern, path):
+    # The same language, except that rajax's . also matches a newline, which
+    # can't occur in a line
+    r = re.compile(pattern)
+    count = 0
+    t = time.time()
+    with open(path, 'rb') as f:
+        for line in f:
+            if r.search(line.rstrip('\n')):
+                count += 1
+    return count, time.time() - t
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [opts]')
+    p.add_option('--size', type='int', default=64,
+                 help='Size of the generated file in MB')
+    p.add_option('--file', default='bench-grep.log',
+                 help='Where to keep the generated file')
+    p.add_option('-o', '--output', help='Write results as JSON to this file')
+    p.add_option('--no-re', action='store_true',
+                 help="Don't time Python's re")
+    opts, _ = p.parse_args()
+
+    parser.debug = False
+    generate(opts.file, opts.size * MB)
+    size = os.path.getsize(opts.file)
+
+    print '%-16s %10s %10s %10s' % ('pattern', 'lines', 'rajax MB/s',
+                                    're MB/s')
+    results = {}
+    for name, pattern in PATTERNS:
+        count, seconds = time_rajax(pattern, opts.file)
+        result = {'pattern': pattern, 'lines': count, 'seconds': seconds,
+                  'mb_per_s': float(size) / MB / seconds}
+        re_speed = '-'
+        if not opts.no_re:
+            re_count, re_seconds = time_re(pattern, opts.file)
+            if re_count != count:
+                print >> sys.stderr, '%s: rajax counted %d lines, re %d' % (
+                    name, count, re_count)
+            result['re_mb_per_s'] = float(size) / MB / re_seconds
+            re_speed = '%.1f' % result['re_mb_per_s']
+        results[name] = result
+        print '%-16s %10d %10.1f %10s' % (name, count, result['mb_per_s'],
+                                          re_speed)
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'rajax': rajax.__version__,
+                    'bytes': size,
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Measure how the throughput of :py:class:`rajax.parallel.ParallelScan` scales
+with the number of worker processes.
+
+    python bench/parallel.py [--size MB] [-j 1,2,4,8] [--chunk-size BYTES]
+                             [--speculative]
+
+Uses the same generated log file as ``bench/grep.py``. For each worker count,
+every pattern's selected lines are counted, and the throughput in MB/s and the
+speedup over one worker are printed. Starting the pool is not timed. The
+speedup can't exceed the number of CPUs, which is printed first.
+
+With ``--speculative``, the whole file is scanned as one input by
+:py:class:`rajax.parallel.SpeculativeScan` instead, with each pattern's
+:py:class:`rajax.dfa.DFATable`, and the lines column is the end of the first
+match.
+"""
+import json
+import mmap
+import multiprocessing
+import optparse
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rajax
+from rajax import cmd, grep, parallel, parser
+from rajax.dfa import LazyDFA
+
+# bench/grep.py, which is on the path as the directory of this script
+from grep import MB, PATTERNS, generate
+
+
+def time_lines(pattern, path, jobs, chunk_size):
+    with parallel.ParallelScan(grep.Grep(pattern), jobs=jobs,
+                               chunk_size=chunk_size) as scan:
+        t = time.time()
+        count = scan.count(path)
+        return count, time.time() - t
+
+
+def time_speculative(pattern, path, jobs, chunk_size):
+    table = LazyDFA(cmd.parse(pattern, anchored=False)).table()
+    scan = parallel.SpeculativeScan(table, jobs=jobs, chunk_size=chunk_size)
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # Starting the pool is timed here, as it is part of every scan
+            t = time.time()
+            _, last, _ = scan.scan(buf)
+            return last or 0, time.time() - t
+        finally:
+            buf.close()
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [opts]')
+    p.add_option('--size', type='int', default=64,
+                 help='Size of the generated file in MB')
+    p.add_option('--file', default='bench-grep.log',
+                 help='Where to keep the generated file')
+    p.add_option('-j', '--jobs', default='1,2,4,8',
+                 help='Comma-separated worker counts')
+    p.add_option('--chunk-size', type='int', help='Bytes per task')
+    p.add_option('--speculative', action='store_true',
+                 help='Scan the file as one input with SpeculativeScan')
+    p.add_option('-o', '--output', help='Write results as JSON to this file')
+    opts, _ = p.parse_args()
+
+    parser.debug = False
+    generate(opts.file, opts.size * MB)
+    size = os.path.getsize(opts.file)
+    jobs = [int(j) for j in opts.jobs.split(',')]
+    if opts.chunk_size is None:
+        opts.chunk_size = (parallel.DEFAULT_SPECULATIVE_CHUNK_SIZE
+                           if opts.speculative else parallel.DEFAULT_CHUNK_SIZE)
+
+    print '%d CPUs, %.0f MB' % (multiprocessing.cpu_count(), float(size) / MB)
+    print '%-16s %6s %10s %10s %8s' % ('pattern', 'jobs', 'lines', 'MB/s',
+                                       'speedup')
+    results = {}
+    for name, pattern in PATTERNS:
+        results[name] = {}
+        base = None
+        for n in jobs:
+            if opts.speculative:
+                count, seconds = time_speculative(pattern, opts.file, n,
+                                                  opts.chunk_size)
+            else:
+                count, seconds = time_lines(pattern, opts.file, n,
+                                            opts.chunk_size)
+            mb_per_s = float(size) / MB / seconds
+            if base is None:
+                base = mb_per_s
+            results[name][n] = {'lines': count, 'seconds': seconds,
+                                'mb_per_s': mb_per_s}
+            print '%-16s %6d %10d %10.1f %8.2f' % (name, n, count, mb_per_s,
+                                                   mb_per_s / base)
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'rajax': rajax.__version__,
+                    'cpus': multiprocessing.cpu_count(),
+                    'bytes': size,
+                    'chunk_size': opts.chunk_size,
+                    'speculative': bool(opts.speculative),
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
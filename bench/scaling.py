@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Show that compile time and memory grow linearly with the length of a pattern.
+Each pattern is compiled in a fresh process so that its peak memory can be
+measured; time and memory per character of pattern should stay roughly flat
+as the size grows. Patterns are compiled with the library's default settings,
+including :py:data:`rajax.parser.debug`, whose output is thrown away.
+
+    python bench/scaling.py [-s 1000,10000,100000] [-b ply,rd]
+"""
+import json
+import optparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_pattern(shape, size):
+    """A pattern of about ``size`` characters"""
+    if shape == 'literal':
+        return 'x' * size
+    if shape == 'alternation':
+        rnd = random.Random(size)
+        words = [''.join(rnd.choice('abcdefgh') for _ in xrange(6))
+                 for _ in xrange(size // 7)]
+        return '|'.join(words)
+    if shape == 'classes':
+        return '[ab]c' * (size // 5)
+    if shape == 'groups':
+        return '(ab)*' * (size // 5)
+    if shape == 'bracket':
+        return '[%s]' % ''.join(chr(ord('a') + i % 26) for i in xrange(size))
+    raise ValueError(shape)
+
+SHAPES = ['literal', 'alternation', 'classes', 'groups', 'bracket']
+
+
+def measure(shape, size, backend):
+    """Run in the child process"""
+    from rajax import cmd
+    s = make_pattern(shape, size)
+    # Compile with the library's default settings, which print the parser's
+    # debugging output; keep that out of the result
+    result = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = time.time()
+    program = cmd.parse(s, use_cache=False, backend=backend)
+    seconds = time.time() - t
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss
+    json.dump({'chars': len(s), 'instructions': len(program),
+               'seconds': seconds, 'rss_kb': rss}, result)
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [opts]')
+    p.add_option('-s', '--sizes', default='1000,10000,100000',
+                 help='Comma-separated pattern sizes')
+    p.add_option('-b', '--backends', default='ply,rd',
+                 help='Comma-separated parser backends')
+    p.add_option('--child', nargs=3, help=optparse.SUPPRESS_HELP)
+    opts, _ = p.parse_args()
+
+    if opts.child:
+        shape, size, backend = opts.child
+        measure(shape, int(size), backend)
+        return
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    env.pop('RAJAX_CACHE_DIR', None)
+
+    print '%-12s %-4s %8s %8s %10s %10s %10s' % (
+        'shape', '', 'chars', 'instrs', 'seconds', 'us/char', 'KB/char')
+    for shape in SHAPES:
+        for backend in opts.backends.split(','):
+            for size in opts.sizes.split(','):
+                out = subprocess.check_output(
+                    [sys.executable, __file__, '--child', shape, size,
+                     backend], env=env)
+                r = json.loads(out)
+                print '%-12s %-4s %8d %8d %10.3f %10.2f %10.3f' % (
+                    shape, backend, r['chars'], r['instructions'],
+                    r['seconds'], r['seconds'] * 1e6 / r['chars'],
+                    float(r['rss_kb']) / r['chars'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Measure how long a fresh interpreter takes to import rajax and to compile its
+first regular expression. Every sample runs in a new process, so nothing is
+warm except the OS file cache.
+
+    python bench/startup.py [-n RUNS]
+"""
+import optparse
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet prints the seconds spent in the part being measured, so that
+# interpreter startup itself is not counted
+SNIPPETS = [
+    ('import rajax', """
+import time
+t = time.time()
+import rajax
+print time.time() - t
+"""),
+    ('import rajax.cmd', """
+import time
+t = time.time()
+from rajax import cmd
+print time.time() - t
+"""),
+    ('first compile', """
+import time
+from rajax import cmd, parser
+parser.debug = False
+t = time.time()
+cmd.parse('ab(c|d)*[e-g]+', use_cache=False)
+print time.time() - t
+"""),
+    ('import + first compile', """
+import time
+t = time.time()
+from rajax import cmd, parser
+parser.debug = False
+cmd.parse('ab(c|d)*[e-g]+', use_cache=False)
+print time.time() - t
+"""),
+]
+
+
+def sample(code, env):
+    out = subprocess.check_output([sys.executable, '-c', code], env=env,
+                                  cwd=ROOT)
+    return float(out.strip().splitlines()[-1])
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [opts]')
+    p.add_option('-n', '--runs', type='int', default=20,
+                 help='Processes to start per measurement')
+    opts, _ = p.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    env.pop('RAJAX_CACHE_DIR', None)
+    # Measure an installed package, which has its .pyc files. Write them now
+    # rather than during the first sample.
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    sample(SNIPPETS[-1][1], env)
+
+    print '%-24s %10s %10s %10s' % ('', 'min ms', 'median ms', 'max ms')
+    for name, code in SNIPPETS:
+        times = sorted(sample(code, env) for _ in xrange(opts.runs))
+        print '%-24s %10.2f %10.2f %10.2f' % (
+            name, times[0] * 1000, times[len(times) // 2] * 1000,
+            times[-1] * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,9 @@ Specification <http://opengroup.org/onlinepubs/007908775/xbd/re.html>`_.
 
 The allowed operators are ?, +, *, (), and escape sequences for those
 characters. No other escape sequences are supported.
-"""
 
-import instructions
-import lexer
-import parser
-import visualize
+Submodules are not imported here, so ``import rajax`` is cheap. Import the
+ones you need, e.g. ``from rajax import cmd``.
+"""
 
 __version__ = 0.
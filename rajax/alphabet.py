@@ -0,0 +1,76 @@
+"""
+Split the character codes into classes that a program can't tell apart.
+
+Every ``char``, ``nchar`` and ``range`` instruction accepts whole intervals of
+codes, so the codes between two consecutive interval boundaries, taken over
+the whole program, are accepted by exactly the same instructions. They go to
+the same DFA state from any state, and a DFA table only needs a column per
+class instead of one per code:
+
+    >>> alphabet = Alphabet(cmd.parse('[a-z]+[0-9]'), size=256)
+    >>> alphabet.starts
+    [0, 48, 58, 97, 123]
+    >>> alphabet.classify(ord('q'))
+    3
+
+With the default ``size``, the classes cover every code point up to
+:py:data:`rajax.const.INF`, which a table could never have a column for each
+of; over bytes (``size=256``), :py:attr:`Alphabet.byte_classes` maps each byte
+to its class directly.
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_right
+
+from rajax.const import CHAR, INF, NCHAR, RANGE, WILDCARD
+
+
+def boundaries(program):
+    """
+    :return: Sorted list of the codes at which some instruction of
+             ``program`` starts or stops accepting characters, not
+             counting 0
+    """
+    points = set()
+    for opcode, arg1, arg2 in program:
+        if opcode == RANGE or opcode == CHAR or opcode == NCHAR:
+            if arg1 == WILDCARD:
+                continue
+            points.add(arg1)
+            points.add((arg2 or arg1) + 1)
+    points.discard(0)
+    return sorted(points)
+
+
+class Alphabet(object):
+    """
+    The equivalence classes of the codes below ``size`` for ``program``.
+
+    :param program: A list of opcode tuples
+    :param size: Number of codes to cover
+
+    .. py:attribute: size
+
+        Number of codes covered
+
+    .. py:attribute: starts
+
+        The lowest code of each class, in order; class ``i`` is the codes
+        from ``starts[i]`` up to ``starts[i + 1]``
+
+    .. py:attribute: byte_classes
+
+        List of the class of each byte, 0 to 255
+    """
+
+    def __init__(self, program, size=INF + 1):
+        self.size = size
+        self.starts = [0] + [b for b in boundaries(program) if b < size]
+        self.byte_classes = [self.classify(b) for b in xrange(min(size, 256))]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def classify(self, c):
+        """:return: The class of code ``c``"""
+        return bisect_right(self.starts, c) - 1
@@ -5,11 +5,16 @@ This module is a disaster area and should not be used as a model for writing
 your own parser of any kind. Caveat lector.
 """
 
-from instructions import Instruction, transform_classes
+from instructions import Instruction, make_charset, transform_classes
+from lexer import repeat_bounds
 import const
 
 all_chars = Instruction('char', 0, const.INF)
 
+#: A counted repetition whose copies would take more instructions than this is
+#: compiled to a ``repeat`` loop instead
+REPEAT_EXPAND_LIMIT = 64
+
 class ASTNode(object):
     """
     A basic node which maintains all basic attributes and passes control down
@@ -87,7 +92,8 @@ class ASTNode(object):
         :param flags: A dict of flags which is passed through all calls to
                       :py:meth:`~rajax.ast.ASTNode.generate_instructions`. Used
                       for generating code for matching/nonmatching bracket
-                      expressions.
+                      expressions, and to carry a
+                      :py:class:`~rajax.profiling.CompileStats` as ``stats``.
         :return: A list of Instruction objects
         """
         instr_list = instr_list or []
@@ -102,8 +108,8 @@ class ASTNode(object):
         else:
             s1 = "%s: " % self.node_type
         if self.data:
-            if isinstance(self.data, str) or (self.data > 0 and self.data != 2 << 15):
-                if not isinstance(self.data, str):
+            if isinstance(self.data, basestring) or (self.data > 0 and self.data != 2 << 15):
+                if not isinstance(self.data, basestring):
                     try:
                         s2 = chr(self.data)
                     except ValueError:
@@ -134,31 +140,35 @@ class RegexNode(ASTNode):
 
     def generate_instructions(self, instr_list=None, flags=None):
         """
-        Generate code for a ``|`` operator if ``subtype == 'alt'``::
+        Generate code for a ``|`` operator if ``subtype == 'alt'``. There is
+        one child per alternative::
 
                 split L1, L2
             L1: codes for e1
-                jmp L3
-            L2: codes for e2
-            L3:
+                jmp L5
+            L2: split L3, L4
+            L3: codes for e2
+                jmp L5
+            L4: codes for e3
+            L5:
 
         If ``subtype != 'alt'``, then this node is reduced away during parsing.
         """
         instr_list = instr_list or []
         flags = flags or {}
         if self.subtype == 'alt':
-            back_jump = len(instr_list)+1
-
-            first_split = Instruction('split', back_jump, 'TEMP')
-            instr_list.append(first_split)
-            instr_list = self.children[0].generate_instructions(instr_list, flags)
-
-            first_jump = Instruction('jmp', 'TEMP')
-            instr_list.append(first_jump)
-            first_split.arg2 = len(instr_list)
-
-            instr_list = self.children[1].generate_instructions(instr_list, flags)
-            first_jump.arg1 = len(instr_list)
+            jumps = []
+            for child in self.children[:-1]:
+                split = Instruction('split', len(instr_list)+1, 'TEMP')
+                instr_list.append(split)
+                instr_list = child.generate_instructions(instr_list, flags)
+                jump = Instruction('jmp', 'TEMP')
+                instr_list.append(jump)
+                jumps.append(jump)
+                split.arg2 = len(instr_list)
+            instr_list = self.children[-1].generate_instructions(instr_list, flags)
+            for jump in jumps:
+                jump.arg1 = len(instr_list)
             return instr_list
         return super(RegexNode, self).generate_instructions(instr_list, flags)
 
@@ -193,6 +203,51 @@ class NonDupReNode(ASTNode):
         return super(NonDupReNode, self).generate_instructions(instr_list, flags)
 
 
+class LiteralNode(NonDupReNode):
+    """
+    Generates code for a run of ordinary characters. Created by
+    :py:mod:`rajax.simplify` out of consecutive ``nondup_re_char`` nodes.
+    """
+
+    def __init__(self, data):
+        super(LiteralNode, self).__init__('literal', data=data)
+
+    def generate_instructions(self, instr_list=None, flags=None):
+        """
+        Generate code for each character in turn::
+
+            abc     char 'a'
+                    char 'b'
+                    char 'c'
+        """
+        instr_list = instr_list or []
+        flags = flags or {}
+        for c in self.data:
+            instr_list.append(Instruction('char', ord(c)))
+        return instr_list
+
+
+class AssertNode(ASTNode):
+    """Generates code for ``^`` and ``$``"""
+
+    def __init__(self, data):
+        subtype = 'bol' if data == '^' else 'eol'
+        super(AssertNode, self).__init__('assertion', subtype, data=data)
+        self.graph_color = "#ffeecc"
+
+    def generate_instructions(self, instr_list=None, flags=None):
+        """
+        Generate a zero-width assertion::
+
+            ^       bol
+            $       eol
+        """
+        instr_list = instr_list or []
+        flags = flags or {}
+        instr_list.append(Instruction(self.subtype))
+        return instr_list
+
+
 class SimpleReNode(ASTNode):
     """Generates code for +, *, and ? operators"""
 
@@ -241,7 +296,7 @@ class SimpleReNode(ASTNode):
                 first_split = Instruction('split', back_jump, 'TEMP')
                 instr_list.append(first_split)
 
-                instr_list = lchild.generate_instructions(instr_list)
+                instr_list = lchild.generate_instructions(instr_list, flags)
                 if self.data == '*':
                     instr_list.append(Instruction('jmp', back_jump-1))
                 first_split.arg2 = len(instr_list)
@@ -250,6 +305,106 @@ class SimpleReNode(ASTNode):
             return super(SimpleReNode, self).generate_instructions(instr_list, flags)
 
 
+class RepeatNode(SimpleReNode):
+    """
+    Generates code for ``{m}``, ``{m,}`` and ``{m,n}``. ``data`` is the text of
+    the operator.
+
+    .. py:attribute: min_count
+
+        ``m``
+
+    .. py:attribute: max_count
+
+        ``n``, or None if there is no upper bound
+    """
+
+    def __init__(self, children, data):
+        super(RepeatNode, self).__init__('repeat', children, data=data)
+        self.min_count, self.max_count = repeat_bounds(data)
+        self.graph_color = "#ccffcc"
+
+    def generate_instructions(self, instr_list=None, flags=None):
+        """
+        Small counts are expanded into copies of ``e``. e{2,4}::
+
+                codes for e
+                codes for e
+                split L1, L3
+            L1: codes for e
+                split L2, L3
+            L2: codes for e
+            L3:
+
+        e{2,} is e followed by e+, and e{0,} is e*.
+
+        If the copies would take more than :py:data:`REPEAT_EXPAND_LIMIT`
+        instructions, ``e`` is generated once, inside a counted loop.
+        e{0,1000}::
+
+                split L1, L2
+            L1: codes for e
+                repeat L1, d
+                bounds 1, 1000
+            L2:
+
+        ``d`` is the number of counted loops this one is nested in. A counter
+        is reset when its loop exits, so loops which aren't nested can share
+        one and every thread only needs a counter per level of nesting.
+        """
+        instr_list = instr_list or []
+        flags = flags or {}
+        lo, hi = self.min_count, self.max_count
+        body = self.children[0]
+        if hi == 0:
+            return instr_list
+
+        start = len(instr_list)
+        skips = []
+        if lo == 0:
+            skips.append(Instruction('split', start + 1, 'TEMP'))
+            instr_list.append(skips[0])
+        depth = flags.get('repeat_depth', 0)
+        flags['repeat_depth'] = depth + 1
+
+        # Generate the first copy, then decide how to do the rest by its size
+        body_start = len(instr_list)
+        instr_list = body.generate_instructions(instr_list, flags)
+        size = len(instr_list) - body_start
+        if hi is None:
+            expanded = max(lo, 1) * size + (2 if lo == 0 else 1)
+        else:
+            expanded = lo * size + (hi - lo) * (size + 1)
+        counted = size + 2 + len(skips)
+
+        if expanded <= max(REPEAT_EXPAND_LIMIT, counted):
+            last = body_start
+            for _ in xrange(1, lo):
+                last = len(instr_list)
+                instr_list = body.generate_instructions(instr_list, flags)
+            if hi is None:
+                if lo == 0:
+                    instr_list.append(Instruction('jmp', start))
+                else:
+                    instr_list.append(Instruction('split', last,
+                                                  len(instr_list) + 1))
+            else:
+                for _ in xrange(max(lo, 1), hi):
+                    split = Instruction('split', len(instr_list) + 1, 'TEMP')
+                    instr_list.append(split)
+                    skips.append(split)
+                    instr_list = body.generate_instructions(instr_list, flags)
+        else:
+            instr_list.append(Instruction('repeat', body_start, depth))
+            instr_list.append(Instruction(
+                'bounds', max(lo, 1), const.UNBOUNDED if hi is None else hi))
+
+        flags['repeat_depth'] = depth
+        for split in skips:
+            split.arg2 = len(instr_list)
+        return instr_list
+
+
 class RangeExprNode(ASTNode):
     """Generates code for range expressions inside bracket expressions"""
 
@@ -367,20 +522,18 @@ class BrackExprListNode(ASTNode):
         Perform transformations and pass down flags in order to implement
         matching and nonmatching lists.
 
-        For matching lists, generate a block of ``SPLIT``s, generate children's
-        ``CHAR`` instructions, and interleave them between a series of
-        ``JMP``s. Example::
-
-            [abc]
-            0:  split   1   3
-            1:  split   2   5
-            2:  jmp     7
-            3:  char    a
-            4:  jmp     9
-            5:  char    b
-            6:  jmp     9
-            7:  char    c
-            8:  match
+        Alternatives which are single ``CHAR`` instructions are combined into
+        one ``CHARSET`` instruction followed by its sorted table of ranges, so
+        the VM tests them all with one thread. Example::
+
+            [ac-e]
+            0:  charset 2
+            1:  range   a   a
+            2:  range   c   e
+            3:  match
+
+        Any other alternatives get a block of ``SPLIT``s, and the alternatives
+        are interleaved between a series of ``JMP``s.
 
         For nonmatching lists, just complement the set.
         Same for negative classes in matching lists.
@@ -408,7 +561,8 @@ class BrackExprListNode(ASTNode):
                 if instr.cmd == 'char':
                     switch_instrs.append([instr])
                 elif instr.cmd == 'nchar':
-                    switch_instrs.extend(transform_classes([[all_chars]], [instr]))
+                    switch_instrs.extend(_transform_classes(
+                        flags, [[all_chars]], [instr]))
                 elif instr.cmd == 'BREAK':
                     switch_instrs.append([])
         else:
@@ -430,13 +584,15 @@ class BrackExprListNode(ASTNode):
                     new_list_on_char = True
             if not switch_instrs:
                 switch_instrs = [[Instruction('char', 0, 2 << 15)]]
-            switch_instrs = transform_classes(switch_instrs, tailing_nchars)
+            switch_instrs = _transform_classes(flags, switch_instrs,
+                                               tailing_nchars)
 
         # ====================================
         # = Re-sort instrs and generate code =
         # ====================================
-        if len(switch_instrs) == 1 and len(switch_instrs[0]) == 1:
-            instr_list.append(switch_instrs[0][0])
+        switch_instrs = _combine_chars(switch_instrs)
+        if len(switch_instrs) == 1:
+            instr_list.extend(switch_instrs[0])
         else:
             end_of_splits = len(instr_list) + len(switch_instrs)
             # Continue after one split per block, and one jmp per block except the last one
@@ -452,3 +608,33 @@ class BrackExprListNode(ASTNode):
                 instr_list.append(Instruction('jmp', end_of_jumps))
             instr_list.extend(switch_instrs[-1])
         return instr_list
+
+
+def _transform_classes(flags, classes, excludes):
+    """:py:func:`~rajax.instructions.transform_classes`, timed if profiling"""
+    stats = flags.get('stats')
+    if stats is None:
+        return transform_classes(classes, excludes)
+    return stats.run('transform_classes', transform_classes, classes, excludes)
+
+
+def _combine_chars(switch_instrs):
+    """
+    Replace each run of alternatives that are a single ``char`` with one
+    alternative that tests all of them at once. Other alternatives keep their
+    place, so the order of the remaining ``SPLIT``s doesn't change.
+    """
+    combined = []
+    run = []
+    for instrs in switch_instrs + [None]:
+        if instrs is not None and len(instrs) == 1 and instrs[0].cmd == 'char':
+            run.append(instrs[0])
+            continue
+        if len(run) == 1:
+            combined.append(run)
+        elif run:
+            combined.append(make_charset(run))
+        run = []
+        if instrs is not None:
+            combined.append(instrs)
+    return combined
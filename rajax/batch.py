@@ -0,0 +1,159 @@
+"""
+Match a program against many short strings at once with NumPy.
+
+Calling :py:meth:`rajax.dfa.LazyDFA.match_set` a million times spends most
+of its time getting in and out of Python functions. :py:class:`BatchMatcher`
+turns the program's :py:class:`~rajax.dfa.DFATable` into a dense NumPy array
+once, packs a batch of strings into a two-dimensional array of bytes, one row
+per string, and then advances the state of every string with a single indexing
+operation per column:
+
+    >>> program = cmd.compile_set(['GET', 'POST', 'api/'], anchored=False)
+    >>> matcher = BatchMatcher(program, anchored=False)
+    >>> matcher.match_ids(['GET /api/items', 'HEAD /', 'POST /'])
+    array([[ True, False,  True],
+           [False, False, False],
+           [False,  True, False]])
+
+The strings are sorted by length first, so the rows still being read always
+come first and each column only touches those. Results are what
+:py:func:`rajax.vm.match_set` gives for each string.
+
+The table is over bytes: ``unicode`` strings are encoded as UTF-8, which only
+means the same thing as the pattern if it was compiled with ``utf8=True`` or
+is ASCII. NumPy is optional; without it, importing this module works but
+:py:class:`BatchMatcher` raises ``ImportError``.
+"""
+from __future__ import absolute_import
+
+from rajax.const import MATCH
+from rajax.dfa import DEFAULT_MAX_STATES, LazyDFA
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class BatchMatcher(object):
+    """
+    Matches one program against batches of strings.
+
+    :param program: A list of opcode tuples, from :py:func:`rajax.cmd.parse`
+                    or :py:func:`rajax.cmd.compile_set`, without counted loops
+    :param anchored: See :py:func:`rajax.vm.match_set`
+    :param full: See :py:func:`rajax.vm.match_set`
+    :param max_states: See :py:meth:`rajax.dfa.LazyDFA.table`
+
+    .. py:attribute: n_patterns
+
+        Number of result columns: one more than the highest pattern id
+
+    .. py:attribute: next
+
+        ``next[state, cls]``, the dense transition table, with a column for
+        each class of bytes in :py:attr:`classes`
+
+    .. py:attribute: classes
+
+        The class of each byte
+    """
+
+    def __init__(self, program, anchored=True, full=False,
+                 max_states=DEFAULT_MAX_STATES):
+        if numpy is None:
+            raise ImportError('BatchMatcher needs NumPy')
+        self.anchored = anchored
+        self.full = full
+        table = LazyDFA(program).table(anchored=anchored, cut=False,
+                                       max_states=max_states)
+        self.table = table
+        self.n_patterns = 1 + max(inst[1] for inst in program
+                                  if inst[0] == MATCH)
+        n = len(table)
+        dtype = numpy.uint16 if n <= 1 << 16 else numpy.uint32
+        self.next = numpy.array(table.next, dtype=dtype)
+        self.classes = numpy.array(table.classes, dtype=numpy.uint8)
+        self.dead = numpy.array(table.dead, dtype=bool)
+        # ids[state, id]: reaching state matches id; end_ids: the same for
+        # the input ending in state
+        self.ids = self._id_matrix(table.match_ids)
+        self.end_ids = self._id_matrix(table.end_ids)
+        self.matching = self.ids.any(axis=1)
+        self.start_ids = self._id_matrix([table.match_ids[0]
+                                          | table.start_end_ids])[0]
+
+    def _id_matrix(self, id_sets):
+        matrix = numpy.zeros((len(id_sets), self.n_patterns), dtype=bool)
+        for state, ids in enumerate(id_sets):
+            matrix[state, list(ids)] = True
+        return matrix
+
+    def encode(self, strings):
+        """
+        Pack ``strings`` into one array.
+
+        :return: ``(codes, lengths, order)``: ``codes[i]`` holds the classes
+                 of the bytes of string ``order[i]``, padded, longest first,
+                 and ``lengths[i]`` its length
+        """
+        strings = [s.encode('utf-8') if isinstance(s, unicode) else s
+                   for s in strings]
+        lengths = numpy.fromiter((len(s) for s in strings), dtype=numpy.intp,
+                                 count=len(strings))
+        order = numpy.argsort(-lengths, kind='mergesort')
+        lengths = lengths[order]
+        width = int(lengths[0]) if len(strings) else 0
+        packed = ''.join(strings[i].ljust(width, '\0') for i in order)
+        codes = self.classes[numpy.frombuffer(packed, dtype=numpy.uint8)]
+        return codes.reshape(len(strings), width), lengths, order
+
+    def run(self, codes, lengths):
+        """
+        Match the rows of an array from :py:meth:`encode`.
+
+        :return: Boolean array: ``result[i, id]`` is True if pattern ``id``
+                 matches row ``i``
+        """
+        next, ids, matching, dead = (self.next, self.ids, self.matching,
+                                     self.dead)
+        n = len(lengths)
+        states = numpy.zeros(n, dtype=self.next.dtype)
+        found = numpy.zeros((n, self.n_patterns), dtype=bool)
+        if not self.full:
+            found[:] = ids[0]
+        # Number of rows with more than j bytes, for each column j
+        active = numpy.searchsorted(-lengths, -numpy.arange(codes.shape[1]),
+                                    side='left')
+        for j in xrange(codes.shape[1]):
+            k = active[j]
+            states[:k] = next[states[:k], codes[:k, j]]
+            if not self.full:
+                hit = numpy.flatnonzero(matching[states[:k]])
+                if len(hit):
+                    found[hit] |= ids[states[hit]]
+            if j % 8 == 7 and dead[states[:k]].all():
+                # Nothing is left to match; dead rows stay as they are
+                break
+        if self.full:
+            found |= ids[states]
+        found |= self.end_ids[states]
+        empty = lengths == 0
+        if empty.any():
+            found[empty] = self.start_ids
+        return found
+
+    def match_ids(self, strings):
+        """
+        :return: Boolean array with a row for each of ``strings`` and a column
+                 for each pattern id
+        """
+        codes, lengths, order = self.encode(strings)
+        result = numpy.empty((len(order), self.n_patterns), dtype=bool)
+        result[order] = self.run(codes, lengths)
+        return result
+
+    def match(self, strings):
+        """:return: Boolean array, True for each string that any pattern
+                    matches"""
+        return self.match_ids(strings).any(axis=1)
@@ -0,0 +1,337 @@
+"""
+Process-wide memoization of compiled programs.
+
+:py:func:`rajax.cmd.parse` looks patterns up in :py:data:`compile_cache` before
+running the lexer, parser and code generator, so a pattern that is compiled
+over and over only pays for it once.
+
+The in-memory cache can be backed by a :py:class:`DiskCache` directory that is
+shared between processes, so that a new worker loads ready-made programs
+instead of compiling them. Set ``RAJAX_CACHE_DIR`` in the environment or call
+:py:func:`enable_disk_cache` to turn it on.
+"""
+from __future__ import absolute_import
+
+import collections
+import errno
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import rajax
+from rajax.const import CODEGEN_VERSION, opcode_to_cmd
+from rajax.instructions import PACKED_VERSION, from_buffer, to_bytes
+
+#: Default limit on the number of cached programs
+DEFAULT_MAX_ENTRIES = 1024
+#: Default limit on the approximate size of all cached programs, in bytes
+DEFAULT_MAX_BYTES = 16 << 20
+#: Default limit on the size of a cache directory, in bytes
+DEFAULT_MAX_DISK_BYTES = 64 << 20
+#: When a cache directory is over its limit, shrink it to this fraction of it
+DISK_LOW_WATER = 0.9
+#: Seconds after which a temporary file in a cache directory is assumed to
+#: have been left behind by a writer that died
+STALE_TMP_AGE = 600
+
+# Approximate size of one (opcode, arg1, arg2) tuple of small ints
+INSTRUCTION_BYTES = sys.getsizeof((0, 0, 0))
+
+# Everything besides the pattern and options that decides what a cached
+# program means: if any of it changes, old entries are never looked up again
+FORMAT = (rajax.__version__, CODEGEN_VERSION, PACKED_VERSION,
+          hashlib.sha1(repr(sorted(opcode_to_cmd.iteritems()))).hexdigest())
+
+
+def program_size(program):
+    """Approximate memory used by a list of opcode tuples, in bytes"""
+    return sys.getsizeof(program) + INSTRUCTION_BYTES * len(program)
+
+
+class CompileCache(object):
+    """
+    An LRU cache of compiled programs, keyed by pattern and compile options.
+    Safe to share between threads.
+
+    :param max_entries: Maximum number of programs to keep
+    :param max_bytes: Maximum approximate size of all programs together
+
+    .. py:attribute: hits
+
+        Number of lookups answered from the cache
+
+    .. py:attribute: misses
+
+        Number of lookups which had to compile
+
+    .. py:attribute: evictions
+
+        Number of programs dropped to stay under the limits
+
+    .. py:attribute: disk
+
+        A :py:class:`DiskCache` consulted before compiling, or None
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, disk=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.clear()
+
+    def clear(self):
+        """Drop every cached program and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get(self, s, options, compile_func):
+        """
+        Return the program for pattern ``s`` compiled with ``options``,
+        calling ``compile_func(s, **options)`` if it is not cached yet.
+
+        :param options: A dict of keyword arguments for ``compile_func``
+        :return: A new list of opcode tuples which the caller may modify
+        """
+        key = (s, tuple(sorted(options.iteritems())))
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                self.hits += 1
+                return list(entry[0])
+            self.misses += 1
+
+        # Compile outside the lock so that other threads aren't held up
+        disk = self.disk
+        program = disk.get(s, options) if disk else None
+        if program is None:
+            program = compile_func(s, **options)
+            if disk:
+                disk.put(s, options, program)
+        size = program_size(program)
+        with self._lock:
+            if key not in self._entries and size <= self.max_bytes:
+                self._entries[key] = (tuple(program), size)
+                self.total_bytes += size
+                self._shrink()
+        return program
+
+    def _shrink(self):
+        while (len(self._entries) > self.max_entries or
+               self.total_bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def resize(self, max_entries=None, max_bytes=None):
+        """Change the limits, evicting programs if necessary"""
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._shrink()
+
+    def stats(self):
+        """
+        :return: ``{'entries', 'bytes', 'hits', 'misses', 'evictions'}``
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache(object):
+    """
+    A directory of compiled programs which any number of processes may read
+    and write at the same time.
+
+    Entries are named after a hash of the pattern, the compile options, the
+    rajax version, :py:data:`rajax.const.CODEGEN_VERSION`, the packed format
+    version and the opcode numbering, so a rajax that would compile or read
+    the program differently never loads stale bytecode. Each entry
+    is written to a temporary file and renamed into place, so readers never
+    see a partial entry and concurrent writers of the same entry simply
+    replace each other's identical files. When the directory grows past
+    ``max_bytes``, the least recently used entries are deleted.
+
+    :param path: Cache directory, created if necessary
+    :param max_bytes: Size limit for the directory
+    """
+
+    suffix = '.rjx'
+    tmp_prefix = '.tmp-'
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._approx_bytes = None
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def key(self, s, options):
+        """Name of the entry for pattern ``s`` compiled with ``options``"""
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        h = hashlib.sha1()
+        h.update(repr((type(s).__name__, s, sorted(options.iteritems()),
+                       FORMAT)))
+        return h.hexdigest()
+
+    def _entry_path(self, s, options):
+        return os.path.join(self.path, self.key(s, options) + self.suffix)
+
+    def get(self, s, options):
+        """
+        :return: The cached list of opcode tuples, or None
+        """
+        path = self._entry_path(s, options)
+        try:
+            with open(path, 'rb') as f:
+                program = from_buffer(f.read()).unpack()
+        except IOError:
+            return None
+        except ValueError:
+            # Not written by this version of rajax; get rid of it
+            _remove(path)
+            return None
+        try:
+            # Mark as recently used for eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return program
+
+    def put(self, s, options, program):
+        """Atomically store ``program`` for pattern ``s`` and ``options``"""
+        data = to_bytes(program)
+        path = self._entry_path(s, options)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=self.tmp_prefix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # An entry for the same key is replaced, not added to
+            replaced = _file_size(path)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            _remove(tmp_path)
+            return
+
+        if self._approx_bytes is None:
+            self._approx_bytes = self.size()
+        else:
+            self._approx_bytes += len(data) - replaced
+        if self._approx_bytes > self.max_bytes:
+            self.prune()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Deleted by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _remove_stale_tmp(self, max_age=STALE_TMP_AGE):
+        """
+        Delete temporary files older than ``max_age`` seconds, which a
+        process that died in :py:meth:`put` never renamed into place
+        """
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.path):
+            if not name.startswith(self.tmp_prefix):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    _remove(path)
+            except OSError:
+                continue
+
+    def size(self):
+        """Total size of the entries in the directory, in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def prune(self):
+        """
+        Delete least recently used entries until under the size limit, and
+        stale temporary files
+        """
+        self._remove_stale_tmp()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        low_water = self.max_bytes * DISK_LOW_WATER
+        for _, size, path in entries:
+            if total <= low_water:
+                break
+            _remove(path)
+            total -= size
+        self._approx_bytes = total
+
+    def clear(self):
+        """Delete every entry and stale temporary file"""
+        self._remove_stale_tmp()
+        for _, _, path in self._entries():
+            _remove(path)
+        self._approx_bytes = 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _file_size(path):
+    """Size of the file at ``path``, or 0 if there isn't one"""
+    try:
+        return os.stat(path).st_size
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return 0
+
+
+#: The cache used by :py:func:`rajax.cmd.parse`
+compile_cache = CompileCache()
+
+
+def enable_disk_cache(path, max_bytes=DEFAULT_MAX_DISK_BYTES):
+    """
+    Back :py:data:`compile_cache` with a :py:class:`DiskCache` in ``path``.
+    Pass ``path=None`` to turn it off again.
+    """
+    compile_cache.disk = DiskCache(path, max_bytes) if path else None
+
+
+if os.environ.get('RAJAX_CACHE_DIR'):
+    enable_disk_cache(os.environ['RAJAX_CACHE_DIR'])
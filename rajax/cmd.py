@@ -6,10 +6,14 @@ This module implements a compiler for basic regular expressions. The grammar
 implementation is based on the one described in the `1997 Single UNIX
 Specification <http://opengroup.org/onlinepubs/007908775/xbd/re.html>`_.
 
-The allowed operators are ?, +, *, (), and escape sequences for those
-characters. No other escape sequences are supported.
+The allowed operators are ?, +, *, {m,n}, (), the anchors ^ and $, and escape
+sequences for those characters. No other escape sequences are supported.
+
+Programs match code points, or with ``utf8=True``, the bytes of UTF-8 encoded
+text; see :py:mod:`rajax.utf8`.
 """
 
+import functools
 import json
 import logging
 import optparse
@@ -19,15 +23,126 @@ import sys
 
 import instructions
 import lexer
+import optimize
 import parser
+import profiling
+import rdparser
+import simplify
 import visualize
-from rajax.const import opcode_to_cmd
+from rajax.ast import AssertNode
+from rajax.cache import compile_cache
+from rajax.const import WILDCARD, opcode_to_cmd
+from rajax.utf8 import lower as utf8_lower
 
 
 log = logging.getLogger(__name__)
 
+#: Functions which turn a string into a reduced AST, by ``backend`` name.
+#: ``'rd'`` is the hand-written :py:mod:`rajax.rdparser`, which is much faster
+#: on short patterns and builds the same AST.
+BACKENDS = {
+    'ply': parser.parse,
+    'rd': rdparser.parse,
+}
+DEFAULT_BACKEND = 'ply'
+
+
+def _backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError('backend must be one of %r' % sorted(BACKENDS))
+
+
+def _phase(stats, name, func, *args):
+    """Run one phase of a compile, through ``stats`` if it is being profiled"""
+    if stats is None:
+        return func(*args)
+    return stats.run(name, func, *args)
+
+
+def _parse_ast(s, backend, stats, fg=False):
+    """Parse ``s``, timing lexing separately if profiling the ply backend"""
+    if fg:
+        # Only the ply backend can keep every production in the AST
+        backend = 'ply'
+    if stats is None:
+        if fg:
+            return parser.parse(s, True)
+        return _backend(backend)(s)
+    if backend == 'ply':
+        tokens = stats.run('lex', lexer.tokenize, s)
+        return stats.run('parse', parser.parse, s, fg, tokens)
+    return stats.run('parse', _backend(backend), s)
+
+
+def _starts_with_bol(node):
+    """True if every match of the reduced AST ``node`` starts with ``^``"""
+    while node.node_type == 're_expr' and node.subtype == 'concat':
+        node = node.children[0]
+    if node.node_type == 'regex' and node.subtype == 'alt':
+        return all(_starts_with_bol(c) for c in node.children)
+    return isinstance(node, AssertNode) and node.subtype == 'bol'
+
+
+def _decode(s, utf8):
+    """
+    A UTF-8 program is compiled from a UTF-8 pattern: decode a byte string so
+    that each of its characters is one code point
+    """
+    if utf8 and isinstance(s, str):
+        return s.decode('utf-8')
+    return s
+
+
+def _search_prefix(utf8=False):
+    """
+    ``.*?`` in front of an unanchored program: skip as few characters as
+    possible, then ``mark`` the start of the match::
+
+        0: split 3, 1
+        1: char  WILD
+        2: jmp   0
+        3: mark
+
+    A UTF-8 program skips any byte, ``char 0 0xFF``, so that invalid UTF-8 in
+    the input doesn't stop the search.
+    """
+    if utf8:
+        skip = instructions.Instruction('char', 0, 0xFF)
+    else:
+        skip = instructions.Instruction('char', WILDCARD)
+    return [
+        instructions.Instruction('split', 3, 1),
+        skip,
+        instructions.Instruction('jmp', 0),
+        instructions.Instruction('mark'),
+    ]
+
+
+def _optimize(instr_list, opt_level, stats, opt_stats):
+    """
+    Run the optimizer, filling in ``opt_stats`` and adding its counts to
+    ``stats`` if either is given
+    """
+    if opt_stats is None and stats is not None:
+        opt_stats = {}
+    instr_list = _phase(stats, 'optimize', optimize.optimize, instr_list,
+                        opt_level, opt_stats)
+    if stats is not None:
+        stats.add_optimizer_counts(opt_stats)
+    return instr_list
+
+
+def _generate(root, instr_list, stats):
+    if stats is None:
+        return root.generate_instructions(instr_list)
+    return root.generate_instructions(instr_list, {'stats': stats})
 
-def show(s, reduced=True, dot_path=None, pdf_path=None, fmt='pretty'):
+
+def show(s, reduced=True, dot_path=None, pdf_path=None, fmt='pretty',
+         opt_level=optimize.DEFAULT_LEVEL, backend=DEFAULT_BACKEND,
+         stats=None, anchored=True, utf8=False):
     """Generates a graphviz diagram of the AST for the given path. Since this
     is mostly debug functionality, there are also options to print various
     significant values.
@@ -38,20 +153,37 @@ def show(s, reduced=True, dot_path=None, pdf_path=None, fmt='pretty'):
                     diagram. Defaults to True.
     :param dot_path: Where to write dot file, if any
     :param pdf_path: Where to write PDF file. Requires dot_file to also be set.
-    :param format: 'pretty' or 'json'
+    :param format: 'pretty', 'json' or 'binary'
+    :param opt_level: Optimization level. At 1 or more the AST is rewritten by
+                      :py:mod:`rajax.simplify` and the instructions by
+                      :py:func:`rajax.optimize.optimize`.
+    :param backend: Name of the parser in :py:data:`BACKENDS`. Only ``'ply'``
+                    can build the full AST, so it is always used if
+                    ``reduced`` is False.
+    :param stats: A :py:class:`rajax.profiling.CompileStats` to fill in with
+                  the cost of each phase, if any
+    :param anchored: See :py:func:`parse`
+    :param utf8: See :py:func:`parse`
     """
-    ALLOWED_FORMATS = ('pretty', 'json')
+    ALLOWED_FORMATS = ('pretty', 'json', 'binary')
     if fmt not in ALLOWED_FORMATS:
         raise ValueError('fmt must be one of %r' % ALLOWED_FORMATS)
 
     log.info('dot path: %s' % dot_path)
+    s = _decode(s, utf8)
 
     if fmt == 'pretty':
         log.info('Tokens:')
-        lexer.lexer.input(s)
-        for tok in iter(lexer.lexer.token, None):
+        lx = lexer.new_lexer()
+        lx.input(s)
+        for tok in iter(lx.token, None):
             log.info('%r %r' % (tok.type, tok.value))
-    root = parser.parse(s, (not reduced))
+    if reduced:
+        root = _parse_ast(s, backend, stats)
+    else:
+        # Only drawn, so it isn't part of the profile; the program is still
+        # compiled from the reduced AST
+        root = _parse_ast(s, backend, None, fg=True)
 
     if dot_path:
         visualize.ast_dot(root, dot_path)
@@ -71,44 +203,218 @@ def show(s, reduced=True, dot_path=None, pdf_path=None, fmt='pretty'):
                 log.error("PDF could not be written. Graphviz does not appear"
                           " to be installed or some other error occurred.")
 
-    instr_list = root.generate_instructions()
-    instr_list.append(instructions.Instruction('match'))
     # Print instructions after the AST is drawn in case instruction printing
     # fails
-    program = instructions.serialize(instr_list)
+    if not reduced:
+        root = None
+    elif opt_level >= 1:
+        root = _phase(stats, 'simplify', simplify.simplify, root)
+    opt_stats = {}
+    program = _compile(s, opt_level, backend, anchored, utf8, stats,
+                       root=root, opt_stats=opt_stats)
+    log.info("Optimizer removed %d of %d instructions (%d jumps threaded,"
+             " %d splits folded, %d unreachable, %d fall-through jumps)" % (
+             opt_stats['before'] - opt_stats['after'], opt_stats['before'],
+             opt_stats['threaded'], opt_stats['folded'],
+             opt_stats['unreachable'], opt_stats['fallthrough']))
 
     if fmt == 'json':
         program = [(opcode_to_cmd[inst[0]].upper(), inst[1], inst[2])
                    for inst in program]
         json.dump(program, sys.stdout)
+    elif fmt == 'binary':
+        sys.stdout.write(instructions.to_bytes(program))
     elif fmt == 'pretty':
         log.info("Instructions for VM:")
         instructions.prettyprint_program(program)
 
 
-def parse(s):
+def tree(s, opt_level=optimize.DEFAULT_LEVEL, backend=DEFAULT_BACKEND,
+         utf8=False, stats=None):
+    """
+    Build the AST that :py:func:`parse` compiles ``s`` from with the same
+    options: the reduced AST, rewritten by :py:mod:`rajax.simplify` at
+    ``opt_level`` 1 or more.
+
+    :return: The root :py:class:`rajax.ast.ASTNode`
+    """
+    root = _parse_ast(_decode(s, utf8), backend, stats)
+    if opt_level >= 1:
+        root = _phase(stats, 'simplify', simplify.simplify, root)
+    return root
+
+
+def parse(s, use_cache=True, opt_level=optimize.DEFAULT_LEVEL,
+          backend=DEFAULT_BACKEND, stats=None, anchored=True, utf8=False,
+          root=None):
     """
     Converts a regular expression into bytecode for the VM
 
     :param s: A regular expression
+    :param use_cache: If True, look the program up in
+                      :py:data:`rajax.cache.compile_cache` first
+    :param opt_level: Optimization level. At 1 or more the AST is rewritten by
+                      :py:mod:`rajax.simplify` and the instructions by
+                      :py:func:`rajax.optimize.optimize`.
+    :param backend: Name of the parser to use, a key of :py:data:`BACKENDS`
+    :param stats: A :py:class:`rajax.profiling.CompileStats` to fill in with
+                  the cost of each phase. The cache is not used if it is
+                  given.
+    :param anchored: If False, the program starts with a non-greedy ``.*?``
+                     loop, so that running it anchored at ``pos`` finds the
+                     leftmost match anywhere after ``pos`` in one pass. A
+                     ``mark`` after the loop records where the match starts.
+                     Patterns that start with ``^`` don't need the loop and
+                     don't get it.
+    :param utf8: If True, the program reads UTF-8 encoded bytes instead of
+                 code points, and a byte string ``s`` is decoded as UTF-8.
+                 Every character test is lowered by
+                 :py:func:`rajax.utf8.lower`.
+    :param root: The AST returned by :py:func:`tree` for ``s`` and the same
+                 options, if the caller has already built it. It is compiled
+                 instead of parsing ``s`` again.
     :return: A list of opcode tuples in the form `[(opcode, arg1, arg2)]`
     """
-    instr_list = parser.parse(s).generate_instructions()
+    options = {'opt_level': opt_level, 'backend': backend,
+               'anchored': anchored, 'utf8': utf8}
+    if use_cache and stats is None:
+        compile_func = _compile
+        if root is not None:
+            compile_func = functools.partial(_compile, root=root)
+        return compile_cache.get(s, options, compile_func)
+    return _compile(s, stats=stats, root=root, **options)
+
+
+def _compile(s, opt_level, backend, anchored, utf8, stats=None, root=None,
+             opt_stats=None):
+    """
+    Compile pattern ``s``; see :py:func:`parse` for the options.
+
+    :param root: The AST of ``s`` returned by :py:func:`tree`, if it has
+                 already been built
+    :param opt_stats: Dict to fill in with the optimizer's counts, see
+                      :py:func:`rajax.optimize.optimize`
+    """
+    if root is None:
+        root = tree(s, opt_level, backend, utf8, stats)
+    instr_list = None
+    if not anchored and not _starts_with_bol(root):
+        instr_list = _search_prefix(utf8)
+    prefix_len = len(instr_list or [])
+    instr_list = _phase(stats, 'codegen', _generate, root, instr_list, stats)
     instr_list.append(instructions.Instruction('match'))
-    return instructions.serialize(instr_list)
+    if utf8:
+        instr_list = _phase(stats, 'utf8', utf8_lower, instr_list, prefix_len)
+    instr_list = _optimize(instr_list, opt_level, stats, opt_stats)
+    return _phase(stats, 'serialize', instructions.serialize, instr_list)
+
+
+def compile_set(patterns, use_cache=True, opt_level=optimize.DEFAULT_LEVEL,
+                backend=DEFAULT_BACKEND, stats=None, anchored=True,
+                utf8=False):
+    """
+    Compile several regular expressions into one program which tries all of
+    them at once. The ``match`` instruction at the end of pattern ``i`` has
+    ``i`` as its first argument, so :py:func:`rajax.vm.match_set` can report
+    every pattern that matched in a single pass.
+
+    :param patterns: A sequence of regular expressions
+    :param use_cache: See :py:func:`parse`
+    :param opt_level: See :py:func:`parse`
+    :param backend: See :py:func:`parse`
+    :param stats: See :py:func:`parse`
+    :param anchored: See :py:func:`parse`. The loop is shared by all of the
+                     patterns, and left out if they all start with ``^``.
+    :param utf8: See :py:func:`parse`
+    :return: A list of opcode tuples
+    """
+    patterns = tuple(patterns)
+    if not patterns:
+        raise ValueError('compile_set needs at least one pattern')
+    options = {'opt_level': opt_level, 'backend': backend,
+               'anchored': anchored, 'utf8': utf8}
+    if use_cache and stats is None:
+        return compile_cache.get(patterns, options, _compile_set)
+    return _compile_set(patterns, stats=stats, **options)
+
+
+def _compile_set(patterns, opt_level, backend, anchored, utf8, stats=None,
+                 opt_stats=None):
+    """
+    Compile ``patterns``; see :py:func:`compile_set` for the options.
+
+    :param opt_stats: See :py:func:`_compile`
+    """
+    # One split per pattern but the last one, which is jumped to:
+    #
+    #       split P0, L1
+    #   L1: split P1, L2
+    #   L2: jmp   P2
+    #   P0: codes for pattern 0
+    #       match 0
+    #   ...
+    roots = []
+    for s in patterns:
+        root = _parse_ast(_decode(s, utf8), backend, stats)
+        if opt_level >= 1:
+            root = _phase(stats, 'simplify', simplify.simplify, root)
+        roots.append(root)
+    instr_list = []
+    if not anchored and not all(_starts_with_bol(r) for r in roots):
+        instr_list = _search_prefix(utf8)
+    prefix_len = len(instr_list)
+    for _ in patterns[:-1]:
+        instr_list.append(instructions.Instruction('split', len(instr_list) + 1,
+                                                   'TEMP'))
+    instr_list.append(instructions.Instruction('jmp', 'TEMP'))
+    entries = instr_list[-len(patterns):]
+    for pattern_id, root in enumerate(roots):
+        entry = entries[pattern_id]
+        if entry.cmd == 'split':
+            entry.arg1, entry.arg2 = len(instr_list), entry.arg1
+        else:
+            entry.arg1 = len(instr_list)
+        instr_list = _phase(stats, 'codegen', _generate, root, instr_list,
+                            stats)
+        instr_list.append(instructions.Instruction('match', pattern_id))
+    if utf8:
+        instr_list = _phase(stats, 'utf8', utf8_lower, instr_list, prefix_len)
+    instr_list = _optimize(instr_list, opt_level, stats, opt_stats)
+    return _phase(stats, 'serialize', instructions.serialize, instr_list)
 
 
 def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] == 'grep':
+        import grep
+        return grep.main(args[1:])
+
     p = optparse.OptionParser(
-        description='Compile a regular expression into NFA instructions',
-        usage='%prog expr [opts]')
+        description=('Compile a regular expression into NFA instructions, or'
+                     ' with "grep", search files for it'),
+        usage='%prog expr [opts]\n       %prog grep [opts] pattern [file ...]')
+    p.add_option('-b', '--backend', type='choice',
+                 choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                 help='Parser to use, "ply" (default) or "rd"')
     p.add_option('-d', '--dot', help='Write the AST as a Graphviz dot file')
     p.add_option('-f', '--format', default='pretty',
-                 help='Output format, either "pretty" or "json"')
+                 help='Output format, "pretty", "json" or "binary"')
     p.add_option('-j', '--json', action='store_true',
                  help='Alias for --format=json')
+    p.add_option('-O', '--optimize', type='int', dest='opt_level',
+                 default=optimize.DEFAULT_LEVEL,
+                 help='Optimization level, 0 to turn optimizations off')
+    p.add_option('-P', '--profile', type='choice', choices=['table', 'json'],
+                 help=('Print the time, memory and size of each compile phase'
+                       ' to stderr, as a "table" or "json"'))
     p.add_option('-p', '--pdf', help=('Write the AST as a PDF file. Implies'
                                       ' --dot=FILENAME.dot.'))
+    p.add_option('-u', '--unanchored', action='store_true',
+                 help=('Start the program with a .*? loop, to find a match'
+                       ' anywhere'))
+    p.add_option('--utf8', action='store_true',
+                 help='Compile for UTF-8 encoded bytes instead of code points')
     p.add_option('-v', '--verbose', action='store_true',
                  help='Print debugging information')
 
@@ -128,5 +434,18 @@ def main(args=None):
 
     fmt = 'json' if opts.json else opts.format
 
+    stats = None
+    if opts.profile:
+        stats = profiling.CompileStats()
+        profiling.start_tracing()
+
     parser.debug = False
-    show(args[0], fmt=fmt.lower(), pdf_path=opts.pdf, dot_path=dot_path)
+    show(args[0], fmt=fmt.lower(), pdf_path=opts.pdf, dot_path=dot_path,
+         opt_level=opts.opt_level, backend=opts.backend, stats=stats,
+         anchored=not opts.unanchored, utf8=opts.utf8)
+
+    if opts.profile == 'json':
+        json.dump(stats.as_dict(), sys.stderr, indent=2, sort_keys=True)
+        sys.stderr.write('\n')
+    elif opts.profile == 'table':
+        sys.stderr.write(stats.format_table())
@@ -9,6 +9,13 @@ opcode_to_cmd = {
     2: 'split',
     3: 'jmp',
     4: 'nchar',
+    5: 'charset',
+    6: 'range',
+    7: 'repeat',
+    8: 'bounds',
+    9: 'bol',
+    10: 'eol',
+    11: 'mark',
 }
 
 #: Also define them as integer constants, mostly for readability in the VM
@@ -17,11 +24,34 @@ CHAR = 1
 SPLIT = 2
 JMP = 3
 NCHAR = 4
+#: ``charset n`` is followed by a table of ``n`` ``range lo hi`` records,
+#: sorted and disjoint, and matches a character in any of them
+CHARSET = 5
+RANGE = 6
+#: ``repeat L n`` closes a counted loop whose body starts at ``L``, using
+#: counter ``n``. It is followed by a ``bounds lo hi`` record: the body runs at
+#: least ``lo`` and at most ``hi`` times.
+REPEAT = 7
+BOUNDS = 8
+#: Zero-width assertions for ``^`` and ``$``
+BOL = 9
+EOL = 10
+#: Zero-width: the match starts here. Ends the ``.*?`` loop of an unanchored
+#: program.
+MARK = 11
 
 # Other constants
 WILDCARD = 0x11FFFF
 # Highest possible unicode value, from http://unifoundry.com/unicode-tutorial.html
 INF = 0x10FFFF
+#: Upper bound of a ``bounds`` record for ``{m,}``
+UNBOUNDED = 0xFFFFFFFF
+#: Largest count allowed in ``{m,n}``
+MAX_REPEAT = 0xFFFF
+
+#: Bumped whenever a pattern compiles to a different program than before, so
+#: that programs cached on disk by an older rajax are not loaded
+CODEGEN_VERSION = 2
 
 #: Map command strings back to opcodes
 cmd_to_opcode = {}
@@ -0,0 +1,606 @@
+"""
+A lazily-built DFA for the bytecode returned by :py:func:`rajax.cmd.parse`.
+
+Each DFA state is the priority-ordered list of threads that
+:py:mod:`rajax.vm` would have alive at some input offset. States and their
+transitions are only built when the input needs them, and are memoized, so
+most characters cost one dictionary lookup instead of one step per live
+thread.
+
+The cache of states and their transitions is bounded by ``max_bytes``. When it
+fills up, states are evicted according to ``eviction``:
+
+``'flush'``
+    Throw away every state except the current one, like RE2 does.
+
+``'lru'``
+    Throw away the older half of the states, ordered by when they were last
+    looked up in the cache. Following an already-built transition does not
+    count as a lookup, to keep the inner loop cheap.
+
+If the cache is emptied repeatedly while fewer than ``min_chars_per_state``
+characters are scanned for each state built, the DFA is doing more work than
+the NFA would, so that search is handed to :py:func:`rajax.vm.run` instead.
+
+States don't keep the counters of ``repeat`` loops, so programs with counted
+loops (large ``{m,n}``) are always run by :py:mod:`rajax.vm`, at a cost per
+character that grows with ``n``.
+
+:py:meth:`LazyDFA.table` builds every state reachable on byte input at once,
+as a :py:class:`DFATable` with a dense transition table, for the uses that
+need all of the states up front (see :py:mod:`rajax.parallel`). The table has
+a column per :py:class:`rajax.alphabet.Alphabet` class rather than per byte,
+and is minimized, so it is usually far smaller than 256 entries per state; with
+``codepoints=True`` it covers all of Unicode in the same way.
+
+Threads waiting on ``$`` stay in a state until the input either goes on, which
+kills them, or ends, which lets them through to whatever they match then.
+
+A :py:class:`LazyDFA` is not thread-safe; give each thread its own.
+"""
+from __future__ import absolute_import
+
+from rajax import vm
+from rajax.alphabet import Alphabet
+from rajax.const import EOL, INF, MARK, MATCH
+
+#: Default cache budget, in bytes
+DEFAULT_MAX_BYTES = 2 << 20
+
+# Rough cost of a state and of a memoized transition in CPython, used to
+# account for the cache budget
+STATE_BYTES = 160
+THREAD_BYTES = 8
+TRANSITION_BYTES = 48
+
+# Number of cache resets tolerated in one search before the thrashing check
+# kicks in
+MIN_RESETS = 2
+
+EVICTION_POLICIES = ('flush', 'lru')
+
+#: Most states :py:meth:`LazyDFA.table` builds before giving up
+DEFAULT_MAX_STATES = 10000
+
+
+class CacheThrashing(Exception):
+    """Raised internally when the state cache is not paying for itself"""
+
+
+class TooManyStates(Exception):
+    """Raised by :py:meth:`LazyDFA.table` when the DFA is too big to build"""
+
+
+class DFAState(object):
+    """
+    .. py:attribute: insts
+
+        Tuple of program counters of live threads, highest priority first
+
+    .. py:attribute: seeding
+
+        True if a new thread is started at the next offset (unanchored search
+        that has not matched yet)
+
+    .. py:attribute: is_match
+
+        True if a thread reached ``match`` at this offset
+
+    .. py:attribute: match_ids
+
+        Set of pattern ids of the threads that reached ``match``
+
+    .. py:attribute: next
+
+        Memoized transitions, ``{character code: DFAState}``
+
+    .. py:attribute: end_ids
+
+        Set of pattern ids matched if the input ends at this offset, once
+        computed by :py:meth:`LazyDFA._end_match_ids`, otherwise None
+    """
+
+    __slots__ = ('key', 'insts', 'seeding', 'is_match', 'match_ids', 'dead',
+                 'next', 'used', 'end_ids')
+
+    def __init__(self, key, insts, seeding, match_ids):
+        self.key = key
+        self.insts = insts
+        self.seeding = seeding
+        self.is_match = bool(match_ids)
+        self.match_ids = match_ids
+        self.dead = not insts and not seeding
+        self.next = {}
+        self.used = 0
+        self.end_ids = None
+
+
+class LazyDFA(object):
+    """
+    Match a program with a lazily-built DFA. The methods have the same
+    signatures and results as the functions in :py:mod:`rajax.vm`.
+
+    :param program: A list of opcode tuples
+    :param max_bytes: Approximate memory budget for the state cache
+    :param eviction: ``'flush'`` or ``'lru'``
+    :param min_chars_per_state: Fall back to the NFA simulation when the cache
+                                thrashes below this ratio
+    """
+
+    def __init__(self, program, max_bytes=DEFAULT_MAX_BYTES, eviction='flush',
+                 min_chars_per_state=10):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError('eviction must be one of %r' % (EVICTION_POLICIES,))
+        self.program = program
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.min_chars_per_state = min_chars_per_state
+
+        self.cache = {}
+        self.cache_bytes = 0
+        self.clock = 0
+        self.marks = [-1] * len(program)
+        self.stamp = 0
+        self.n_patterns = sum(1 for inst in program if inst[0] == MATCH)
+        self.counted = vm.initial_counters(program) is not None
+        self.has_eol = any(inst[0] == EOL for inst in program)
+        # The start of a match is only known to the NFA if the program sets
+        # it with a mark
+        self.marked = any(inst[0] == MARK for inst in program)
+
+        # Bookkeeping for the thrashing check, reset by every search
+        self.search_resets = 0
+        self.search_states = 0
+
+        self.stats = {
+            'states': 0,
+            'misses': 0,
+            'evictions': 0,
+            'resets': 0,
+            'fallbacks': 0,
+        }
+
+    # ==========
+    # = States =
+    # ==========
+
+    def _state(self, pcs, seeding, cut, keep=None):
+        """Look up or build the state for a priority-ordered list of threads"""
+        if cut:
+            # Same as the Pike VM: once a thread matches, the threads after it
+            # can never win
+            for n, pc in enumerate(pcs):
+                if self.program[pc][0] == MATCH:
+                    pcs = pcs[:n + 1]
+                    break
+        key = (tuple(pcs), seeding, cut)
+        self.clock += 1
+        state = self.cache.get(key)
+        if state is not None:
+            state.used = self.clock
+            return state
+
+        size = STATE_BYTES + THREAD_BYTES * len(pcs)
+        if self.cache_bytes + size > self.max_bytes:
+            self._evict(keep)
+        match_ids = frozenset(self.program[pc][1] for pc in pcs
+                              if self.program[pc][0] == MATCH)
+        state = DFAState(key, key[0], seeding, match_ids)
+        state.used = self.clock
+        self.cache[key] = state
+        self.cache_bytes += size
+        self.stats['states'] += 1
+        self.search_states += 1
+        return state
+
+    def _closure(self, pc, pcs, offset=None, at_end=None):
+        self.stamp += 1
+        threads = []
+        for p in pcs:
+            vm.add_thread(self.program, threads, self.marks, self.stamp, p,
+                          None, None, offset, at_end)
+        if pc is not None:
+            vm.add_thread(self.program, threads, self.marks, self.stamp, pc,
+                          None, None, offset, at_end)
+        return [t[0] for t in threads]
+
+    def _start(self, pos, anchored, cut):
+        return self._state(self._closure(0, (), offset=pos), not anchored, cut)
+
+    def _end_match_ids(self, state, offset):
+        """Pattern ids that ``state`` matches if the input ends here"""
+        if state.end_ids is not None and offset:
+            return state.end_ids
+        program = self.program
+        ids = frozenset(program[pc][1] for pc in
+                        self._closure(None, state.insts, offset, at_end=True)
+                        if program[pc][0] == MATCH)
+        # At offset 0, ^ holds as well, so don't remember that
+        if offset:
+            state.end_ids = ids
+        return ids
+
+    def _transition(self, state, c):
+        """Compute, memoize and return the successor of ``state`` on ``c``"""
+        self.stats['misses'] += 1
+        stepped = []
+        for pc in state.insts:
+            nxt = vm.step(self.program, pc, c)
+            if nxt is not None:
+                stepped.append(nxt)
+        cut = state.key[2]
+        # Leftmost-first matching stops looking for new starts after a match,
+        # but a set search keeps going for the other patterns
+        seeding = state.seeding and not (cut and state.is_match)
+        pcs = self._closure(0 if seeding else None, stepped)
+        nxt = self._state(pcs, seeding, cut, keep=state)
+        if self.cache_bytes + TRANSITION_BYTES > self.max_bytes:
+            # Transitions count towards the budget too. The scan goes on
+            # from nxt, so that is the state to keep.
+            self._evict(nxt)
+        if (self.cache.get(state.key) is state and
+                self.cache_bytes + TRANSITION_BYTES <= self.max_bytes):
+            state.next[c] = nxt
+            self.cache_bytes += TRANSITION_BYTES
+        return nxt
+
+    def _evict(self, keep):
+        self.stats['resets'] += 1
+        self.search_resets += 1
+        if self.eviction == 'lru':
+            by_age = sorted(self.cache.itervalues(), key=lambda st: st.used)
+            victims = by_age[:len(by_age) // 2 or 1]
+        else:
+            victims = self.cache.values()
+        for state in victims:
+            if state is not keep:
+                del self.cache[state.key]
+                state.next = {}
+                self.stats['evictions'] += 1
+
+        # Forget transitions into states that are gone, and recount
+        self.cache_bytes = 0
+        for state in self.cache.itervalues():
+            state.next = dict((c, nxt) for c, nxt in state.next.iteritems()
+                              if self.cache.get(nxt.key) is nxt)
+            self.cache_bytes += (STATE_BYTES + THREAD_BYTES * len(state.insts)
+                                 + TRANSITION_BYTES * len(state.next))
+        if (keep is not None and self.cache_bytes > self.max_bytes // 2 and
+                self.cache.get(keep.key) is keep):
+            # Most of the budget is the transitions of the state being kept
+            self.cache_bytes -= TRANSITION_BYTES * len(keep.next)
+            keep.next = {}
+
+    # ==========
+    # = Tables =
+    # ==========
+
+    def table(self, anchored=True, cut=True, max_states=DEFAULT_MAX_STATES,
+              codepoints=False, minimize=True):
+        """
+        Build every state reachable from the start of a byte string, and its
+        transition on every class of bytes.
+
+        :param anchored: If False, the table searches for a match anywhere
+        :param cut: If True, threads after a match are dropped, as in
+                    :py:meth:`search`. Use False for a program from
+                    :py:func:`rajax.cmd.compile_set`, to see every pattern.
+        :param max_states: Raise :py:class:`TooManyStates` beyond this
+        :param codepoints: If True, cover every code point instead of bytes
+        :param minimize: If True, merge the states that can't be told apart,
+                         see :py:meth:`DFATable.minimize`
+        :rtype: :py:class:`DFATable`
+        """
+        if self.counted:
+            raise ValueError("A program with counted loops can't be built"
+                             " into a table")
+        alphabet = Alphabet(self.program, INF + 1 if codepoints else 256)
+        start = self._start(0, anchored, cut)
+        states = [start]
+        index = {start.key: 0}
+        rows = []
+        for state in states:
+            row = []
+            # Any code of a class stands for all of them
+            for c in alphabet.starts:
+                nxt = state if state.dead else self._transition(state, c)
+                i = index.get(nxt.key)
+                if i is None:
+                    if len(states) >= max_states:
+                        raise TooManyStates(max_states)
+                    i = index[nxt.key] = len(states)
+                    states.append(nxt)
+                row.append(i)
+            rows.append(row)
+        if self.has_eol:
+            end_ids = [self._end_match_ids(state, 1) for state in states]
+            start_end_ids = self._end_match_ids(start, 0)
+        else:
+            end_ids = [frozenset()] * len(states)
+            start_end_ids = frozenset()
+        table = DFATable(rows, [state.match_ids for state in states],
+                         [state.dead for state in states], end_ids,
+                         start_end_ids, alphabet)
+        return table.minimize() if minimize else table
+
+    # ============
+    # = Scanning =
+    # ============
+
+    def _scan(self, s, pos, endpos, anchored, cut):
+        """
+        Run the DFA over ``s[pos:endpos]``.
+
+        :return: ``(last state, end offset of the last match or None)``
+        """
+        self.search_resets = 0
+        self.search_states = 0
+        state = self._start(pos, anchored, cut)
+        last = pos if state.is_match else None
+        i = pos
+        while i < endpos and not state.dead:
+            c = s[i]
+            nxt = state.next.get(c)
+            if nxt is None:
+                nxt = self._transition(state, c)
+                if (self.search_resets >= MIN_RESETS and
+                        (i - pos) < self.min_chars_per_state * self.search_states):
+                    raise CacheThrashing()
+            state = nxt
+            i += 1
+            if state.is_match:
+                last = i
+        if i == endpos and self.has_eol and self._end_match_ids(state, i):
+            last = i
+        return state, last
+
+    def _run(self, s, pos, endpos, anchored, full):
+        s = vm.codes(s)
+        if endpos is None or endpos > len(s):
+            endpos = len(s)
+        if self.counted:
+            return vm.run(self.program, s, pos, endpos, anchored, full)
+        try:
+            state, last = self._scan(s, pos, endpos, anchored, cut=not full)
+        except CacheThrashing:
+            self.stats['fallbacks'] += 1
+            return vm.run(self.program, s, pos, endpos, anchored, full)
+        if full:
+            # A dead state never matches, so this also covers stopping early
+            if last != endpos:
+                return None
+            if not self.marked:
+                return (pos, endpos)
+            return vm.run(self.program, s, pos, endpos, anchored, full)
+        if last is None:
+            return None
+        if anchored and not self.marked:
+            return (pos, last)
+        # The DFA knows where the leftmost-first match ends but not where it
+        # starts. The NFA finds the same match when stopped at its end.
+        return vm.run(self.program, s, pos, endpos, anchored, stop=last)
+
+    def _scan_set(self, s, pos, endpos, anchored, full, earliest):
+        self.search_resets = 0
+        self.search_states = 0
+        state = self._start(pos, anchored, cut=False)
+        found = set()
+        if not full or pos == endpos:
+            found |= state.match_ids
+        i = pos
+        while i < endpos and not state.dead:
+            if (earliest and found) or len(found) == self.n_patterns:
+                return found
+            c = s[i]
+            nxt = state.next.get(c)
+            if nxt is None:
+                nxt = self._transition(state, c)
+                if (self.search_resets >= MIN_RESETS and
+                        (i - pos) < self.min_chars_per_state * self.search_states):
+                    raise CacheThrashing()
+            state = nxt
+            i += 1
+            if state.match_ids and (not full or i == endpos):
+                found |= state.match_ids
+        if i == endpos and self.has_eol:
+            found |= self._end_match_ids(state, i)
+        return found
+
+    def match_set(self, s, pos=0, endpos=None, anchored=True, full=False,
+                  earliest=False):
+        """See :py:func:`rajax.vm.match_set`"""
+        s = vm.codes(s)
+        if endpos is None or endpos > len(s):
+            endpos = len(s)
+        if self.counted:
+            return vm.match_set(self.program, s, pos, endpos, anchored, full,
+                                earliest)
+        try:
+            found = self._scan_set(s, pos, endpos, anchored, full, earliest)
+        except CacheThrashing:
+            self.stats['fallbacks'] += 1
+            return vm.match_set(self.program, s, pos, endpos, anchored, full,
+                                earliest)
+        return sorted(found)
+
+    def match(self, s, pos=0, endpos=None):
+        """See :py:func:`rajax.vm.match`"""
+        return self._run(s, pos, endpos, anchored=True, full=False)
+
+    def fullmatch(self, s, pos=0, endpos=None):
+        """See :py:func:`rajax.vm.fullmatch`"""
+        return self._run(s, pos, endpos, anchored=True, full=True)
+
+    def search(self, s, pos=0, endpos=None):
+        """See :py:func:`rajax.vm.search`"""
+        return self._run(s, pos, endpos, anchored=False, full=False)
+
+
+class DFATable(object):
+    """
+    A complete DFA, built by :py:meth:`LazyDFA.table`. States are numbered
+    from 0, the start state, and input codes are looked up by their class in
+    :py:attr:`alphabet`.
+
+    .. py:attribute: next
+
+        ``next[state][cls]`` is the state after a code of class ``cls``
+
+    .. py:attribute: classes
+
+        The class of each byte, as a list of 256
+
+    .. py:attribute: match_ids
+
+        For each state, the ids of the patterns matched on reaching it
+
+    .. py:attribute: dead
+
+        For each state, True if no match can follow. A dead state goes to
+        itself on every code.
+
+    .. py:attribute: end_ids
+
+        For each state, the ids matched if the input ends there, through
+        ``$``, at any offset but 0
+
+    .. py:attribute: start_end_ids
+
+        The ids matched by empty input
+    """
+
+    def __init__(self, next, match_ids, dead, end_ids, start_end_ids,
+                 alphabet):
+        self.next = next
+        self.match_ids = match_ids
+        self.dead = dead
+        self.end_ids = end_ids
+        self.start_end_ids = start_end_ids
+        self.alphabet = alphabet
+        self.classes = alphabet.byte_classes
+
+    def __len__(self):
+        return len(self.next)
+
+    def stats(self):
+        """
+        :return: Dict of the size of the table: ``states``, ``classes``,
+                 ``transitions`` (one per state and class) and
+                 ``dense_transitions``, the number it would take with a
+                 column for every code
+        """
+        return {
+            'states': len(self.next),
+            'classes': len(self.alphabet),
+            'transitions': len(self.next) * len(self.alphabet),
+            'dense_transitions': len(self.next) * self.alphabet.size,
+        }
+
+    def minimize(self):
+        """
+        Merge the states that match the same ids on every input, with
+        Hopcroft's algorithm.
+
+        :return: A new :py:class:`DFATable` with the fewest states
+        """
+        n = len(self.next)
+        n_classes = len(self.alphabet)
+        # preds[cls][state]: the states that go to state on cls
+        preds = [[[] for _ in xrange(n)] for _ in xrange(n_classes)]
+        for q, row in enumerate(self.next):
+            for cls, r in enumerate(row):
+                preds[cls][r].append(q)
+
+        # Start from the states that match the same ids now and at the end
+        groups = {}
+        for q in xrange(n):
+            key = (self.match_ids[q], self.end_ids[q])
+            groups.setdefault(key, []).append(q)
+        blocks = [set(group) for group in groups.itervalues()]
+        block_of = [0] * n
+        for i, block in enumerate(blocks):
+            for q in block:
+                block_of[q] = i
+
+        work = set(xrange(len(blocks)))
+        while work:
+            splitter = list(blocks[work.pop()])
+            for cls in xrange(n_classes):
+                inside = {}
+                for r in splitter:
+                    for q in preds[cls][r]:
+                        inside.setdefault(block_of[q], []).append(q)
+                for i, qs in inside.iteritems():
+                    block = blocks[i]
+                    if len(qs) == len(block):
+                        continue
+                    qs = set(qs)
+                    rest = block - qs
+                    if len(qs) > len(rest):
+                        qs, rest = rest, qs
+                    # The smaller half gets the new number and goes on the
+                    # work list; if the block was on it, both halves are now
+                    blocks[i] = rest
+                    j = len(blocks)
+                    blocks.append(qs)
+                    for q in qs:
+                        block_of[q] = j
+                    work.add(j)
+
+        # Number the blocks in the order they are reached from the start
+        number = {block_of[0]: 0}
+        order = [block_of[0]]
+        for i in order:
+            for r in self.next[min(blocks[i])]:
+                if block_of[r] not in number:
+                    number[block_of[r]] = len(order)
+                    order.append(block_of[r])
+        rows = []
+        reps = []
+        for i in order:
+            q = min(blocks[i])
+            reps.append(q)
+            rows.append([number[block_of[r]] for r in self.next[q]])
+        # A live state that can't be told apart from a dead one is just as
+        # hopeless
+        dead = [any(self.dead[q] for q in blocks[i]) for i in order]
+        return DFATable(rows, [self.match_ids[q] for q in reps], dead,
+                        [self.end_ids[q] for q in reps], self.start_end_ids,
+                        self.alphabet)
+
+    def finish(self, state, last, ids, endpos):
+        """
+        Account for the end of the input at ``endpos`` in state ``state``.
+
+        :return: ``(state, last, ids)`` as returned by :py:meth:`scan`
+        """
+        end_ids = self.start_end_ids if endpos == 0 else self.end_ids[state]
+        if end_ids:
+            last = endpos
+            ids = ids | end_ids
+        return state, last, ids
+
+    def scan(self, s):
+        """
+        Run over all of ``s``.
+
+        :return: ``(state, last, ids)``: the final state, the end of the last
+                 match or None, and the ids of every pattern matched on the
+                 way. With ``cut``, ``last`` is the end of the leftmost-first
+                 match, as in :py:meth:`LazyDFA.search`.
+        """
+        next, match_ids, dead = self.next, self.match_ids, self.dead
+        classes, classify = self.classes, self.alphabet.classify
+        state = 0
+        ids = match_ids[0]
+        last = 0 if ids else None
+        i = 0
+        for c in vm.codes(s):
+            if dead[state]:
+                break
+            state = next[state][classes[c] if c < 256 else classify(c)]
+            i += 1
+            if match_ids[state]:
+                last = i
+                ids = ids | match_ids[state]
+        return self.finish(state, last, ids, len(s))
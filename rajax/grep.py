@@ -0,0 +1,336 @@
+"""
+Search files for lines that contain a match, like ``grep``.
+
+    rajax grep [-c] [-l] [-n] [-v] [-j JOBS] [--utf8] pattern [file ...]
+
+The pattern is compiled once, unanchored, and run by a
+:py:class:`rajax.dfa.LazyDFA` whose state cache is kept from one line to the
+next. Files are memory-mapped and read in chunks of about
+:py:data:`DEFAULT_CHUNK_SIZE` bytes that end at a line boundary; standard input
+is read in chunks the same way. Lines are never iterated over in Python unless
+they have to be tested: if every match must contain some literal text (see
+:py:func:`rajax.prefilter.required_factors`), ``str.find`` skips straight to
+the lines that contain it.
+
+Each line is matched on its own, without its newline, so ``^`` and ``$`` match
+at the start and end of every line.
+
+With ``-j``, files are split between processes by :py:mod:`rajax.parallel`.
+"""
+from __future__ import absolute_import
+
+import mmap
+import optparse
+import os
+import sys
+
+from rajax import cmd, dfa, parallel, parser, prefilter
+from rajax.ast import LiteralNode, NonDupReNode
+
+#: Bytes read at a time, rounded up to the end of a line
+DEFAULT_CHUNK_SIZE = 4 << 20
+#: Name printed for standard input, as GNU grep does
+STDIN_NAME = '(standard input)'
+
+
+class Grep(object):
+    """
+    Selects the lines of a text that contain a match of a pattern.
+
+    :param pattern: A regular expression
+    :param invert: If True, select the lines that don't contain a match
+    :param utf8: Compile the pattern for UTF-8 input, see
+                 :py:func:`rajax.cmd.parse`
+    :param chunk_size: See :py:data:`DEFAULT_CHUNK_SIZE`
+
+    .. py:attribute: words
+
+        Literal strings of which every match contains at least one, or None
+        if there aren't any and every line has to be run. Empty if no line
+        can match, because every match contains a newline.
+
+    .. py:attribute: literal
+
+        True if the pattern is just literal text, so that finding
+        :py:attr:`words` is enough and the DFA never runs
+    """
+
+    def __init__(self, pattern, invert=False, utf8=False,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self.invert = invert
+        self.chunk_size = chunk_size
+        root = cmd.tree(pattern, utf8=utf8)
+        self.program = cmd.parse(pattern, anchored=False, utf8=utf8, root=root)
+        self.matcher = dfa.LazyDFA(self.program)
+
+        # Lines are matched without their newline, so a word with one in it
+        # is never found in a line
+        requirements = [frozenset(w for w in req if '\n' not in w)
+                        for req in prefilter.required_factors(root)]
+        self.words = None
+        if frozenset() in requirements:
+            self.words = []
+        else:
+            best = prefilter.best_requirement(requirements)
+            if best is not None and all(best):
+                self.words = [
+                    w.encode('utf-8') if isinstance(w, unicode) else w
+                    for w in best]
+        # A line with the text of a plain literal pattern in it matches
+        self.literal = self.words is not None and (
+            isinstance(root, LiteralNode) or
+            (isinstance(root, NonDupReNode) and root.subtype == 'char'))
+
+    def line_matches(self, line):
+        """True if ``line`` (without its newline) contains a match"""
+        return bool(self.matcher.match_set(line, earliest=True))
+
+    def chunks(self, buf):
+        """
+        Split ``buf`` at line boundaries.
+
+        :param buf: A ``str`` or ``mmap``
+        :return: Iterator of ``str`` chunks of at least ``chunk_size`` bytes,
+                 except the last, each ending with a newline except the last
+        """
+        n = len(buf)
+        offset = 0
+        while offset < n:
+            end = buf.find('\n', min(offset + self.chunk_size, n) - 1)
+            end = n if end == -1 else end + 1
+            yield buf[offset:end]
+            offset = end
+
+    def stream_chunks(self, f):
+        """Like :py:meth:`chunks`, for a file that can't be mapped"""
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                return
+            if not chunk.endswith('\n'):
+                chunk += f.readline()
+            yield chunk
+
+    def _candidates(self, chunk):
+        """``(start, end)`` of the lines of ``chunk`` that may match"""
+        if self.words is None:
+            for line in _lines(chunk, 0, len(chunk)):
+                yield line
+            return
+        # Next occurrence of each word at or after pos
+        hits = [chunk.find(w) for w in self.words]
+        pos = 0
+        while True:
+            for i, w in enumerate(self.words):
+                if 0 <= hits[i] < pos:
+                    hits[i] = chunk.find(w, pos)
+            found = [h for h in hits if h >= 0]
+            if not found:
+                return
+            hit = min(found)
+            start = chunk.rfind('\n', 0, hit) + 1
+            end = chunk.find('\n', hit)
+            if end == -1:
+                end = len(chunk)
+            yield start, end
+            pos = end + 1
+
+    def _matches(self, chunk):
+        """``(start, end)`` of the lines of ``chunk`` that contain a match"""
+        for start, end in self._candidates(chunk):
+            if self.literal or self.line_matches(chunk[start:end]):
+                yield start, end
+
+    def select(self, chunk):
+        """
+        Lines of a chunk that are selected, in order.
+
+        :param chunk: Whole lines, as returned by :py:meth:`chunks`
+        :return: Iterator of ``(start, end)`` offsets of each line in
+                 ``chunk``, not counting its newline
+        """
+        if not self.invert:
+            return self._matches(chunk)
+        return self._non_matches(chunk)
+
+    def _non_matches(self, chunk):
+        pos = 0
+        for start, end in self._matches(chunk):
+            for line in _lines(chunk, pos, start):
+                yield line
+            pos = end + 1
+        for line in _lines(chunk, pos, len(chunk)):
+            yield line
+
+    def count_chunk(self, chunk):
+        """
+        :return: Number of selected lines in ``chunk``. Lines that don't match
+                 are counted with ``str.count`` rather than one at a time.
+        """
+        matches = 0
+        for _ in self._matches(chunk):
+            matches += 1
+        if not self.invert:
+            return matches
+        lines = chunk.count('\n') + (0 if chunk.endswith('\n') else 1)
+        return lines - matches
+
+    def count(self, buf):
+        """:return: Number of selected lines in ``buf``"""
+        return sum(self.count_chunk(chunk) for chunk in self.chunks(buf))
+
+
+def _lines(chunk, start, end):
+    """``(start, end)`` of each line of ``chunk[start:end]``"""
+    if start >= end:
+        return
+    for line in chunk[start:end].split('\n'):
+        yield start, start + len(line)
+        start += len(line) + 1
+        if start >= end:
+            return
+
+
+def _display_name(path):
+    return STDIN_NAME if path == '-' else path
+
+
+def _open_chunks(grep, path):
+    """Chunks of the file at ``path``, or of standard input for ``-``"""
+    if path == '-':
+        for chunk in grep.stream_chunks(sys.stdin):
+            yield chunk
+        return
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for chunk in grep.chunks(buf):
+                yield chunk
+        finally:
+            buf.close()
+
+
+def grep_file(grep, path, name, opts, out, scan=None):
+    """
+    Print the selected lines of one file as ``opts`` asks.
+
+    :param scan: A :py:class:`rajax.parallel.ParallelScan` to use for regular
+                 files, if any
+    :return: True if any line was selected
+    """
+    prefix = '%s:' % name if name else ''
+    if scan is not None and path != '-':
+        return _grep_file_parallel(scan, path, name or path, prefix, opts,
+                                   out)
+    total = 0
+    lineno = 1
+    for chunk in _open_chunks(grep, path):
+        if opts.count and not opts.files_with_matches:
+            total += grep.count_chunk(chunk)
+            continue
+        pos = 0
+        for start, end in grep.select(chunk):
+            total += 1
+            if opts.files_with_matches:
+                out.write(name or _display_name(path))
+                out.write('\n')
+                return True
+            if opts.line_number:
+                lineno += chunk.count('\n', pos, start)
+                pos = start
+                out.write('%s%d:%s\n' % (prefix, lineno, chunk[start:end]))
+            else:
+                out.write('%s%s\n' % (prefix, chunk[start:end]))
+        if opts.line_number:
+            lineno += chunk.count('\n', pos)
+    if opts.count:
+        out.write('%s%d\n' % (prefix, total))
+    return total > 0
+
+
+def _grep_file_parallel(scan, path, name, prefix, opts, out):
+    if opts.count and not opts.files_with_matches:
+        total = scan.count(path)
+        out.write('%s%d\n' % (prefix, total))
+        return total > 0
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        selected = False
+        for lineno, start, end in scan.lines(path):
+            selected = True
+            if opts.files_with_matches:
+                out.write(name)
+                out.write('\n')
+                break
+            if opts.line_number:
+                out.write('%s%d:%s\n' % (prefix, lineno, buf[start:end]))
+            else:
+                out.write('%s%s\n' % (prefix, buf[start:end]))
+        return selected
+    finally:
+        buf.close()
+
+
+def main(args=None):
+    p = optparse.OptionParser(
+        description='Print lines of files that contain a match',
+        usage='%prog grep [opts] pattern [file ...]')
+    p.add_option('-c', '--count', action='store_true',
+                 help='Print only the number of selected lines of each file')
+    p.add_option('-l', '--files-with-matches', action='store_true',
+                 help='Print only the names of files with selected lines')
+    p.add_option('-n', '--line-number', action='store_true',
+                 help='Print the line number before each line')
+    p.add_option('-v', '--invert-match', action='store_true',
+                 help='Select the lines that do not match')
+    p.add_option('-j', '--jobs', type='int', default=1,
+                 help=('Scan files with this many processes, or 0 for one'
+                       ' per CPU'))
+    p.add_option('--chunk-size', type='int',
+                 help=('Bytes to read at a time, or to give each process'
+                       ' with --jobs'))
+    p.add_option('--utf8', action='store_true',
+                 help='Match UTF-8 characters instead of single bytes')
+
+    opts, args = p.parse_args(args)
+    if not args:
+        p.error('You must specify a regular expression.')
+    pattern, paths = args[0], args[1:] or ['-']
+
+    parser.debug = False
+    try:
+        grep = Grep(pattern, invert=opts.invert_match, utf8=opts.utf8,
+                    chunk_size=opts.chunk_size or DEFAULT_CHUNK_SIZE)
+    except (TypeError, ValueError) as e:
+        sys.stderr.write('rajax grep: %s\n' % e)
+        return 2
+
+    scan = None
+    if opts.jobs != 1:
+        scan = parallel.ParallelScan(
+            grep, jobs=opts.jobs or None,
+            chunk_size=opts.chunk_size or parallel.DEFAULT_CHUNK_SIZE)
+    selected = False
+    error = False
+    try:
+        for path in paths:
+            name = _display_name(path) if len(paths) > 1 else None
+            try:
+                selected |= grep_file(grep, path, name, opts, sys.stdout,
+                                      scan)
+            except (IOError, OSError) as e:
+                sys.stderr.write('rajax grep: %s: %s\n' % (_display_name(path),
+                                                           e.strerror))
+                error = True
+    finally:
+        if scan is not None:
+            scan.close()
+    if error:
+        return 2
+    return 0 if selected else 1
@@ -3,8 +3,11 @@ Classes and functions for working with VM instructions
 """
 from __future__ import absolute_import
 
+import struct
+
 from rajax.const import (
     INF,
+    UNBOUNDED,
     WILDCARD,
     cmd_to_opcode,
     opcode_to_cmd,
@@ -57,13 +60,13 @@ def _range_matches_class(a1, a2, char_class):
 def _remove_from_range(r, b1, b2):
     if b2 < r[0] or b1 > r[1]:
         return [r]
-    if b2 == r[0] and r[1] - r[0] > 0:
-        return [(r[0] + 1, r[1])]
-    if b1 == r[1] and r[1] - r[0] > 0:
-        return [(r[0], r[1] - 1)]
-    if b1 > r[0] and b2 < r[1]:
-        return [(r[0], b1 - 1), (b2 + 1, r[1])]
-    return []
+    # Whatever is left on either side of (b1, b2)
+    remaining = []
+    if b1 > r[0]:
+        remaining.append((r[0], b1 - 1))
+    if b2 < r[1]:
+        remaining.append((b2 + 1, r[1]))
+    return remaining
 
 def transform_classes(classes, excludes):
     """
@@ -90,6 +93,46 @@ def transform_classes(classes, excludes):
         next_set = set()
     return [[Instruction('char', r[0], r[1])] for r in working_set]
 
+def _instr_range(instr):
+    """``(lo, hi)`` accepted by a ``char`` Instruction"""
+    lo = ord(instr.arg1) if isinstance(instr.arg1, str) else instr.arg1
+    hi = ord(instr.arg2) if isinstance(instr.arg2, str) else instr.arg2
+    return lo, hi or lo
+
+def normalize_ranges(ranges):
+    """
+    Sort a list of ``(lo, hi)`` character ranges and merge the ones that
+    overlap or touch
+
+    :rtype: ``[(lo, hi),]``
+    """
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def make_charset(char_instrs):
+    """
+    Combine alternative ``char`` Instructions into a single test. If the
+    characters form one range, the result is a single ``char``. Otherwise it is
+    a ``charset`` followed by its table of ``range`` records.
+
+    :param char_instrs: ``char`` Instructions, none of them a wildcard
+    :return: A list of Instructions
+    """
+    ranges = normalize_ranges([_instr_range(i) for i in char_instrs])
+    if len(ranges) == 1:
+        lo, hi = ranges[0]
+        if lo == hi:
+            return [Instruction('char', lo)]
+        return [Instruction('char', lo, hi)]
+    return ([Instruction('charset', len(ranges))] +
+            [Instruction('range', lo, hi) for lo, hi in ranges])
+
 def make_opcode(cmd, arg1, arg2=None):
     """
     Convert an Instruction to an opcode tuple.
@@ -111,6 +154,100 @@ def serialize(instr_list):
     """
     return [make_opcode(i.cmd, i.arg1, i.arg2) for i in instr_list]
 
+#: First four bytes of a packed program
+PACKED_MAGIC = 'RJAX'
+#: Bumped whenever the packed layout changes
+PACKED_VERSION = 1
+
+# magic, version, reserved, instruction count
+_packed_header = struct.Struct('<4sHHI')
+# opcode, arg1, arg2
+_packed_record = struct.Struct('<III')
+
+
+class PackedProgram(object):
+    """
+    A read-only list of opcode tuples backed by the packed format written by
+    :py:func:`to_bytes`. Instructions are decoded from the buffer when they
+    are accessed, so wrapping a buffer costs nothing. Call :py:meth:`unpack`
+    to decode the whole program at once if it will be run many times.
+    """
+
+    def __init__(self, buf, count):
+        self.buf = buf
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('instruction index out of range')
+        return _packed_record.unpack_from(
+            self.buf, _packed_header.size + i * _packed_record.size)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def unpack(self):
+        """
+        :return: The program as a list of opcode tuples
+        """
+        ints = struct.unpack_from('<%dI' % (3 * self.count), self.buf,
+                                  _packed_header.size)
+        return zip(ints[0::3], ints[1::3], ints[2::3])
+
+
+def to_bytes(opcode_list):
+    """
+    Pack a list of opcode tuples into a versioned header followed by one
+    fixed-width record of three little-endian 32-bit integers per instruction
+
+    :rtype: ``str``
+    """
+    ints = [x for inst in opcode_list for x in inst]
+    header = _packed_header.pack(PACKED_MAGIC, PACKED_VERSION, 0,
+                                 len(opcode_list))
+    # An explicit '<' format has standard sizes and byte order on any host
+    return header + struct.pack('<%dI' % len(ints), *ints)
+
+
+def from_buffer(buf):
+    """
+    Wrap a packed program without copying it.
+
+    :param buf: ``str``, ``bytearray``, ``buffer``, ``memoryview`` or ``mmap``
+                holding the output of :py:func:`to_bytes`
+    :rtype: :py:class:`PackedProgram`
+    """
+    if len(buf) < _packed_header.size:
+        raise ValueError('Packed program is truncated')
+    magic, version, _, count = _packed_header.unpack_from(buf, 0)
+    if magic != PACKED_MAGIC:
+        raise ValueError('Not a packed program')
+    if version != PACKED_VERSION:
+        raise ValueError('Unsupported packed program version %d' % version)
+    if len(buf) < _packed_header.size + count * _packed_record.size:
+        raise ValueError('Packed program is truncated')
+    return PackedProgram(buf, count)
+
+def _pretty_char(arg, specials):
+    """Printable form of a character argument: itself if it is visible ASCII,
+    or its code in hex (bytes of a UTF-8 program are rarely printable)"""
+    if not isinstance(arg, int):
+        return arg
+    if arg in specials:
+        return specials[arg]
+    if 0x20 < arg < 0x7F:
+        return chr(arg)
+    return '0x%02X' % arg
+
+
 def prettyprint_program(opcode_list):
     """
     Print a formatted list of the entire program in human-readable form
@@ -121,25 +258,19 @@ def prettyprint_program(opcode_list):
     specials = {INF: 'INF', WILDCARD: 'WILD', 0: ''}
     for o in opcode_list:
         i = Instruction(opcode_to_cmd[o[0]], o[1], o[2])
-        if i.cmd == 'char':
-            if isinstance(i.arg1, int):
-                try:
-                    i.arg1 = specials[i.arg1]
-                except KeyError:
-                    i.arg1 = chr(i.arg1)
-            if isinstance(i.arg2, int):
-                try:
-                    i.arg2 = specials[i.arg2]
-                except KeyError:
-                    i.arg2 = chr(i.arg2)
+        if i.cmd in ('char', 'range'):
+            i.arg1 = _pretty_char(i.arg1, specials)
+            i.arg2 = _pretty_char(i.arg2, specials)
+        elif i.cmd == 'bounds' and i.arg2 == UNBOUNDED:
+            i.arg2 = 'INF'
         instr_list.append(i)
     j = 0
     s1 = len(str(len(instr_list))) #yeah, I know, cheap
     for i in instr_list:
-        if i.arg2:
+        if i.arg2 or i.cmd in ('range', 'repeat', 'bounds'):
             print "%s: %s %3s %3s" % (str(j).rjust(s1), i.cmd.ljust(5), 
                                     str(i.arg1), str(i.arg2))
-        elif i.arg1 or i.cmd == 'jmp':
+        elif i.arg1 or i.cmd in ('jmp', 'charset'):
             print "%s: %s %3s" % (str(j).rjust(s1), i.cmd.ljust(5), 
                                  str(i.arg1))
         else:
@@ -5,10 +5,14 @@ A bare-bones lexer. Most of the heavy lifting is done by the parser due to limit
 # Steve Johnson, January 2009
 # steve.johnson.public@gmail.com
 
-# ()|+*?[^]
+# ()|+*?[^]$
+
+import threading
 
 import ply.lex as lex
 
+from const import MAX_REPEAT
+
 
 states = (
   ('brackexpr','exclusive'),   # bracket expression
@@ -18,7 +22,7 @@ states = (
 # ===========
 # = INITIAL =
 # ===========
-weirdchars = r"\\\*\+\?\(\)\|\[\]\^"
+weirdchars = r"\\\*\+\?\(\)\|\[\]\^\$"
 
 tokens = (
     "ORD_CHAR",
@@ -26,10 +30,12 @@ tokens = (
     "LBRACK", "RBRACK",
     "BACKSLASH",
     "CARAT",
+    "DOLLAR",
     "DASH",
     "STAR",
     "PLUS",
     "QMARK",
+    "REPEAT",
     "DOT",
     "PIPE",
     "ES_NORMAL",
@@ -58,14 +64,25 @@ def t_BACKSLASH(t):
     t.lexer.plunk = 'b'
     future_token = scout.token()
     del scout   # because I'm paranoid
+    if future_token is None:
+        # Nothing left to escape
+        raise TypeError("Bad escape sequence: ''")
     if future_token.value == '-':
         t.type = "ORD_CHAR"
         return t
 
+def t_REPEAT(t):
+    r"\{[0-9]+(?:,[0-9]*)?\}"
+    # Checked here so that a bad count is reported like any other bad text.
+    # A '{' which doesn't start a count is an ordinary character.
+    repeat_bounds(t.value)
+    return t
+
 t_ORD_CHAR = r"[^%s]" % weirdchars
 t_LPAREN = r"\("
 t_RPAREN = r"\)"
 t_CARAT = r"\^"
+t_DOLLAR = r"\$"
 t_STAR = r"\*"
 t_PLUS = r"\+"
 t_QMARK = r"\?"
@@ -105,6 +122,9 @@ def t_brackexpr_DASH(t):
 
 def t_brackexpr_BACKSLASH(t):
     r"\\"
+    if t.lexer.lexpos >= t.lexer.lexlen:
+        # Nothing left to escape
+        raise TypeError("Bad escape sequence: ''")
     t.lexer.push_state('escseq')
     t.lexer.in_brack_expr = True
 
@@ -113,7 +133,7 @@ def t_brackexpr_BACKSLASH(t):
 # ==========
 
 def t_escseq_ES_NORMAL(t):
-    r"[\\\*\+\?\(\)\|\[\]\^-]"
+    r"[\\\*\+\?\(\)\|\[\]\^\$\{\}-]"
     if not t.lexer.in_brack_expr and t.value == '-':
         t.type = "ORD_CHAR"
     t.lexer.first = False
@@ -143,9 +163,65 @@ def t_brackexpr_error(t):
 def t_escseq_error(t):
     raise TypeError("Bad escape sequence: '%s'" % (t.value[0],))
 
-lexer = lex.lex()
+def repeat_bounds(s):
+    """
+    Parse the text of a ``REPEAT`` token.
+
+    :param s: ``{m}``, ``{m,}`` or ``{m,n}``
+    :return: ``(m, n)``, where ``n`` is None if there is no upper bound
+    """
+    counts = s[1:-1].split(',')
+    lo = int(counts[0])
+    if len(counts) == 1:
+        hi = lo
+    elif counts[1]:
+        hi = int(counts[1])
+    else:
+        hi = None
+    if max(lo, hi) > MAX_REPEAT:
+        raise TypeError("Repetition count too large: '%s'" % (s,))
+    if hi is not None and hi < lo:
+        raise TypeError("Bad repetition: '%s'" % (s,))
+    return lo, hi
+
+# Built by get_lexer() the first time a string is lexed, not at import
+_lexer = None
+_lexer_lock = threading.Lock()
+
+def get_lexer():
+    """
+    Return the master lexer, building it on first use. Use :py:func:`new_lexer`
+    to get one that can actually be fed a string.
+    """
+    global _lexer
+    if _lexer is None:
+        with _lexer_lock:
+            if _lexer is None:
+                _lexer = lex.lex()
+    return _lexer
+
+def new_lexer():
+    """
+    Return a lexer with its own state, so that several strings can be lexed at
+    the same time. Don't call ``input()`` on the lexer returned by
+    :py:func:`get_lexer` directly from more than one thread.
+    """
+    lx = get_lexer().clone()
+    # clone() is shallow, and the state stack is pushed and popped in place
+    lx.lexstatestack = []
+    lx.begin('INITIAL')
+    return lx
+
+def tokenize(s):
+    """
+    :return: A list of all of the tokens in ``s``
+    """
+    lx = new_lexer()
+    lx.input(s)
+    return list(iter(lx.token, None))
 
 if __name__ == '__main__':
-    lex.input(r"i [at*e] \nsom\\e snow [^]today]")
-    for tok in iter(lex.token, None):
+    lx = new_lexer()
+    lx.input(r"i [at*e] \nsom\\e snow [^]today]")
+    for tok in iter(lx.token, None):
         print repr(tok.type), repr(tok.value)
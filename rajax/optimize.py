@@ -0,0 +1,176 @@
+"""
+Peephole optimizations over the list of Instructions produced by
+:py:meth:`rajax.ast.ASTNode.generate_instructions`, run before
+:py:func:`rajax.instructions.serialize`.
+
+None of these change what a program matches or which match the VM prefers;
+they only remove steps the VM would otherwise take.
+"""
+from __future__ import absolute_import
+
+from rajax.instructions import Instruction
+
+#: Level used by :py:func:`rajax.cmd.parse` unless told otherwise
+DEFAULT_LEVEL = 1
+
+
+def _targets(instr):
+    if instr.cmd == 'jmp':
+        return [instr.arg1]
+    if instr.cmd == 'split':
+        return [instr.arg1, instr.arg2]
+    return []
+
+
+def _successors(instr_list, pc):
+    """Program counters control can reach from ``pc``"""
+    instr = instr_list[pc]
+    if instr.cmd in ('jmp', 'split'):
+        return _targets(instr)
+    if instr.cmd == 'repeat':
+        return [instr.arg1, pc + 2]
+    if instr.cmd == 'charset':
+        return [pc + 1 + instr.arg1]
+    if instr.cmd == 'match':
+        return []
+    return [pc + 1]
+
+
+def _resolve(instr_list, pc):
+    """Follow a chain of ``jmp``s to the first instruction that isn't one"""
+    seen = set()
+    n = len(instr_list)
+    while pc < n and instr_list[pc].cmd == 'jmp' and pc not in seen:
+        seen.add(pc)
+        pc = instr_list[pc].arg1
+    return pc
+
+
+def thread_jumps(instr_list, stats):
+    """
+    Point every ``jmp`` and ``split`` directly at the end of any chain of
+    ``jmp``s it leads to, and turn ``split``s with two equal arms, or with an
+    arm that falls off the end of the program, into ``jmp``s.
+    """
+    n = len(instr_list)
+    new_list = []
+    for instr in instr_list:
+        if instr.cmd == 'jmp':
+            target = _resolve(instr_list, instr.arg1)
+            if target != instr.arg1:
+                stats['threaded'] += 1
+            instr = Instruction('jmp', target)
+        elif instr.cmd == 'split':
+            arg1 = _resolve(instr_list, instr.arg1)
+            arg2 = _resolve(instr_list, instr.arg2)
+            stats['threaded'] += (arg1 != instr.arg1) + (arg2 != instr.arg2)
+            if arg1 == arg2 or arg2 >= n:
+                instr = Instruction('jmp', arg1)
+                stats['folded'] += 1
+            elif arg1 >= n:
+                instr = Instruction('jmp', arg2)
+                stats['folded'] += 1
+            else:
+                instr = Instruction('split', arg1, arg2)
+        elif instr.cmd == 'repeat':
+            target = _resolve(instr_list, instr.arg1)
+            if target != instr.arg1:
+                stats['threaded'] += 1
+            instr = Instruction('repeat', target, instr.arg2)
+        new_list.append(instr)
+    return new_list
+
+
+def _reachable(instr_list):
+    n = len(instr_list)
+    keep = [False] * n
+    stack = [0]
+    while stack:
+        pc = stack.pop()
+        if pc >= n or keep[pc]:
+            continue
+        keep[pc] = True
+        if instr_list[pc].cmd == 'charset':
+            # The range table goes wherever its charset goes
+            for i in xrange(pc + 1, pc + 1 + instr_list[pc].arg1):
+                keep[i] = True
+        elif instr_list[pc].cmd == 'repeat':
+            # So does the bounds record of a repeat
+            keep[pc + 1] = True
+        stack.extend(_successors(instr_list, pc))
+    return keep
+
+
+def remove_dead_code(instr_list, stats):
+    """
+    Drop unreachable instructions and ``jmp``s to the instruction which would
+    run next anyway, then renumber jump targets.
+    """
+    n = len(instr_list)
+    keep = _reachable(instr_list)
+    stats['unreachable'] += keep.count(False)
+
+    changed = True
+    while changed:
+        changed = False
+        next_kept = n
+        for pc in xrange(n - 1, -1, -1):
+            if not keep[pc]:
+                continue
+            instr = instr_list[pc]
+            if instr.cmd == 'jmp' and instr.arg1 == next_kept:
+                keep[pc] = False
+                stats['fallthrough'] += 1
+                changed = True
+            else:
+                next_kept = pc
+
+    new_pc = []
+    count = 0
+    for pc in xrange(n):
+        new_pc.append(count)
+        if keep[pc]:
+            count += 1
+    new_pc.append(count)
+
+    def renumber(target):
+        return new_pc[min(target, n)]
+
+    new_list = []
+    for pc in xrange(n):
+        if not keep[pc]:
+            continue
+        instr = instr_list[pc]
+        if instr.cmd == 'jmp':
+            instr = Instruction('jmp', renumber(instr.arg1))
+        elif instr.cmd == 'split':
+            instr = Instruction('split', renumber(instr.arg1),
+                                renumber(instr.arg2))
+        elif instr.cmd == 'repeat':
+            instr = Instruction('repeat', renumber(instr.arg1), instr.arg2)
+        new_list.append(instr)
+    return new_list
+
+
+def optimize(instr_list, level=DEFAULT_LEVEL, stats=None):
+    """
+    Optimize a complete program, including its final ``match``.
+
+    :param instr_list: A list of :py:class:`~rajax.instructions.Instruction`
+    :param level: 0 to do nothing. 1 or more to thread jumps, fold ``split``s
+                  and remove dead code.
+    :param stats: Optional dict which is filled in with the number of
+                  instructions ``before`` and ``after`` optimizing, and counts
+                  for each kind of change
+    :return: A new list of Instructions
+    """
+    if stats is None:
+        stats = {}
+    for key in ('threaded', 'folded', 'unreachable', 'fallthrough'):
+        stats[key] = 0
+    stats['before'] = len(instr_list)
+    if level >= 1 and instr_list:
+        instr_list = thread_jumps(instr_list, stats)
+        instr_list = remove_dead_code(instr_list, stats)
+    stats['after'] = len(instr_list)
+    return instr_list
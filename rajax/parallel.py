@@ -0,0 +1,303 @@
+"""
+Scan large files with a pool of worker processes.
+
+A file is cut into chunks of about ``chunk_size`` bytes that end at a line
+boundary, and each chunk is scanned by a worker with
+:py:meth:`rajax.grep.Grep.select`. The :py:class:`~rajax.grep.Grep`, with its
+compiled program, is handed to each worker once when the pool starts; a task
+is only a file name and a byte range, and each worker maps the file itself,
+so no input goes through a pipe. Results come back in input order with
+offsets into the whole file and line numbers counted from its start.
+
+    >>> with ParallelScan(Grep('timeout'), jobs=4) as scan:
+    ...     for lineno, start, end in scan.lines('big.log'):
+    ...         pass
+
+A single huge input without lines is scanned by :py:class:`SpeculativeScan`
+instead, which runs each chunk of it from every state of a
+:py:class:`rajax.dfa.DFATable` at once. The chunk's summary maps each state it
+could start in to the state it ends in and the matches on the way, and
+chaining the summaries with :py:func:`compose` gives exactly what a scan from
+start to end would, no matter where the chunks were cut.
+
+Python 2 has no :py:mod:`concurrent.futures`, so the pool is a
+:py:class:`multiprocessing.Pool`.
+"""
+from __future__ import absolute_import
+
+import mmap
+import multiprocessing
+import os
+
+#: Bytes per task, rounded up to the end of a line
+DEFAULT_CHUNK_SIZE = 16 << 20
+
+#: Bytes per chunk of a :py:class:`SpeculativeScan`
+DEFAULT_SPECULATIVE_CHUNK_SIZE = 4 << 20
+
+# The Grep and the open maps of a worker process
+_grep = None
+_buffers = {}
+
+# The table and input of a SpeculativeScan worker
+_table = None
+_input = None
+
+
+def split_lines(buf, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Cut ``buf`` into pieces of at least ``chunk_size`` bytes, except the last,
+    each ending just after a newline, except the last.
+
+    :param buf: A ``str`` or ``mmap``
+    :return: List of ``(start, end)`` offsets
+    """
+    n = len(buf)
+    ranges = []
+    start = 0
+    while start < n:
+        end = buf.find('\n', min(start + chunk_size, n) - 1)
+        end = n if end == -1 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _map(path):
+    """A read-only map of ``path``, or an empty string for an empty file"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _init_worker(grep):
+    global _grep
+    _grep = grep
+    _buffers.clear()
+
+
+def _scan_chunk(task):
+    """
+    Scan one chunk in a worker.
+
+    :param task: ``(path, start, end, lines)``
+    :return: ``(newlines, selected, lines)``: the number of newlines in the
+             chunk, the number of selected lines, and if ``lines`` was True,
+             ``(lineno, start, end)`` of each of them with ``lineno`` counted
+             from 0 at the start of the chunk and offsets into the file
+    """
+    path, start, end, want_lines = task
+    buf = _buffers.get(path)
+    if buf is None:
+        buf = _buffers[path] = _map(path)
+    chunk = buf[start:end]
+    newlines = chunk.count('\n')
+    if not want_lines:
+        return newlines, _grep.count_chunk(chunk), None
+    lines = []
+    lineno = 0
+    pos = 0
+    for line_start, line_end in _grep.select(chunk):
+        lineno += chunk.count('\n', pos, line_start)
+        pos = line_start
+        lines.append((lineno, start + line_start, start + line_end))
+    return newlines, len(lines), lines
+
+
+class ParallelScan(object):
+    """
+    A pool of workers that select lines with one :py:class:`rajax.grep.Grep`.
+
+    :param grep: A :py:class:`rajax.grep.Grep`
+    :param jobs: Number of worker processes, by default one per CPU
+    :param chunk_size: See :py:data:`DEFAULT_CHUNK_SIZE`
+    """
+
+    def __init__(self, grep, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.grep = grep
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.pool = multiprocessing.Pool(self.jobs, _init_worker, (grep,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the workers"""
+        self.pool.terminate()
+        self.pool.join()
+
+    def _results(self, path, lines):
+        """Results of :py:func:`_scan_chunk` for each chunk, in order"""
+        buf = _map(path)
+        try:
+            ranges = split_lines(buf, self.chunk_size)
+        finally:
+            if buf:
+                buf.close()
+        tasks = [(path, start, end, lines) for start, end in ranges]
+        return self.pool.imap(_scan_chunk, tasks)
+
+    def count(self, path):
+        """:return: Number of selected lines in the file at ``path``"""
+        return sum(selected for _, selected, _ in self._results(path, False))
+
+    def lines(self, path):
+        """
+        Selected lines of the file at ``path``, in order.
+
+        :return: Iterator of ``(lineno, start, end)``, with ``lineno``
+                 counted from 1 and ``end`` the offset of the newline
+        """
+        base = 1
+        for newlines, _, lines in self._results(path, True):
+            for lineno, start, end in lines:
+                yield base + lineno, start, end
+            base += newlines
+
+
+def summarize(table, s, start, end, states):
+    """
+    Run ``s[start:end]`` from each of ``states`` of ``table`` at once. States
+    that meet are run once from there on, so this usually costs little more
+    than a single run.
+
+    :return: ``{state: (end state, end of the last match or None, ids)}``,
+             where ``ids`` are the patterns matched on the way
+    """
+    next, match_ids, dead = table.next, table.match_ids, table.dead
+    empty = frozenset()
+    # Current state -> [(start states, last, ids)]
+    groups = {}
+    # The same for the runs that have died, which go nowhere from there
+    finished = {}
+    for q in states:
+        (finished if dead[q] else groups)[q] = [([q], None, empty)]
+    # Bytes become their classes, which are what the table is indexed by
+    data = bytearray(s[start:end]).translate(bytearray(table.classes))
+    n = len(data)
+    i = 0
+    while i < n and groups:
+        if len(groups) == 1:
+            # Every live run has met the others; step them as one until
+            # something happens
+            (q, runs), = groups.items()
+            while i < n:
+                q = next[q][data[i]]
+                i += 1
+                if match_ids[q] or dead[q]:
+                    break
+            stepped = {q: _matched(runs, match_ids[q], start + i)}
+        else:
+            c = data[i]
+            i += 1
+            stepped = {}
+            for q, runs in groups.iteritems():
+                nxt = next[q][c]
+                runs = _matched(runs, match_ids[nxt], start + i)
+                if nxt in stepped:
+                    stepped[nxt] = stepped[nxt] + runs
+                else:
+                    stepped[nxt] = runs
+        groups = {}
+        for q, runs in stepped.iteritems():
+            if dead[q]:
+                finished[q] = finished.get(q, []) + runs
+            else:
+                groups[q] = runs
+    groups.update(finished)
+    summary = {}
+    for q, runs in groups.iteritems():
+        for origins, last, seen in runs:
+            for origin in origins:
+                summary[origin] = (q, last, seen)
+    return summary
+
+
+def _matched(runs, ids, i):
+    """``runs`` after reaching a state that matches ``ids`` at offset ``i``"""
+    if not ids:
+        return runs
+    # Runs that have seen the same matches only differ in where they started
+    merged = {}
+    for origins, _, seen in runs:
+        merged.setdefault(seen | ids, []).extend(origins)
+    return [(origins, i, seen) for seen, origins in merged.iteritems()]
+
+
+def compose(first, second):
+    """
+    Chain the summaries of two adjacent pieces of input.
+
+    :return: The summary of both, in the form :py:func:`summarize` returns
+    """
+    result = {}
+    for q, (mid, last, ids) in first.iteritems():
+        if mid not in second:
+            continue
+        end, last2, ids2 = second[mid]
+        result[q] = (end, last if last2 is None else last2, ids | ids2)
+    return result
+
+
+def _init_speculative(table, s):
+    global _table, _input
+    _table = table
+    _input = s
+
+
+def _summarize_chunk(task):
+    start, end, states = task
+    if states is None:
+        states = xrange(len(_table))
+    return summarize(_table, _input, start, end, states)
+
+
+class SpeculativeScan(object):
+    """
+    Scan one input with a :py:class:`rajax.dfa.DFATable` in worker processes.
+
+    :param table: A :py:class:`rajax.dfa.DFATable`
+    :param jobs: Number of worker processes, by default one per CPU
+    :param chunk_size: See :py:data:`DEFAULT_SPECULATIVE_CHUNK_SIZE`
+    """
+
+    def __init__(self, table, jobs=None,
+                 chunk_size=DEFAULT_SPECULATIVE_CHUNK_SIZE):
+        self.table = table
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+
+    def scan(self, s):
+        """
+        :param s: A byte string, ``bytearray`` or ``mmap``
+        :return: ``(state, last, ids)`` exactly as
+                 :py:meth:`rajax.dfa.DFATable.scan` returns them
+        """
+        n = len(s)
+        # Only the first chunk is known to start in the start state
+        tasks = [(start, min(start + self.chunk_size, n),
+                  [0] if start == 0 else None)
+                 for start in xrange(0, n, self.chunk_size)]
+        if not tasks:
+            return self.table.finish(0, 0 if self.table.match_ids[0] else None,
+                                     self.table.match_ids[0], 0)
+        # The workers are forked with the table and the input, so neither is
+        # ever pickled
+        pool = multiprocessing.Pool(min(self.jobs, len(tasks)),
+                                    _init_speculative, (self.table, s))
+        try:
+            summaries = pool.map(_summarize_chunk, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+        summary = reduce(compose, summaries)
+        state, last, ids = summary[0]
+        ids = ids | self.table.match_ids[0]
+        if last is None and self.table.match_ids[0]:
+            last = 0
+        return self.table.finish(state, last, ids, n)
@@ -4,11 +4,16 @@ Parser using a grammar mostly derived from the `1997 Single UNIX Specification
 """
 from __future__ import absolute_import
 
+import copy
+import functools
 import logging
+import os
+import threading
 
 import ply.yacc as yacc
 
 from rajax.ast import (
+    AssertNode,
     ASTNode,
     BrackExprListNode,
     CharClassNode,
@@ -16,6 +21,7 @@ from rajax.ast import (
     NonDupReNode,
     RangeExprNode,
     RegexNode,
+    RepeatNode,
     SimpleReNode
 )
 from rajax.const import (
@@ -24,7 +30,7 @@ from rajax.const import (
     str_esc_seq,
     WILDCARD
 )
-from rajax.lexer import tokens
+from rajax.lexer import new_lexer, tokens
 tokens
 
 
@@ -33,28 +39,81 @@ log = logging.getLogger(__name__)
 
 # (some\\one)?and *(my)+ d|og
 
-# Print debug info during parsing
+# Print debug info during parsing. Read at the start of each call to parse().
 debug = True
 
-# If True, AST will contain *all* productions. Otherwise it is progressively collapsed.
-full_graph = False
+# Module holding the LALR tables, shipped with the package. Regenerate it with
+# write_tables() after changing the grammar. The tables are written by ply 3.4
+# (see reqs.txt); other versions of ply ignore them and build their own.
+TABMODULE = 'rajax.parsetab'
 
-def parse(s, fg=False):
+# Built by get_parser() the first time a string is parsed, not at import
+_parser = None
+_parser_lock = threading.Lock()
+
+def get_parser():
+    """
+    Return the shared ply parser, building it from the tables in
+    :py:data:`TABMODULE` on first use. If the tables are missing or out of
+    date they are regenerated in memory; nothing is written to disk.
+    """
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                _parser = yacc.yacc(debug=False, write_tables=False,
+                                    tabmodule=TABMODULE,
+                                    errorlog=yacc.NullLogger())
+    return _parser
+
+def write_tables(outputdir=None):
     """
-    Parse a string into an AST
+    Regenerate the LALR table module. Run this after changing the grammar::
+
+        python -c "from rajax import parser; parser.write_tables()"
+
+    :param outputdir: Directory to write ``parsetab.py`` to. Defaults to the
+                      directory of this package.
+    """
+    if outputdir is None:
+        outputdir = os.path.dirname(os.path.abspath(__file__))
+    # ply only writes the tables if the signature of the grammar doesn't match
+    # the existing ones
+    yacc.yacc(debug=False, tabmodule=TABMODULE, outputdir=outputdir)
+
+def parse(s, fg=False, tokens=None):
+    """
+    Parse a string into an AST. Safe to call from several threads at once:
+    every call gets its own lexer and parser state.
 
     :param s: A regular expression
     :param fg: If True, an AST node is generated for every production.
+    :param tokens: The tokens of ``s``, if they have already been lexed with
+                   :py:func:`rajax.lexer.new_lexer`
 
     :return: Root of the AST
     :rtype: :py:class:`rajax.ast.ASTNode`
     """
-    global full_graph
-    full_graph = fg
-    return parser.parse(s)
+    # The parse stacks are attributes of the parser object, so give each call
+    # its own copy. The tables are shared.
+    p = copy.copy(get_parser())
+    # If True, AST will contain *all* productions. Otherwise it is progressively
+    # collapsed.
+    p.full_graph = fg
+    p.debug = debug
+    if tokens is not None:
+        return p.parse(lexer=new_lexer(),
+                       tokenfunc=functools.partial(next, iter(tokens), None))
+    return p.parse(s, lexer=new_lexer())
+
+def _is_alt(node):
+    return node.node_type == 'regex' and node.subtype == 'alt'
+
+def _is_concat(node):
+    return node.node_type == 're_expr' and node.subtype == 'concat'
 
 precedence = (
-    ('left', 'STAR', 'PLUS', 'QMARK'),
+    ('left', 'STAR', 'PLUS', 'QMARK', 'REPEAT'),
 )
 
 # ========================
@@ -66,13 +125,23 @@ def p_regex(p):
     regex : regex PIPE  re_expr
     """
     if len(p) == 2:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = RegexNode("plain", [p[1]])
         else:
             p[0] = p[1]
     elif len(p) == 4:
-        p[0] = RegexNode("alt", [p[1], p[3]])
-    if debug: print str(p[0]), p[0].children
+        # Add to an existing alternation rather than nesting it, so that long
+        # chains of alternatives make wide trees instead of deep ones
+        if _is_alt(p[1]):
+            p[1].add_child(p[3])
+            p[0] = p[1]
+            # Only the new branch, or the output grows with the square of
+            # the number of branches
+            if p.parser.debug: print str(p[0]), '+', [p[3]]
+            return
+        else:
+            p[0] = RegexNode("alt", [p[1], p[3]])
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_re_expr(p):
     """
@@ -80,39 +149,60 @@ def p_re_expr(p):
     re_expr :   re_expr     simple_re
     """
     if len(p) == 2:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = ASTNode("re_expr", "plain", [p[1]])
         else:
             p[0] = p[1]
     elif len(p) == 3:
-        p[0] = ASTNode("re_expr", "concat", [p[1], p[2]])
-    if debug: print str(p[0]), p[0].children
+        # Flat, like alternations in p_regex
+        if _is_concat(p[1]):
+            p[1].add_child(p[2])
+            p[0] = p[1]
+            if p.parser.debug: print str(p[0]), '+', [p[2]]
+            return
+        else:
+            p[0] = ASTNode("re_expr", "concat", [p[1], p[2]])
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_simple_re(p):
     """
     simple_re : nondup_re
     simple_re : nondup_re   dup_symb
+    simple_re : assertion
     """
     if len(p) == 2:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = SimpleReNode("plain", [p[1]])
         else:
             p[0] = p[1]
     elif len(p) == 3:
-        if full_graph:
-            p[0] = SimpleReNode("dup", [p[1], p[2]], data=p[2].data)
+        if p.parser.full_graph:
+            children = [p[1], p[2]]
+        else:
+            children = [p[1]]
+        if p[2].data.startswith('{'):
+            p[0] = RepeatNode(children, data=p[2].data)
         else:
-            p[0] = SimpleReNode("dup", [p[1]], data=p[2].data)
-    if debug: print str(p[0]), p[0].children
+            p[0] = SimpleReNode("dup", children, data=p[2].data)
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_dup_symb(p):
     """
     dup_symb :  STAR
     dup_symb :  PLUS
     dup_symb :  QMARK
+    dup_symb :  REPEAT
     """
     p[0] = ASTNode("dup_symb", data=p[1])
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
+
+def p_assertion(p):
+    """
+    assertion : CARAT
+    assertion : DOLLAR
+    """
+    p[0] = AssertNode(p[1])
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_nondup_re(p):
     """
@@ -121,21 +211,21 @@ def p_nondup_re(p):
     """
     if len(p) == 2:
         if p[1].node_type == 'brack_expr' or p[1].subtype == 'brack_expr':
-            if full_graph:
+            if p.parser.full_graph:
                 p[0] = ASTNode("nondup_re", "brack_expr", [p[1]])
             else:
                 p[0] = p[1]
         else:
-            if full_graph:
+            if p.parser.full_graph:
                 p[0] = NonDupReNode("char", children=[p[1]], data=p[1].data)
             else:
                 p[0] = NonDupReNode("char", data=p[1].data)
     elif len(p) == 4:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = NonDupReNode("group", [p[2]], data=p[2].data)
         else:
             p[0] = p[2]
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_one_char(p):
     """
@@ -148,7 +238,7 @@ def p_one_char(p):
     """
     if isinstance(p[1], ASTNode):
         if p[1].node_type == 'brack_expr':
-            if full_graph:
+            if p.parser.full_graph:
                 p[0] = ASTNode("one_char", "brack_expr", [p[1]])
             else:
                 p[0] = p[1]
@@ -159,7 +249,7 @@ def p_one_char(p):
             p[0] = ASTNode("one_char", "wildcard", data=WILDCARD)
         else:
             p[0] = ASTNode("one_char", "normal", data=p[1])
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_escaped_char(p):
     """
@@ -177,7 +267,7 @@ def p_brack_expr(p):
     brack_expr :    special_escape
     """
     if len(p) == 4:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = BrackExprListNode(p[2].node_type, [p[2]])
         else:
             p[0] = BrackExprListNode(p[2].node_type, p[2].children)
@@ -188,21 +278,21 @@ def p_brack_expr(p):
             p[0] = BrackExprListNode("nonmatching_list", [p[1]])
         else:
             raise Exception("Bad escape sequence: %s" % p[1].data)
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_matching_list(p):
     """
     matching_list : bracket_list
     """
     p[0] = ASTNode("matching_list", children=[p[1]])
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_nonmatching_list(p):
     """
     nonmatching_list : CARAT    bracket_list
     """
     p[0] = ASTNode("nonmatching_list", children=[p[2]])
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_bracket_list(p):
     """
@@ -210,16 +300,16 @@ def p_bracket_list(p):
     bracket_list :  follow_list DASH
     """
     if len(p) == 2:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = ASTNode("bracket_list", "plain", children=[p[1]])
         else:
             p[0] = p[1]
     elif len(p) == 3:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = ASTNode("bracket_list", "range", children=[p[1]])
         else:
             p[0] = p[1]
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_follow_list(p):
     """
@@ -227,13 +317,19 @@ def p_follow_list(p):
     follow_list :   follow_list expr_term
     """
     if len(p) == 2:
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = ASTNode("follow_list", "plain", children=[p[1]])
         else:
             p[0] = p[1]
     elif len(p) == 3:
-        p[0] = ASTNode("follow_list", "multi", children=[p[1], p[2]])
-    if debug: print str(p[0]), p[0].children
+        if p[1].node_type == 'follow_list' and p[1].subtype == 'multi':
+            p[1].add_child(p[2])
+            p[0] = p[1]
+            if p.parser.debug: print str(p[0]), '+', [p[2]]
+            return
+        else:
+            p[0] = ASTNode("follow_list", "multi", children=[p[1], p[2]])
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_expr_term(p):
     """
@@ -241,21 +337,21 @@ def p_expr_term(p):
     expr_term : range_expr
     expr_term : special_escape
     """
-    if full_graph:
+    if p.parser.full_graph:
         p[0] = ASTNode("expr_term", children=[p[1]])
     else:
         p[0] = p[1]
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_single_expr(p):
     """
     single_expr :   end_range
     """
-    if full_graph:
+    if p.parser.full_graph:
         p[0] = ASTNode("single_expr", children=[p[1]])
     else:
         p[0] = p[1]
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_range_expr(p):
     """
@@ -266,20 +362,20 @@ def p_range_expr(p):
         p[0] = RangeExprNode(children=[p[1], p[2]])
     else:
         p[0] = RangeExprNode(children=[p[1], EndRangeNode('char', data=p[2])])
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_start_range(p):
     """
     start_range :   end_range   DASH
     """
     if isinstance(p[1], ASTNode):
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = ASTNode("start_range", children=[p[1]], data=p[1].data)
         else:
             p[0] = p[1]
     else:
         p[0] = ASTNode("start_range", data=p[1])
-    if debug: print str(p[0]), p[0].children
+    if p.parser.debug: print str(p[0]), p[0].children
 
 def p_end_range(p):
     """
@@ -288,7 +384,7 @@ def p_end_range(p):
     end_range : escaped_char
     """
     if isinstance(p[1], ASTNode):
-        if full_graph:
+        if p.parser.full_graph:
             p[0] = EndRangeNode('char', children=[p[1]], data=p[1].data)
         else:
             p[0] = EndRangeNode('char', data=p[1].data)
@@ -302,6 +398,6 @@ def p_special_escape(p):
     p[0] = CharClassNode(p[1])
 
 def p_error(p):
+    if p is None:
+        raise TypeError("unexpected end of text")
     raise TypeError("unknown text at %r" % (p.value,))
-
-parser = yacc.yacc(debug=debug)
@@ -0,0 +1,71 @@
+
+# rajax/parsetab.py
+# This file is automatically generated. Do not edit.
+_tabversion = '3.2'
+
+_lr_method = 'LALR'
+
+_lr_signature = '\xcf\x89\x8b\xa5Z\xf0\x92\xa2\x81;$\xf4\xde\x1b\xd0\x02'
+    
+_lr_action_items = {'ORD_CHAR':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,23,24,25,27,28,29,30,31,32,33,35,37,38,39,40,41,42,43,44,45,47,48,49,51,],[12,-20,-14,-12,-18,-7,-17,-22,-21,-25,12,-16,-13,-19,12,-3,24,-5,-42,12,-4,-35,-39,-34,-30,-33,24,-40,-32,24,-41,24,-11,-8,-10,-9,-6,12,-15,-38,-23,-36,-37,-31,-24,]),'PIPE':([1,2,3,4,5,6,7,8,9,10,11,12,13,14,16,18,19,21,22,37,38,39,40,41,42,43,45,51,],[-20,-14,-12,-18,20,-7,-17,-22,-21,-25,-1,-16,-13,-19,-3,-5,-42,-4,20,-11,-8,-10,-9,-6,-2,-15,-23,-24,]),'REPEAT':([1,2,4,7,8,9,10,12,14,18,19,43,45,51,],[-20,-14,-18,-17,-22,-21,-25,-16,-19,37,-42,-15,-23,-24,]),'STAR':([1,2,4,7,8,9,10,12,14,18,19,43,45,51,],[-20,-14,-18,-17,-22,-21,-25,-16,-19,38,-42,-15,-23,-24,]),'LPAREN':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,18,19,20,21,37,38,39,40,41,42,43,45,51,],[15,-20,-14,-12,-18,-7,-17,-22,-21,-25,15,-16,-13,-19,15,-3,-5,-42,15,-4,-11,-8,-10,-9,-6,15,-15,-23,-24,]),'QMARK':([1,2,4,7,8,9,10,12,14,18,19,43,45,51,],[-20,-14,-18,-17,-22,-21,-25,-16,-19,39,-42,-15,-23,-24,]),'CARAT':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,37,38,39,40,41,42,43,45,51,],[3,-20,-14,-12,-18,-7,-17,-22,-21,-25,3,-16,-13,-19,3,-3,29,-5,-42,3,-4,-11,-8,-10,-9,-6,3,-15,-23,-24,]),'RBRACK':([8,19,23,24,25,26,27,28,30,31,33,34,35,36,46,47,48,49,50,],[-22,-42,-35,-39,-34,45,-30,-33,-40,-32,-41,-26,-28,51,-27,-36,-37,-31,-29,]),'DOLLAR':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,18,19,20,21,37,38,39,40,41,42,43,45,51,],[13,-20,-14,-12,-18,-7,-17,-22,-21,-25,13,-16,-13,-19,13,-3,-5,-42,13,-4,-11,-8,-10,-9,-6,13,-15,-23,-24,]),'LBRACK':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,18,19,20,21,37,38,39,40,41,42,43,45,51,],[17,-20,-14,-12,-18,-7,-17,-22,-21,-25,17,-16,-13,-19,17,-3,-5,-42,17,-4,-11,-8,-10,-9,-6,17,-15,-23,-24,]),'PLUS':([1,2,4,7,8,9,10,12,14,18,19,43,45,51,],[-20,-14,-18,-17,-22,-21,-25,-16,-19,40,-42,-15,-23,-24,]),'DASH':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,18,19,20,21,23,24,25,27,28,30,31,32,33,35,37,38,39,40,41,42,43,44,45,47,48,49,51,],[14,-20,-14,-12,-18,-7,-17,-22,-21,-25,14,-16,-13,-19,14,-3,-5,-42,14,-4,44,-39,-34,-30,-33,-40,-32,48,-41,50,-11,-8,-10,-9,-6,14,-15,-38,-23,-36,-37,-31,-24,]),'ES_NORMAL':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,23,24,25,27,28,29,30,31,32,33,35,37,38,39,40,41,42,43,44,45,47,48,49,51,],[7,-20,-14,-12,-18,-7,-17,-22,-21,-25,7,-16,-13,-19,7,-3,30,-5,-42,7,-4,-35,-39,-34,-30,-33,30,-40,-32,30,-41,30,-11,-8,-10,-9,-6,7,-15,-38,-23,-36,-37,-31,-24,]),'ES_CHAR':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,23,24,25,27,28,29,30,31,32,33,35,37,38,39,40,41,42,43,44,45,47,48,49,51,],[8,-20,-14,-12,-18,-7,-17,-22,-21,-25,8,-16,-13,-19,8,-3,8,-5,-42,8,-4,-35,-39,-34,-30,-33,8,-40,-32,8,-41,8,-11,-8,-10,-9,-6,8,-15,-38,-23,-36,-37,-31,-24,]),'ES_SPECIAL':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,23,24,25,27,28,29,30,31,33,35,37,38,39,40,41,42,43,45,47,48,49,51,],[19,-20,-14,-12,-18,-7,-17,-22,-21,-25,19,-16,-13,-19,19,-3,19,-5,-42,19,-4,-35,-39,-34,-30,-33,19,-40,-32,-41,19,-11,-8,-10,-9,-6,19,-15,-23,-36,-37,-31,-24,]),'RPAREN':([1,2,3,4,6,7,8,9,10,11,12,13,14,16,18,19,21,22,37,38,39,40,41,42,43,45,51,],[-20,-14,-12,-18,-7,-17,-22,-21,-25,-1,-16,-13,-19,-3,-5,-42,-4,43,-11,-8,-10,-9,-6,-2,-15,-23,-24,]),'DOT':([0,1,2,3,4,6,7,8,9,10,11,12,13,14,15,16,18,19,20,21,37,38,39,40,41,42,43,45,51,],[4,-20,-14,-12,-18,-7,-17,-22,-21,-25,4,-16,-13,-19,4,-3,-5,-42,4,-4,-11,-8,-10,-9,-6,4,-15,-23,-24,]),'$end':([1,2,3,4,5,6,7,8,9,10,11,12,13,14,16,18,19,21,37,38,39,40,41,42,43,45,51,],[-20,-14,-12,-18,0,-7,-17,-22,-21,-25,-1,-16,-13,-19,-3,-5,-42,-4,-11,-8,-10,-9,-6,-2,-15,-23,-24,]),}
+
+_lr_action = { }
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = { }
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'regex':([0,15,],[5,22,]),'re_expr':([0,15,20,],[11,11,42,]),'one_char':([0,11,15,20,42,],[2,2,2,2,2,]),'start_range':([17,29,35,],[32,32,32,]),'matching_list':([17,],[26,]),'expr_term':([17,29,35,],[27,27,49,]),'brack_expr':([0,11,15,20,42,],[1,1,1,1,1,]),'simple_re':([0,11,15,20,42,],[16,21,16,16,21,]),'assertion':([0,11,15,20,42,],[6,6,6,6,6,]),'dup_symb':([18,],[41,]),'nondup_re':([0,11,15,20,42,],[18,18,18,18,18,]),'bracket_list':([17,29,],[34,46,]),'single_expr':([17,29,35,],[31,31,31,]),'range_expr':([17,29,35,],[28,28,28,]),'end_range':([17,29,32,35,],[23,23,47,23,]),'escaped_char':([0,11,15,17,20,29,32,35,42,],[9,9,9,33,9,33,33,33,9,]),'special_escape':([0,11,15,17,20,29,35,42,],[10,10,10,25,10,25,25,10,]),'follow_list':([17,29,],[35,35,]),'nonmatching_list':([17,],[36,]),}
+
+_lr_goto = { }
+for _k, _v in _lr_goto_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = { }
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> regex","S'",1,None,None,None),
+  ('regex -> re_expr','regex',1,'p_regex','rajax/parser.py',123),
+  ('regex -> regex PIPE re_expr','regex',3,'p_regex','rajax/parser.py',124),
+  ('re_expr -> simple_re','re_expr',1,'p_re_expr','rajax/parser.py',143),
+  ('re_expr -> re_expr simple_re','re_expr',2,'p_re_expr','rajax/parser.py',144),
+  ('simple_re -> nondup_re','simple_re',1,'p_simple_re','rajax/parser.py',162),
+  ('simple_re -> nondup_re dup_symb','simple_re',2,'p_simple_re','rajax/parser.py',163),
+  ('simple_re -> assertion','simple_re',1,'p_simple_re','rajax/parser.py',164),
+  ('dup_symb -> STAR','dup_symb',1,'p_dup_symb','rajax/parser.py',184),
+  ('dup_symb -> PLUS','dup_symb',1,'p_dup_symb','rajax/parser.py',185),
+  ('dup_symb -> QMARK','dup_symb',1,'p_dup_symb','rajax/parser.py',186),
+  ('dup_symb -> REPEAT','dup_symb',1,'p_dup_symb','rajax/parser.py',187),
+  ('assertion -> CARAT','assertion',1,'p_assertion','rajax/parser.py',194),
+  ('assertion -> DOLLAR','assertion',1,'p_assertion','rajax/parser.py',195),
+  ('nondup_re -> one_char','nondup_re',1,'p_nondup_re','rajax/parser.py',202),
+  ('nondup_re -> LPAREN regex RPAREN','nondup_re',3,'p_nondup_re','rajax/parser.py',203),
+  ('one_char -> ORD_CHAR','one_char',1,'p_one_char','rajax/parser.py',225),
+  ('one_char -> ES_NORMAL','one_char',1,'p_one_char','rajax/parser.py',226),
+  ('one_char -> DOT','one_char',1,'p_one_char','rajax/parser.py',227),
+  ('one_char -> DASH','one_char',1,'p_one_char','rajax/parser.py',228),
+  ('one_char -> brack_expr','one_char',1,'p_one_char','rajax/parser.py',229),
+  ('one_char -> escaped_char','one_char',1,'p_one_char','rajax/parser.py',230),
+  ('escaped_char -> ES_CHAR','escaped_char',1,'p_escaped_char','rajax/parser.py',249),
+  ('brack_expr -> LBRACK matching_list RBRACK','brack_expr',3,'p_brack_expr','rajax/parser.py',258),
+  ('brack_expr -> LBRACK nonmatching_list RBRACK','brack_expr',3,'p_brack_expr','rajax/parser.py',259),
+  ('brack_expr -> special_escape','brack_expr',1,'p_brack_expr','rajax/parser.py',260),
+  ('matching_list -> bracket_list','matching_list',1,'p_matching_list','rajax/parser.py',278),
+  ('nonmatching_list -> CARAT bracket_list','nonmatching_list',2,'p_nonmatching_list','rajax/parser.py',285),
+  ('bracket_list -> follow_list','bracket_list',1,'p_bracket_list','rajax/parser.py',292),
+  ('bracket_list -> follow_list DASH','bracket_list',2,'p_bracket_list','rajax/parser.py',293),
+  ('follow_list -> expr_term','follow_list',1,'p_follow_list','rajax/parser.py',309),
+  ('follow_list -> follow_list expr_term','follow_list',2,'p_follow_list','rajax/parser.py',310),
+  ('expr_term -> single_expr','expr_term',1,'p_expr_term','rajax/parser.py',327),
+  ('expr_term -> range_expr','expr_term',1,'p_expr_term','rajax/parser.py',328),
+  ('expr_term -> special_escape','expr_term',1,'p_expr_term','rajax/parser.py',329),
+  ('single_expr -> end_range','single_expr',1,'p_single_expr','rajax/parser.py',339),
+  ('range_expr -> start_range end_range','range_expr',2,'p_range_expr','rajax/parser.py',349),
+  ('range_expr -> start_range DASH','range_expr',2,'p_range_expr','rajax/parser.py',350),
+  ('start_range -> end_range DASH','start_range',2,'p_start_range','rajax/parser.py',360),
+  ('end_range -> ORD_CHAR','end_range',1,'p_end_range','rajax/parser.py',373),
+  ('end_range -> ES_NORMAL','end_range',1,'p_end_range','rajax/parser.py',374),
+  ('end_range -> escaped_char','end_range',1,'p_end_range','rajax/parser.py',375),
+  ('special_escape -> ES_SPECIAL','special_escape',1,'p_special_escape','rajax/parser.py',387),
+]
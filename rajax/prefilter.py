@@ -0,0 +1,218 @@
+"""
+Skip patterns which cannot possibly match an input.
+
+Most patterns contain literal text which every match must include, e.g.
+``timeout`` in ``error: \w+ timeout``. :py:func:`required_factors` finds that
+text in the AST, and :py:class:`PatternSet` looks for all of it with one
+:py:class:`AhoCorasick` pass over the input before running any pattern's
+program. A pattern only runs if all of its factors were found.
+"""
+from __future__ import absolute_import
+
+import collections
+
+from rajax import cmd, dfa, optimize, vm
+from rajax.ast import (
+    LiteralNode,
+    NonDupReNode,
+    RegexNode,
+    RepeatNode,
+    SimpleReNode,
+)
+from rajax.const import WILDCARD
+
+
+def required_factors(root):
+    """
+    Find literal strings that any match of a simplified AST must contain.
+
+    :param root: AST returned by :py:func:`rajax.simplify.simplify`
+    :return: A list of requirements. Each requirement is a frozenset of
+             strings, at least one of which appears in every match.
+    """
+    node = root
+    if isinstance(node, LiteralNode):
+        return [frozenset([node.data])]
+    if isinstance(node, NonDupReNode) and node.subtype == 'char':
+        if node.data == WILDCARD or isinstance(node.data, int):
+            return []
+        return [frozenset([node.data])]
+    if isinstance(node, RepeatNode):
+        if node.min_count > 0:
+            return required_factors(node.children[0])
+        return []
+    if isinstance(node, SimpleReNode) and node.subtype == 'dup':
+        if node.data == '+':
+            return required_factors(node.children[0])
+        return []
+    if isinstance(node, RegexNode) and node.subtype == 'alt':
+        branches = [best_requirement(required_factors(c)) for c in node.children]
+        if None in branches:
+            return []
+        return [frozenset().union(*branches)]
+    if node.node_type == 're_expr' and node.subtype == 'concat':
+        requirements = []
+        for child in node.children:
+            requirements.extend(required_factors(child))
+        return requirements
+    return []
+
+
+def best_requirement(requirements):
+    """
+    :param requirements: As returned by :py:func:`required_factors`
+    :return: The requirement whose shortest string is longest, or None
+    """
+    if not requirements:
+        return None
+    return max(requirements, key=lambda r: min(len(f) for f in r))
+
+
+class AhoCorasick(object):
+    """
+    Finds which of a list of words occur in a text in a single pass.
+
+    :param words: A list of strings or sequences of character codes
+    """
+
+    def __init__(self, words):
+        self.words = words
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for word_id, word in enumerate(words):
+            node = 0
+            for c in vm.codes(word):
+                nxt = self.goto[node].get(c)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][c] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = nxt
+            self.out[node] += (word_id,)
+
+        # Breadth-first, so the failure link of a node's parent is known
+        queue = collections.deque(self.goto[0].itervalues())
+        while queue:
+            node = queue.popleft()
+            for c, nxt in self.goto[node].iteritems():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(c, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def find(self, s):
+        """
+        :param s: Input string
+        :return: Set of indexes of the words which occur in ``s``
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        n_words = len(self.words)
+        node = 0
+        for c in vm.codes(s):
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            if out[node]:
+                found.update(out[node])
+                if len(found) == n_words:
+                    break
+        return found
+
+
+class PatternSet(object):
+    """
+    A list of patterns which are run against each input only if their required
+    factors occur in it.
+
+    :param patterns: A sequence of regular expressions
+    :param opt_level: Passed to :py:func:`rajax.cmd.parse`
+    :param backend: Passed to :py:func:`rajax.cmd.parse`
+    :param utf8: Passed to :py:func:`rajax.cmd.parse`. Inputs are then
+                 UTF-8 encoded byte strings, and so are the factors looked
+                 for in them.
+
+    .. py:attribute: requirements
+
+        For each pattern, a list of requirements as returned by
+        :py:func:`required_factors`, with strings replaced by word indexes
+        into the Aho-Corasick automaton
+
+    .. py:attribute: stats
+
+        ``inputs``: inputs scanned. ``rejected``: inputs for which the
+        prefilter ruled out every pattern. ``checked``/``skipped``: number of
+        times each pattern was run or ruled out, indexed by pattern id.
+    """
+
+    def __init__(self, patterns, opt_level=optimize.DEFAULT_LEVEL,
+                 backend=cmd.DEFAULT_BACKEND, utf8=False):
+        options = {'opt_level': opt_level, 'backend': backend, 'utf8': utf8}
+        self.patterns = list(patterns)
+        self.programs = []
+
+        words = []
+        word_ids = {}
+        self.requirements = []
+        for s in self.patterns:
+            # Parse once, for both the program and its factors
+            root = cmd.tree(s, **options)
+            self.programs.append(cmd.parse(s, root=root, **options))
+            ids = []
+            for req in required_factors(root):
+                if utf8:
+                    req = [w.encode('utf-8') if isinstance(w, unicode) else w
+                           for w in req]
+                for word in req:
+                    if word not in word_ids:
+                        word_ids[word] = len(words)
+                        words.append(word)
+                ids.append(frozenset(word_ids[word] for word in req))
+            self.requirements.append(ids)
+        self.matchers = [dfa.LazyDFA(p) for p in self.programs]
+        self.automaton = AhoCorasick(words)
+        self.clear_stats()
+
+    def clear_stats(self):
+        """Reset :py:attr:`stats`"""
+        self.stats = {
+            'inputs': 0,
+            'rejected': 0,
+            'checked': [0] * len(self.patterns),
+            'skipped': [0] * len(self.patterns),
+        }
+
+    def candidates(self, s):
+        """
+        :return: Ids of the patterns whose required factors all occur in ``s``
+        """
+        found = self.automaton.find(s) if self.automaton.words else set()
+        return [i for i, reqs in enumerate(self.requirements)
+                if all(req & found for req in reqs)]
+
+    def match_ids(self, s, anchored=False):
+        """
+        :param s: Input string
+        :param anchored: If True, patterns must match at the start of ``s``
+        :return: Sorted list of ids of the patterns that match ``s``
+        """
+        s = vm.codes(s)
+        stats = self.stats
+        stats['inputs'] += 1
+        candidates = set(self.candidates(s))
+        if not candidates:
+            stats['rejected'] += 1
+        matched = []
+        for i in xrange(len(self.patterns)):
+            if i not in candidates:
+                stats['skipped'][i] += 1
+                continue
+            stats['checked'][i] += 1
+            if self.matchers[i].match_set(s, anchored=anchored, earliest=True):
+                matched.append(i)
+        return matched
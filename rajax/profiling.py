@@ -0,0 +1,171 @@
+"""
+Measure where the time goes in a compile.
+
+Pass a :py:class:`CompileStats` to :py:func:`rajax.cmd.parse`,
+:py:func:`rajax.cmd.compile_set` or :py:func:`rajax.cmd.show` and it is filled
+in with the wall time, memory, and token, AST node or instruction count of
+each phase: ``lex``, ``parse``, ``simplify``, ``codegen`` (which contains
+``transform_classes``), ``utf8`` (only with ``utf8=True``), ``optimize`` and
+``serialize``, and the counts of the changes the optimizer made. Without one,
+the compiler skips all of this, so leaving the hooks in costs nothing.
+
+Memory is the net number of bytes allocated during a phase, as reported by
+:py:mod:`tracemalloc`. It is only measured if ``tracemalloc`` is importable and
+tracing, e.g. after :py:func:`start_tracing`.
+"""
+from __future__ import absolute_import
+
+import time
+
+from ply.lex import LexToken
+
+from rajax.ast import ASTNode
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def start_tracing():
+    """
+    Start :py:mod:`tracemalloc` if it is available and not already running.
+
+    :return: True if memory will be measured
+    """
+    if tracemalloc is None:
+        return False
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return True
+
+
+def count_nodes(root):
+    """Number of nodes in the tree under ``root``, counted without recursing"""
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+class CompileStats(object):
+    """
+    Totals for each phase of one or more compiles.
+
+    .. py:attribute: phases
+
+        List of dicts in the order the phases first ran, with keys ``name``,
+        ``depth`` (how many phases it ran inside of), ``calls``, ``seconds``,
+        ``memory`` (bytes, or None if not measured), and the number of
+        ``tokens``, AST ``nodes`` or ``instructions`` the phase returned or
+        added to a list it was given. A
+        phase which runs more than once, like ``transform_classes``, is
+        summed.
+
+    .. py:attribute: optimizer
+
+        The counts filled in by :py:func:`rajax.optimize.optimize`, summed
+        over every compile: instructions ``before`` and ``after``, and the
+        ``threaded``, ``folded``, ``unreachable`` and ``fallthrough`` changes
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.optimizer = {}
+        self._by_name = {}
+        self._depth = 0
+
+    def run(self, name, func, *args):
+        """
+        Call ``func(*args)`` as the phase ``name`` and return its result
+        """
+        phase = self._by_name.get(name)
+        if phase is None:
+            phase = {
+                'name': name,
+                'depth': self._depth,
+                'calls': 0,
+                'seconds': 0.0,
+                'memory': None,
+                'tokens': 0,
+                'nodes': 0,
+                'instructions': 0,
+            }
+            self._by_name[name] = phase
+            self.phases.append(phase)
+
+        # A phase may append to a list it was given rather than return a new
+        # one; only count what it added
+        lengths = dict((id(a), len(a)) for a in args if isinstance(a, list))
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracing:
+            memory_before = tracemalloc.get_traced_memory()[0]
+        self._depth += 1
+        start = time.time()
+        try:
+            result = func(*args)
+        finally:
+            seconds = time.time() - start
+            self._depth -= 1
+
+        phase['calls'] += 1
+        phase['seconds'] += seconds
+        if tracing:
+            memory = tracemalloc.get_traced_memory()[0] - memory_before
+            phase['memory'] = (phase['memory'] or 0) + memory
+        if isinstance(result, ASTNode):
+            phase['nodes'] += count_nodes(result)
+        elif isinstance(result, list):
+            count = len(result) - lengths.get(id(result), 0)
+            if result and isinstance(result[0], LexToken):
+                phase['tokens'] += count
+            else:
+                phase['instructions'] += count
+        return result
+
+    def add_optimizer_counts(self, counts):
+        """Add the counts of one optimizer run to :py:attr:`optimizer`"""
+        for key, count in counts.iteritems():
+            self.optimizer[key] = self.optimizer.get(key, 0) + count
+
+    def total_seconds(self):
+        """Time spent in phases that didn't run inside another phase"""
+        return sum(p['seconds'] for p in self.phases if p['depth'] == 0)
+
+    def as_dict(self):
+        """Everything, in a form that :py:func:`json.dump` accepts"""
+        return {
+            'phases': [dict(p) for p in self.phases],
+            'optimizer': dict(self.optimizer),
+            'total_seconds': self.total_seconds(),
+        }
+
+    def format_table(self):
+        """:return: The phases as a human-readable table"""
+        total = self.total_seconds() or 1
+        lines = ['%-20s %6s %10s %6s %10s %8s %8s %8s' % (
+            'phase', 'calls', 'ms', '%', 'KB', 'tokens', 'nodes', 'instrs')]
+        for p in self.phases:
+            if p['memory'] is None:
+                memory = '-'
+            else:
+                memory = '%.1f' % (p['memory'] / 1024.0)
+            lines.append('%-20s %6d %10.3f %6.1f %10s %8s %8s %8s' % (
+                '  ' * p['depth'] + p['name'], p['calls'],
+                p['seconds'] * 1000, p['seconds'] * 100 / total, memory,
+                p['tokens'] or '-', p['nodes'] or '-',
+                p['instructions'] or '-'))
+        lines.append('%-20s %6s %10.3f' % (
+            'total', '', self.total_seconds() * 1000))
+        opt = self.optimizer
+        if opt:
+            lines.append(
+                'optimizer removed %d of %d instructions (%d jumps threaded,'
+                ' %d splits folded, %d unreachable, %d fall-through jumps)' % (
+                    opt['before'] - opt['after'], opt['before'],
+                    opt['threaded'], opt['folded'], opt['unreachable'],
+                    opt['fallthrough']))
+        return '\n'.join(lines) + '\n'
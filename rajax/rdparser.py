@@ -0,0 +1,342 @@
+"""
+A hand-written recursive-descent lexer and parser for the language accepted by
+:py:mod:`rajax.lexer` and :py:mod:`rajax.parser`.
+
+It builds exactly the AST that ``rajax.parser.parse(s)`` builds, quirks
+included, in a single pass with one token of lookahead, without ply's per-token
+overhead. Select it with ``backend='rd'`` in :py:func:`rajax.cmd.parse`. It
+only builds reduced ASTs; use :py:mod:`rajax.parser` for the full graph.
+
+Grammar, with the ``shift`` resolution of ply's one shift/reduce conflict
+(``end_range DASH`` always starts a range)::
+
+    regex        : re_expr (PIPE re_expr)*
+    re_expr      : simple_re+
+    simple_re    : nondup_re (STAR | PLUS | QMARK | REPEAT)? | CARAT | DOLLAR
+    nondup_re    : LPAREN regex RPAREN | ORD_CHAR | ES_NORMAL | ES_CHAR
+                 | ES_SPECIAL | LBRACK CARAT? follow_list DASH? RBRACK
+    follow_list  : (ES_SPECIAL | end_range (DASH (end_range | DASH))?)+
+    end_range    : ORD_CHAR | ES_NORMAL | ES_CHAR
+
+Groups are parsed with an explicit stack rather than by recursion, so nesting
+depth is not limited by the interpreter's recursion limit.
+"""
+from __future__ import absolute_import
+
+import re
+
+from rajax.ast import (
+    AssertNode,
+    ASTNode,
+    BrackExprListNode,
+    CharClassNode,
+    EndRangeNode,
+    NonDupReNode,
+    RangeExprNode,
+    RegexNode,
+    RepeatNode,
+    SimpleReNode
+)
+from rajax.const import (
+    char_classes_m,
+    str_esc_seq,
+    WILDCARD
+)
+from rajax.lexer import repeat_bounds
+
+
+# Characters allowed after a backslash, as in the escseq state of rajax.lexer
+_ES_NORMAL = frozenset('\\*+?()|[]^${}-')
+_ES_CHAR = frozenset('tnrfv')
+_ES_SPECIAL = frozenset('wWdD')
+
+# Single-character tokens outside of bracket expressions
+_OPERATORS = {
+    '(': 'LPAREN',
+    ')': 'RPAREN',
+    '*': 'STAR',
+    '+': 'PLUS',
+    '?': 'QMARK',
+    '|': 'PIPE',
+    '^': 'CARAT',
+    '$': 'DOLLAR',
+}
+
+# Same as rajax.lexer.t_REPEAT
+_REPEAT = re.compile(r"\{[0-9]+(?:,[0-9]*)?\}")
+
+_EOF = (None, None)
+
+_DUP_SYMBOLS = frozenset(['STAR', 'PLUS', 'QMARK', 'REPEAT'])
+_SIMPLE_RE_START = frozenset(['LPAREN', 'LBRACK', 'ORD_CHAR', 'ES_NORMAL',
+                              'ES_CHAR', 'ES_SPECIAL', 'CARAT', 'DOLLAR'])
+_EXPR_TERM_START = frozenset(['ORD_CHAR', 'ES_NORMAL', 'ES_CHAR',
+                              'ES_SPECIAL'])
+
+
+def _concat(node, child):
+    """
+    Add ``child`` to the ``re_expr`` so far. Flat, and merged into a
+    parenthesized concatenation on the left, exactly as rajax.parser does it.
+    """
+    if node is None:
+        return child
+    if node.node_type == 're_expr' and node.subtype == 'concat':
+        node.add_child(child)
+        return node
+    return ASTNode("re_expr", "concat", [node, child])
+
+
+def _alt(node, child):
+    """Add ``child`` to the ``regex`` so far, in the same way"""
+    if node is None:
+        return child
+    if node.node_type == 'regex' and node.subtype == 'alt':
+        node.add_child(child)
+        return node
+    return RegexNode("alt", [node, child])
+
+
+def parse(s):
+    """
+    Parse a string into an AST.
+
+    :param s: A regular expression
+    :return: Root of the AST
+    :rtype: :py:class:`rajax.ast.ASTNode`
+    """
+    return _Parser(s).parse()
+
+
+class _Parser(object):
+    """
+    State for parsing one string. ``tok`` is the lookahead token, a
+    ``(type, value)`` pair using the token names of :py:mod:`rajax.lexer`.
+    """
+
+    def __init__(self, s):
+        self.s = s
+        self.pos = 0
+        self.in_brackets = False
+        # True until something other than ']' or '^' follows '['
+        self.first = False
+        self.tok = _EOF
+
+    # =========
+    # = Lexer =
+    # =========
+
+    def _lex(self):
+        s, i = self.s, self.pos
+        if i >= len(s):
+            return _EOF
+        c = s[i]
+        self.pos = i + 1
+        if self.in_brackets:
+            return self._lex_brackets(c)
+        if c == '[':
+            self.first = True
+            self.in_brackets = True
+            return ('LBRACK', c)
+        if c == '\\':
+            if s[i + 1:i + 2] == '-':
+                # rajax.lexer keeps the backslash of \- as an ordinary
+                # character, and the dash follows as another one
+                return ('ORD_CHAR', c)
+            return self._lex_escape()
+        if c in _OPERATORS:
+            return (_OPERATORS[c], c)
+        if c == '{':
+            m = _REPEAT.match(s, i)
+            if m:
+                repeat_bounds(m.group())
+                self.pos = m.end()
+                return ('REPEAT', m.group())
+        if c == ']':
+            raise TypeError("Error in text '%s'" % (s[i:],))
+        return ('ORD_CHAR', c)
+
+    def _lex_brackets(self, c):
+        if c == ']':
+            # A ']' right after '[' or '[^' is an ordinary character, and
+            # rajax.lexer leaves ``first`` set after it
+            if self.first:
+                return ('ORD_CHAR', c)
+            self.in_brackets = False
+            return ('RBRACK', c)
+        if c == '^':
+            return ('CARAT' if self.first else 'ORD_CHAR', c)
+        if c == '-':
+            if self.first:
+                self.first = False
+                return ('ORD_CHAR', c)
+            return ('DASH', c)
+        if c == '\\':
+            return self._lex_escape()
+        self.first = False
+        return ('ORD_CHAR', c)
+
+    def _lex_escape(self):
+        """Lex the character after a backslash"""
+        i = self.pos
+        c = self.s[i:i + 1]
+        if c and c in _ES_NORMAL:
+            tok = ('ES_NORMAL', c)
+        elif c and c in _ES_CHAR:
+            tok = ('ES_CHAR', c)
+        elif c and c in _ES_SPECIAL:
+            tok = ('ES_SPECIAL', c)
+        else:
+            raise TypeError("Bad escape sequence: '%s'" % (c,))
+        self.pos = i + 1
+        self.first = False
+        return tok
+
+    def _advance(self):
+        self.tok = self._lex()
+
+    def _expect(self, token_type):
+        if self.tok[0] != token_type:
+            self._error()
+        self._advance()
+
+    def _error(self):
+        if self.tok is _EOF:
+            raise TypeError("unexpected end of text")
+        raise TypeError("unknown text at %r" % (self.tok[1],))
+
+    # ==========
+    # = Parser =
+    # ==========
+
+    def parse(self):
+        self._advance()
+        node = self.regex()
+        if self.tok is not _EOF:
+            self._error()
+        return node
+
+    def regex(self):
+        """
+        The ``regex`` production, including every group inside it. Groups can
+        be nested as deeply as the pattern is long, so instead of recursing,
+        each open group saves the alternation and concatenation it
+        interrupted on a stack.
+        """
+        stack = []
+        # The re_exprs of the current regex so far, and the simple_res of the
+        # current re_expr so far
+        alt = concat = None
+        while True:
+            if self.tok[0] == 'LPAREN':
+                self._advance()
+                stack.append((alt, concat))
+                alt = concat = None
+                continue
+            node = self.simple_re()
+            while True:
+                concat = _concat(concat, node)
+                if self.tok[0] in _SIMPLE_RE_START:
+                    break
+                alt = _alt(alt, concat)
+                concat = None
+                if self.tok[0] == 'PIPE':
+                    self._advance()
+                    break
+                # End of a regex: the whole pattern, or a group
+                if not stack:
+                    return alt
+                self._expect('RPAREN')
+                node = alt
+                alt, concat = stack.pop()
+                node = self._dup(node)
+
+    def simple_re(self):
+        """A ``simple_re`` that isn't a group"""
+        if self.tok[0] == 'CARAT' or self.tok[0] == 'DOLLAR':
+            node = AssertNode(self.tok[1])
+            self._advance()
+            return node
+        return self._dup(self.nondup_re())
+
+    def _dup(self, node):
+        """``node`` with the quantifier that follows it, if any"""
+        if self.tok[0] in _DUP_SYMBOLS:
+            if self.tok[0] == 'REPEAT':
+                node = RepeatNode([node], data=self.tok[1])
+            else:
+                node = SimpleReNode("dup", [node], data=self.tok[1])
+            self._advance()
+        return node
+
+    def nondup_re(self):
+        """A ``nondup_re`` that isn't a group"""
+        token_type, value = self.tok
+        if token_type == 'LBRACK':
+            self._advance()
+            return self.brack_expr()
+        if token_type == 'ES_SPECIAL':
+            if value in char_classes_m:
+                node = BrackExprListNode("matching_list", [CharClassNode(value)])
+            else:
+                node = BrackExprListNode("nonmatching_list",
+                                         [CharClassNode(value)])
+        elif token_type == 'ORD_CHAR' or token_type == 'ES_NORMAL':
+            if value == '.':
+                node = NonDupReNode("char", data=WILDCARD)
+            else:
+                node = NonDupReNode("char", data=value)
+        elif token_type == 'ES_CHAR':
+            node = NonDupReNode("char", data=str_esc_seq[value])
+        else:
+            self._error()
+        self._advance()
+        return node
+
+    # =======================
+    # = Bracket Expressions =
+    # =======================
+
+    def brack_expr(self):
+        """Everything after the '[' of a bracket expression"""
+        subtype = "matching_list"
+        if self.tok[0] == 'CARAT':
+            self._advance()
+            subtype = "nonmatching_list"
+        terms = [self.expr_term()]
+        while self.tok[0] in _EXPR_TERM_START:
+            terms.append(self.expr_term())
+        if len(terms) == 1:
+            node = terms[0]
+        else:
+            node = ASTNode("follow_list", "multi", children=terms)
+        # A trailing dash after a range or class is dropped
+        if self.tok[0] == 'DASH':
+            self._advance()
+        self._expect('RBRACK')
+        return BrackExprListNode(subtype, [node])
+
+    def expr_term(self):
+        if self.tok[0] == 'ES_SPECIAL':
+            node = CharClassNode(self.tok[1])
+            self._advance()
+            return node
+        start = self.end_range()
+        if self.tok[0] != 'DASH':
+            return start
+        self._advance()
+        if self.tok[0] == 'DASH':
+            self._advance()
+            end = EndRangeNode('char', data='-')
+        else:
+            end = self.end_range()
+        return RangeExprNode(children=[start, end])
+
+    def end_range(self):
+        token_type, value = self.tok
+        if token_type == 'ES_CHAR':
+            value = str_esc_seq[value]
+        elif token_type != 'ORD_CHAR' and token_type != 'ES_NORMAL':
+            self._error()
+        self._advance()
+        return EndRangeNode('char', data=value)
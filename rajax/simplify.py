@@ -0,0 +1,164 @@
+"""
+Rewrite an AST from :py:mod:`rajax.parser` into a smaller one which matches
+exactly the same way, before code is generated for it.
+
+* Nested concatenations become one flat ``re_expr_concat`` node, and runs of
+  ordinary characters in it become a single
+  :py:class:`~rajax.ast.LiteralNode`.
+* A quantifier applied directly to another quantifier is collapsed into one,
+  e.g. ``(a*)*`` and ``(a+)?`` both become ``a*``. Different quantifiers are
+  only collapsed if their body can't match the empty string: ``((a?|b)+)?``
+  matches nothing at the start of ``b``, but ``(a?|b)*`` matches the ``b``.
+* Counted repetitions which are really ``*``, ``+`` or ``?``, such as
+  ``{1,}``, become them, and ``{1}`` is dropped.
+* Nodes which only pass code generation through to their single child, such
+  as groups and the extra productions of a full graph, are removed.
+"""
+from __future__ import absolute_import
+
+from rajax.ast import (
+    ASTNode,
+    AssertNode,
+    BrackExprListNode,
+    LiteralNode,
+    NonDupReNode,
+    RegexNode,
+    RepeatNode,
+    SimpleReNode,
+)
+from rajax.const import WILDCARD
+
+# (node_type, subtype) of nodes which just generate their child's code
+_pass_through = set([
+    ('regex', 'plain'),
+    ('re_expr', 'plain'),
+    ('simple_re', 'plain'),
+    ('nondup_re', 'group'),
+    ('nondup_re', 'brack_expr'),
+    ('one_char', 'brack_expr'),
+])
+
+# Quantifier equivalent to (e<inner>)<outer> for any e. Any other pair is
+# equivalent to e* only if e can't match the empty string, as in RE2; if it
+# can, the inner quantifier's empty match changes which match comes first.
+_combined_dup = {
+    ('*', '*'): '*',
+    ('+', '+'): '+',
+    ('?', '?'): '?',
+}
+
+# Quantifier equivalent to {m,n}, by (m, n)
+_repeat_dup = {
+    (0, None): '*',
+    (1, None): '+',
+    (0, 1): '?',
+}
+
+
+def simplify(root):
+    """
+    :param root: Root of an AST returned by :py:func:`rajax.parser.parse`
+    :return: Root of the simplified AST. Nodes of the original AST may be
+             shared with it.
+    """
+    return _simplify(root)
+
+
+def _unwrap(node):
+    while ((node.node_type, node.subtype) in _pass_through and
+           len(node.children) == 1):
+        node = node.children[0]
+    return node
+
+
+def _is_concat(node):
+    return node.node_type == 're_expr' and node.subtype == 'concat'
+
+
+def _is_char(node):
+    return (isinstance(node, NonDupReNode) and node.subtype in ('char', 'literal')
+            and node.data != WILDCARD and not isinstance(node.data, int))
+
+
+def _can_be_empty(node):
+    """True if ``node`` might match without consuming a character"""
+    node = _unwrap(node)
+    if isinstance(node, (LiteralNode, BrackExprListNode)):
+        return False
+    if isinstance(node, NonDupReNode) and node.subtype == 'char':
+        return False
+    if isinstance(node, AssertNode):
+        return True
+    if isinstance(node, RepeatNode):
+        return node.min_count == 0 or _can_be_empty(node.children[0])
+    if isinstance(node, SimpleReNode) and node.subtype == 'dup':
+        return node.data != '+' or _can_be_empty(node.children[0])
+    if isinstance(node, RegexNode) and node.subtype == 'alt':
+        return any(_can_be_empty(c) for c in node.children)
+    if _is_concat(node):
+        return all(_can_be_empty(c) for c in node.children)
+    # Anything else is left alone
+    return True
+
+
+def _simplify(node):
+    node = _unwrap(node)
+    if _is_concat(node):
+        return _simplify_concat(node)
+    if isinstance(node, RepeatNode):
+        bounds = (node.min_count, node.max_count)
+        if bounds == (1, 1):
+            return _simplify(node.children[0])
+        if bounds in _repeat_dup:
+            return _simplify(SimpleReNode('dup', [node.children[0]],
+                                          data=_repeat_dup[bounds]))
+        return RepeatNode([_simplify(node.children[0])], data=node.data)
+    if isinstance(node, SimpleReNode) and node.subtype == 'dup':
+        body = _simplify(node.children[0])
+        op = node.data
+        if isinstance(body, SimpleReNode) and body.subtype == 'dup':
+            inner = body.children[0]
+            if (body.data, op) in _combined_dup:
+                op = _combined_dup[(body.data, op)]
+                body = inner
+            elif not _can_be_empty(inner):
+                op = '*'
+                body = inner
+        return SimpleReNode('dup', [body], data=op)
+    if isinstance(node, RegexNode) and node.subtype == 'alt':
+        return RegexNode('alt', [_simplify(c) for c in node.children])
+    return node
+
+
+def _simplify_concat(node):
+    # Walk the (usually left-deep) chain of concatenations without recursing
+    # into it, so long literals don't use up the stack
+    items = []
+    stack = [node]
+    while stack:
+        n = _unwrap(stack.pop())
+        if _is_concat(n):
+            stack.extend(reversed(n.children))
+            continue
+        n = _simplify(n)
+        if _is_concat(n):
+            items.extend(n.children)
+        else:
+            items.append(n)
+
+    fused = []
+    run = []
+    for item in items + [None]:
+        if item is not None and _is_char(item):
+            run.append(item)
+            continue
+        if len(run) == 1:
+            fused.append(run[0])
+        elif run:
+            fused.append(LiteralNode(''.join(r.data for r in run)))
+        run = []
+        if item is not None:
+            fused.append(item)
+    if len(fused) == 1:
+        return fused[0]
+    return ASTNode('re_expr', 'concat', fused)
@@ -0,0 +1,142 @@
+"""
+Match a program against input that arrives in pieces.
+
+:py:class:`StreamMatcher` is :py:func:`rajax.vm.run` turned inside out: its
+thread list survives from one :py:meth:`~StreamMatcher.feed` to the next, so
+the result for a stream fed in any number of chunks is exactly what
+:py:func:`rajax.vm.run` returns for the whole stream at once, with offsets
+counted from the start of the stream. Nothing that was fed is kept; the only
+state is the thread list, which has at most one thread per instruction (per
+combination of counters, for programs with ``repeat`` loops), no matter how
+long the stream is.
+
+Whether ``$`` matches can't be known until the stream ends, so threads
+waiting on ``eol`` stay in the list until the next character kills them or
+:py:meth:`~StreamMatcher.finish` lets them through.
+
+    >>> matcher = StreamMatcher(cmd.parse('ab+c'), anchored=False)
+    >>> matcher.feed('xxa')
+    >>> matcher.feed('bb')
+    >>> matcher.feed('bcx')
+    (2, 7)
+
+The match is reported as soon as no thread could change it, here at the
+``x`` after the ``c``; :py:meth:`~StreamMatcher.finish` gives the result in
+any case.
+"""
+from __future__ import absolute_import
+
+from rajax.const import MATCH
+from rajax.vm import add_thread, codes, initial_counters, new_marks, step
+
+
+class StreamMatcher(object):
+    """
+    Runs a program over a stream fed in chunks.
+
+    :param program: A list of opcode tuples
+    :param anchored: See :py:func:`rajax.vm.run`
+    :param full: See :py:func:`rajax.vm.run`; the match must end at the end
+                 of the stream
+
+    .. py:attribute: offset
+
+        Number of characters fed so far
+
+    .. py:attribute: done
+
+        True once the result is known, either because no thread can change
+        it or because :py:meth:`finish` was called. Later input is ignored.
+
+    .. py:attribute: result
+
+        ``(start, end)`` of the match once :py:attr:`done`, otherwise None
+    """
+
+    def __init__(self, program, anchored=True, full=False):
+        self.program = program
+        self.anchored = anchored
+        self.full = full
+        self.counters = initial_counters(program)
+        self.marks = new_marks(program, self.counters)
+        self.stamp = 0
+        self.offset = 0
+        self.matched = None
+        self.done = False
+        self.result = None
+        self.threads = []
+        self._seed()
+
+    def _seed(self):
+        """Start a thread at the current offset if the search needs one, and
+        see if anything is left to do"""
+        i = self.offset
+        if self.matched is None and (not self.anchored or i == 0):
+            add_thread(self.program, self.threads, self.marks, self.stamp, 0,
+                       i, self.counters, i, None)
+        if not self.threads and (self.anchored or self.matched is not None):
+            self._decide()
+
+    def _decide(self):
+        self.done = True
+        self.result = self.matched
+        self.threads = []
+
+    def feed(self, chunk):
+        """
+        Consume the next piece of the stream.
+
+        :param chunk: A ``str``, ``unicode``, ``bytearray`` or ``mmap``
+        :return: :py:attr:`result`
+        """
+        if self.done:
+            return self.result
+        program = self.program
+        marks = self.marks
+        full = self.full
+        clist = self.threads
+        i = self.offset
+        for c in codes(chunk):
+            self.stamp += 1
+            nlist = []
+            for pc, start, counts in clist:
+                if program[pc][0] == MATCH:
+                    if not full:
+                        self.matched = (start, i)
+                        # Lower-priority threads can't win any more
+                        break
+                else:
+                    # A thread waiting on eol dies here too
+                    nxt = step(program, pc, c)
+                    if nxt is not None:
+                        add_thread(program, nlist, marks, self.stamp, nxt,
+                                   start, counts, i + 1, None)
+            i += 1
+            self.offset = i
+            self.threads = clist = nlist
+            self._seed()
+            if self.done:
+                break
+        return self.result
+
+    def finish(self):
+        """
+        Signal the end of the stream.
+
+        :return: ``(start, end)`` of the match, or None
+        """
+        if self.done:
+            return self.result
+        # Now that the stream is known to end here, let the threads waiting
+        # on eol through, each in its place
+        self.stamp += 1
+        final = []
+        for pc, start, counts in self.threads:
+            add_thread(self.program, final, self.marks, self.stamp, pc, start,
+                       counts, self.offset, True)
+        for pc, start, counts in final:
+            if self.program[pc][0] == MATCH:
+                self.matched = (start, self.offset)
+                break
+        self._decide()
+        return self.result
@@ -0,0 +1,215 @@
+"""
+Lower a program whose character tests are on code points into one that reads
+UTF-8 encoded bytes, so that it can run on a ``str``, ``bytearray`` or
+``mmap`` without decoding it first.
+
+Every ``char``, ``nchar`` and ``charset`` becomes the alternation of the byte
+sequences that encode the code points it accepts. A range of code points is
+cut into pieces whose encodings have the same length and differ only in
+whole trailing bytes, so each piece is one sequence of byte ranges. For
+example the code points from ``0x80`` to ``0x10FFFF`` are::
+
+    [C2-DF][80-BF]
+    [E0][A0-BF][80-BF]
+    [E1-EC][80-BF][80-BF]
+    [ED][80-9F][80-BF]
+    [EE-EF][80-BF][80-BF]
+    [F0][90-BF][80-BF][80-BF]
+    [F1-F3][80-BF][80-BF][80-BF]
+    [F4][80-8F][80-BF][80-BF]
+
+Surrogates (``D800`` to ``DFFF``) have no UTF-8 encoding and are dropped. The
+sequences of a test never overlap, so the order of the alternatives doesn't
+change which match the VM prefers.
+"""
+from __future__ import absolute_import
+
+from rajax.const import INF, WILDCARD
+from rajax.instructions import Instruction, make_charset, normalize_ranges
+
+# Largest code point encoded in 1, 2 and 3 bytes
+_LENGTH_LIMITS = (0x7F, 0x7FF, 0xFFFF)
+_SURROGATES = (0xD800, 0xDFFF)
+
+
+def encode(c):
+    """:return: The UTF-8 encoding of code point ``c`` as a list of bytes"""
+    if c < 0x80:
+        return [c]
+    if c < 0x800:
+        return [0xC0 | c >> 6, 0x80 | c & 0x3F]
+    if c < 0x10000:
+        return [0xE0 | c >> 12, 0x80 | c >> 6 & 0x3F, 0x80 | c & 0x3F]
+    return [0xF0 | c >> 18, 0x80 | c >> 12 & 0x3F, 0x80 | c >> 6 & 0x3F,
+            0x80 | c & 0x3F]
+
+
+def sequences(lo, hi):
+    """
+    Byte sequences which match exactly the UTF-8 encodings of the code points
+    from ``lo`` to ``hi``.
+
+    :return: A list of sequences in order, each a list of ``(lo, hi)`` byte
+             ranges
+    """
+    result = []
+    stack = [(lo, min(hi, INF))]
+    while stack:
+        lo, hi = stack.pop()
+        if lo > hi:
+            continue
+        pieces = _split(lo, hi)
+        if pieces:
+            # Pushed in reverse so that the lower piece comes out first
+            stack.extend(reversed(pieces))
+        else:
+            result.append(zip(encode(lo), encode(hi)))
+    return result
+
+
+def _split(lo, hi):
+    """
+    Cut ``lo``-``hi`` in two if its encodings don't all have the same shape,
+    or return None
+    """
+    if lo <= _SURROGATES[1] and hi >= _SURROGATES[0]:
+        return [(lo, _SURROGATES[0] - 1), (_SURROGATES[1] + 1, hi)]
+    for limit in _LENGTH_LIMITS:
+        if lo <= limit < hi:
+            return [(lo, limit), (limit + 1, hi)]
+    # Same length. Every trailing byte must run over its whole range
+    # (80-BF), unless all of the bytes before it are the same.
+    for i in xrange(1, len(encode(lo))):
+        mask = (1 << (6 * i)) - 1
+        if lo & ~mask != hi & ~mask:
+            if lo & mask:
+                return [(lo, lo | mask), ((lo | mask) + 1, hi)]
+            if hi & mask != mask:
+                return [(lo, (hi & ~mask) - 1), (hi & ~mask, hi)]
+    return None
+
+
+def _code_point_ranges(instr):
+    """Code point ranges accepted by a ``char`` or ``nchar`` Instruction"""
+    lo = ord(instr.arg1) if isinstance(instr.arg1, basestring) else instr.arg1
+    hi = ord(instr.arg2) if isinstance(instr.arg2, basestring) else instr.arg2
+    if lo == WILDCARD:
+        ranges = [(0, INF)]
+    else:
+        ranges = [(lo, hi or lo)]
+    if instr.cmd == 'nchar':
+        ranges = complement(ranges)
+    return ranges
+
+
+def complement(ranges):
+    """:return: The code points from 0 to ``INF`` not in ``ranges``"""
+    result = []
+    next_lo = 0
+    for lo, hi in normalize_ranges(ranges):
+        if lo > next_lo:
+            result.append((next_lo, lo - 1))
+        next_lo = max(next_lo, hi + 1)
+    if next_lo <= INF:
+        result.append((next_lo, INF))
+    return result
+
+
+def _byte_range(lo, hi):
+    if lo == hi:
+        return Instruction('char', lo)
+    return Instruction('char', lo, hi)
+
+
+def byte_test(ranges):
+    """
+    Instructions matching the UTF-8 encoding of any code point in
+    ``ranges``, to be placed at offset 0 of a program. Jump targets are
+    relative to that; see :py:func:`lower`.
+
+    Single bytes are tested with one ``char`` or ``charset``, and the longer
+    sequences are alternatives of it, in the layout of
+    :py:meth:`rajax.ast.RegexNode.generate_instructions`.
+    """
+    single = []
+    alternatives = []
+    for lo, hi in normalize_ranges(ranges):
+        for seq in sequences(lo, hi):
+            if len(seq) == 1:
+                single.append(Instruction('char', seq[0][0], seq[0][1]))
+            else:
+                alternatives.append([_byte_range(b_lo, b_hi)
+                                     for b_lo, b_hi in seq])
+    if single:
+        alternatives.insert(0, make_charset(single))
+    if not alternatives:
+        # An empty table never matches
+        return [Instruction('charset', 0)]
+
+    instr_list = []
+    jumps = []
+    for alternative in alternatives[:-1]:
+        split = Instruction('split', len(instr_list) + 1, 'TEMP')
+        instr_list.append(split)
+        instr_list.extend(alternative)
+        jump = Instruction('jmp', 'TEMP')
+        instr_list.append(jump)
+        jumps.append(jump)
+        split.arg2 = len(instr_list)
+    instr_list.extend(alternatives[-1])
+    for jump in jumps:
+        jump.arg1 = len(instr_list)
+    return instr_list
+
+
+def lower(instr_list, start=0):
+    """
+    Replace the character tests of a program with tests of UTF-8 bytes and
+    renumber its jump targets.
+
+    :param instr_list: A list of :py:class:`~rajax.instructions.Instruction`
+    :param start: Instructions before this one already test bytes, like the
+                  ``.*?`` loop of an unanchored program, and are kept as they
+                  are
+    :return: A new list of Instructions
+    """
+    n = len(instr_list)
+    new_pc = []
+    new_list = []
+    # Copied jumps, whose targets are still old pcs
+    jumps = []
+    pc = 0
+    while pc < n:
+        instr = instr_list[pc]
+        new_pc.append(len(new_list))
+        if pc < start or instr.cmd not in ('char', 'nchar', 'charset'):
+            copy = Instruction(instr.cmd, instr.arg1, instr.arg2)
+            if copy.cmd in ('split', 'jmp', 'repeat'):
+                jumps.append(copy)
+            new_list.append(copy)
+            pc += 1
+            continue
+        if instr.cmd == 'charset':
+            table = instr_list[pc + 1:pc + 1 + instr.arg1]
+            ranges = [(r.arg1, r.arg2) for r in table]
+            # Nothing jumps into a range table
+            new_pc.extend([len(new_list)] * len(table))
+            pc += 1 + len(table)
+        else:
+            ranges = _code_point_ranges(instr)
+            pc += 1
+        base = len(new_list)
+        for test in byte_test(ranges):
+            if test.cmd == 'split':
+                test.arg1 += base
+                test.arg2 += base
+            elif test.cmd == 'jmp':
+                test.arg1 += base
+            new_list.append(test)
+    new_pc.append(len(new_list))
+
+    for instr in jumps:
+        instr.arg1 = new_pc[min(instr.arg1, n)]
+        if instr.cmd == 'split':
+            instr.arg2 = new_pc[min(instr.arg2, n)]
+    return new_list
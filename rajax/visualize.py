@@ -46,21 +46,32 @@ class Node(object):
         return self.string
  
 
-node_count = 0
- 
+def ast_walk_tree(node, rank, subgraph_list=None, node_count=None):
+    """
+    Number the nodes of a tree in depth-first order and group them by depth.
+    Uses an explicit stack, so trees of any depth can be drawn.
 
-def ast_walk_tree(node, rank, subgraph_list=[]):
-    global node_count
-    node_count += 1
-    node.graph_id = str(node_count)
+    :param node_count: One-element list holding the last ``graph_id`` used
+    :return: ``[[Node, ...], ...]``, one list of nodes per depth
+    """
+    if subgraph_list is None:
+        subgraph_list = []
+    if node_count is None:
+        node_count = [0]
+    stack = [(node, rank)]
+    while stack:
+        node, rank = stack.pop()
+        node_count[0] += 1
+        node.graph_id = str(node_count[0])
 
-    if len(subgraph_list)-1 < rank:
-        subgraph_list.append([])
+        while len(subgraph_list)-1 < rank:
+            subgraph_list.append([])
 
-    subgraph_list[rank].append(node)
+        subgraph_list[rank].append(node)
 
-    for child in node.children:
-        ast_walk_tree(child, rank+1, subgraph_list)
+        # Reversed so that the first child is numbered next
+        for child in reversed(node.children):
+            stack.append((child, rank+1))
 
     return subgraph_list
 
@@ -76,10 +87,7 @@ def ast_dot(root, path, name="AST"):
     f = open(path, 'w')
     f.write(header_string % name)
 
-    global node_count
-    node_count = 0
-
-    subgraph_list = ast_walk_tree(root, 0, [])
+    subgraph_list = ast_walk_tree(root, 0)
     for subgraph in subgraph_list:
         f.write(subgraph_prefix)
         for node in subgraph:
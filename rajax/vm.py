@@ -0,0 +1,378 @@
+"""
+A Thompson/Pike-style simulation of the bytecode returned by
+:py:func:`rajax.cmd.parse`.
+
+Threads are kept in priority order and deduplicated by program counter at every
+step, so a run takes O(len(program) * len(input)) time no matter how the
+pattern was written. Matching is leftmost-first, like Perl and Python: the
+first arm of a ``split`` is preferred over the second.
+
+``^`` (``bol``) only matches at offset 0 of the input, even if ``pos`` is
+larger, and ``$`` (``eol``) only at ``endpos``.
+
+Programs with counted loops (``repeat``, from ``{m,n}``) give every thread a
+tuple of counters as well, and threads are deduplicated by program counter and
+counters, so a loop with an upper bound of ``n`` can multiply the number of
+threads by up to ``n``.
+
+Input may be a byte string, a unicode string, a ``bytearray``, an ``mmap`` or
+anything else that ``bytearray()`` accepts. An ``mmap`` is read in place rather
+than copied. Programs compiled with ``utf8=True`` expect UTF-8 encoded bytes,
+and the offsets they return count bytes. Every function returns a ``(start, end)`` tuple
+of offsets into the input, or ``None`` if there is no match, except
+:py:func:`match_set`, which reports which patterns of a program built by
+:py:func:`rajax.cmd.compile_set` matched.
+"""
+from __future__ import absolute_import
+
+import mmap
+
+from rajax.const import (
+    BOL,
+    CHAR,
+    CHARSET,
+    EOL,
+    JMP,
+    MARK,
+    MATCH,
+    NCHAR,
+    REPEAT,
+    SPLIT,
+    UNBOUNDED,
+    WILDCARD,
+)
+
+
+def codes(s):
+    """
+    Convert an input string into an indexable sequence of character codes
+
+    :param s: A ``str``, ``unicode``, ``bytearray``, ``mmap`` or buffer
+              object, or a result of this function, which is returned as is
+    :rtype: ``bytearray``, ``[int]`` or :py:class:`MappedCodes`
+    """
+    if isinstance(s, (bytearray, list, MappedCodes)):
+        return s
+    if isinstance(s, mmap.mmap):
+        return MappedCodes(s)
+    if isinstance(s, unicode):
+        return [ord(c) for c in s]
+    return bytearray(s)
+
+
+class MappedCodes(object):
+    """
+    The byte values of an ``mmap``, read from the mapping when indexed, so that
+    a large file is never copied into memory
+    """
+    __slots__ = ('buf',)
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def __len__(self):
+        return len(self.buf)
+
+    def __getitem__(self, i):
+        return ord(self.buf[i])
+
+
+def char_matches(opcode, arg1, arg2, c):
+    """
+    Return True if the ``char``/``nchar`` instruction ``(opcode, arg1, arg2)``
+    accepts the character code ``c``
+    """
+    if arg1 == WILDCARD:
+        hit = True
+    elif arg2:
+        hit = arg1 <= c <= arg2
+    else:
+        hit = c == arg1
+    if opcode == NCHAR:
+        return not hit
+    return hit
+
+
+def charset_matches(program, pc, c):
+    """
+    Return True if the ``charset`` instruction at ``pc`` accepts the character
+    code ``c``, by binary search of its range table
+    """
+    first = lo = pc + 1
+    hi = first + program[pc][1]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if program[mid][1] <= c:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo > first and c <= program[lo - 1][2]
+
+
+def step(program, pc, c):
+    """
+    Consume the character code ``c`` with the instruction at ``pc``.
+
+    :return: The program counter to continue at, or None if the thread dies
+    """
+    opcode, arg1, arg2 = program[pc]
+    if opcode == CHARSET:
+        if charset_matches(program, pc, c):
+            return pc + 1 + arg1
+        return None
+    if (opcode == CHAR or opcode == NCHAR) and char_matches(opcode, arg1,
+                                                            arg2, c):
+        return pc + 1
+    return None
+
+
+def initial_counters(program):
+    """
+    :return: The counters a thread starts with: a tuple of zeros, one per
+             level of nesting of ``repeat`` loops, or None if ``program`` has
+             no ``repeat`` instructions
+    """
+    depth = -1
+    for inst in program:
+        if inst[0] == REPEAT and inst[2] > depth:
+            depth = inst[2]
+    if depth < 0:
+        return None
+    return (0,) * (depth + 1)
+
+
+def new_marks(program, counters):
+    """:return: Empty ``marks`` for :py:func:`add_thread`"""
+    if counters is None:
+        return [-1] * len(program)
+    return {}
+
+
+def add_thread(program, thread_list, marks, stamp, pc, start, counters=None,
+               offset=None, at_end=False):
+    """
+    Follow ``jmp``, ``split``, ``repeat`` and zero-width instructions from
+    ``pc`` and append every reachable ``char``, ``nchar``, ``charset`` or
+    ``match`` instruction to ``thread_list`` as a ``(pc, start, counters)``
+    tuple, in priority order.
+
+    ``marks[pc] == stamp`` means ``pc`` is already in ``thread_list``, which is
+    what keeps the number of threads bounded by the length of the program.
+    Jump targets past the end of the program are dead ends.
+
+    :param counters: None, or for a program with ``repeat`` instructions, the
+                     thread's counters. ``marks`` is then a dict keyed by
+                     ``(pc, counters)``. See :py:func:`new_marks`.
+    :param offset: Input offset the threads are at, or None if it isn't known
+                   but isn't 0. ``bol`` only holds at offset 0, and ``mark``
+                   makes ``offset`` the start of the thread.
+    :param at_end: True if ``offset`` is the end of the input, which is where
+                   ``eol`` holds. If None, ``eol`` instructions are appended
+                   to ``thread_list`` for the caller to follow once it knows.
+    """
+    if counters is not None:
+        _add_counted_thread(program, thread_list, marks, stamp, pc, start,
+                            counters, offset, at_end)
+        return
+    n = len(program)
+    stack = [pc]
+    while stack:
+        pc = stack.pop()
+        if pc >= n or marks[pc] == stamp:
+            continue
+        marks[pc] = stamp
+        opcode, arg1, arg2 = program[pc]
+        if opcode == JMP:
+            stack.append(arg1)
+        elif opcode == SPLIT:
+            # Pushed in reverse so that arg1 is explored first
+            stack.append(arg2)
+            stack.append(arg1)
+        elif opcode == BOL:
+            if offset == 0:
+                stack.append(pc + 1)
+        elif opcode == EOL:
+            if at_end:
+                stack.append(pc + 1)
+            elif at_end is None:
+                thread_list.append((pc, start, None))
+        elif opcode == MARK:
+            # Everything reached from here starts at offset, and still comes
+            # before what is left on the stack
+            add_thread(program, thread_list, marks, stamp, pc + 1, offset,
+                       None, offset, at_end)
+        else:
+            thread_list.append((pc, start, None))
+
+
+def _add_counted_thread(program, thread_list, marks, stamp, pc, start,
+                        counters, offset, at_end):
+    n = len(program)
+    stack = [(pc, counters)]
+    while stack:
+        key = stack.pop()
+        pc, counters = key
+        if pc >= n or marks.get(key) == stamp:
+            continue
+        marks[key] = stamp
+        opcode, arg1, arg2 = program[pc]
+        if opcode == JMP:
+            stack.append((arg1, counters))
+        elif opcode == SPLIT:
+            stack.append((arg2, counters))
+            stack.append((arg1, counters))
+        elif opcode == REPEAT:
+            _, lo, hi = program[pc + 1]
+            count = counters[arg2] + 1
+            if count < lo:
+                stack.append((arg1, _set_counter(counters, arg2, count)))
+                continue
+            # Exiting resets the counter for the next time round
+            stack.append((pc + 2, _set_counter(counters, arg2, 0)))
+            if hi == UNBOUNDED:
+                # Past the lower bound the count no longer matters
+                stack.append((arg1, _set_counter(counters, arg2, lo)))
+            elif count < hi:
+                stack.append((arg1, _set_counter(counters, arg2, count)))
+        elif opcode == BOL:
+            if offset == 0:
+                stack.append((pc + 1, counters))
+        elif opcode == EOL:
+            if at_end:
+                stack.append((pc + 1, counters))
+            elif at_end is None:
+                thread_list.append((pc, start, counters))
+        elif opcode == MARK:
+            _add_counted_thread(program, thread_list, marks, stamp, pc + 1,
+                                offset, counters, offset, at_end)
+        else:
+            thread_list.append((pc, start, counters))
+
+
+def _set_counter(counters, i, value):
+    return counters[:i] + (value,) + counters[i + 1:]
+
+
+def run(program, s, pos=0, endpos=None, anchored=True, full=False,
+        stop=None):
+    """
+    Run ``program`` over ``s[pos:endpos]``.
+
+    :param anchored: If False, a new thread is started at every offset until a
+                     match is found, which finds the leftmost match in a
+                     single pass.
+    :param full: If True, a ``match`` instruction only counts at ``endpos``.
+    :param stop: Offset at which to give up, if the match is known to end
+                 there or before. Unlike a smaller ``endpos``, it doesn't move
+                 where ``$`` matches.
+    :return: ``(start, end)`` or ``None``
+    """
+    s = codes(s)
+    if endpos is None or endpos > len(s):
+        endpos = len(s)
+    if stop is None or stop > endpos:
+        stop = endpos
+    counters = initial_counters(program)
+    marks = new_marks(program, counters)
+    clist = []
+    matched = None
+    i = pos
+    while True:
+        if matched is None and (not anchored or i == pos):
+            add_thread(program, clist, marks, i, 0, i, counters, i,
+                       i == endpos)
+        if not clist and (anchored or matched is not None):
+            break
+        nlist = []
+        c = s[i] if i < endpos else None
+        for pc, start, counts in clist:
+            if program[pc][0] == MATCH:
+                if not full or i == endpos:
+                    matched = (start, i)
+                    # Lower-priority threads can't win any more
+                    break
+            elif c is not None:
+                nxt = step(program, pc, c)
+                if nxt is not None:
+                    add_thread(program, nlist, marks, i + 1, nxt, start,
+                               counts, i + 1, i + 1 == endpos)
+        if i >= stop:
+            break
+        clist = nlist
+        i += 1
+    return matched
+
+
+def match(program, s, pos=0, endpos=None):
+    """
+    Match ``program`` against the beginning of ``s[pos:endpos]``
+
+    :param program: A list of opcode tuples, probably returned by
+                    :py:func:`rajax.cmd.parse`
+    :param s: Input string
+    :return: ``(start, end)`` of the leftmost-first match or ``None``
+    """
+    return run(program, s, pos, endpos)
+
+
+def fullmatch(program, s, pos=0, endpos=None):
+    """
+    Like :py:func:`match`, but the match must extend all the way to
+    ``endpos``
+    """
+    return run(program, s, pos, endpos, full=True)
+
+
+def search(program, s, pos=0, endpos=None):
+    """
+    Find the leftmost-first match of ``program`` anywhere in
+    ``s[pos:endpos]``
+    """
+    return run(program, s, pos, endpos, anchored=False)
+
+
+def match_set(program, s, pos=0, endpos=None, anchored=True, full=False,
+              earliest=False):
+    """
+    Find every pattern of a program built by :py:func:`rajax.cmd.compile_set`
+    that matches ``s[pos:endpos]``, in one pass.
+
+    :param anchored: If False, a pattern may match anywhere, not only at
+                     ``pos``
+    :param full: If True, a pattern only counts if it matches up to ``endpos``
+    :param earliest: If True, stop as soon as any pattern has matched. The
+                     result then only contains the patterns that matched at
+                     that offset.
+    :return: Sorted list of pattern ids
+    """
+    s = codes(s)
+    if endpos is None or endpos > len(s):
+        endpos = len(s)
+    n_patterns = sum(1 for inst in program if inst[0] == MATCH)
+    counters = initial_counters(program)
+    marks = new_marks(program, counters)
+    found = set()
+    clist = []
+    i = pos
+    while True:
+        if not anchored or i == pos:
+            add_thread(program, clist, marks, i, 0, i, counters, i,
+                       i == endpos)
+        nlist = []
+        c = s[i] if i < endpos else None
+        for pc, start, counts in clist:
+            if program[pc][0] == MATCH:
+                if not full or i == endpos:
+                    found.add(program[pc][1])
+            elif c is not None:
+                nxt = step(program, pc, c)
+                if nxt is not None:
+                    add_thread(program, nlist, marks, i + 1, nxt, start,
+                               counts, i + 1, i + 1 == endpos)
+        if i >= endpos or (earliest and found) or len(found) == n_patterns:
+            break
+        if not nlist and anchored:
+            break
+        clist = nlist
+        i += 1
+    return sorted(found)
@@ -7,6 +7,9 @@ try:
           'ply>=3.4',
           ],
         'provides': ['rajax'],
+        'extras_require': {
+          'batch': ['numpy'],
+          },
         'zip_safe': False
         }
 except ImportError:
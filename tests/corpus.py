@@ -0,0 +1,73 @@
+"""
+Random patterns for the differential tests.
+
+Every construct the parsers accept shows up, and quantifiers are often applied
+straight to a quantified group, so that bodies which can match the empty
+string, like ``(a?|b)+``, are common.
+"""
+import random
+
+ATOMS = ['a', 'b', 'c', '1', '.', '[a-c]', '[^b]', '[^\\Wb]', '\\d', '\\w',
+         '\\*', '[-.]', '^', '$']
+
+QUANTIFIERS = ['', '', '*', '+', '?', '{2}', '{0,}', '{1,}', '{0,1}',
+               '{1,3}', '{2,}']
+
+#: Characters the patterns above test for
+TEXT = 'abc1*.'
+
+#: Patterns that neither parser accepts
+BAD_PATTERNS = ['(', ')', 'a(b', 'a)', '[a', '[]', '*a', 'a|*', '+', '\\',
+                'a\\', '[\\', '[^a\\', '\\q', '()', 'a||b', 'a{3,2}',
+                'a{70000}']
+
+#: Characters that break a pattern when inserted
+BREAKERS = '()[]|*+?{}\\^-,$.'
+
+
+def pattern(rnd, depth=0):
+    """A random pattern"""
+    branches = []
+    for _ in xrange(rnd.randint(1, 3 if depth == 0 else 2)):
+        items = []
+        for _ in xrange(rnd.randint(1, 3)):
+            if depth < 3 and rnd.random() < 0.15:
+                # Quantifiers stacked on one body, which the simplifier
+                # collapses
+                atom = '((%s)%s)%s' % (pattern(rnd, depth + 1),
+                                       rnd.choice(QUANTIFIERS[2:]),
+                                       rnd.choice(QUANTIFIERS[2:]))
+            elif depth < 3 and rnd.random() < 0.35:
+                # A group is usually quantified
+                atom = '(%s)%s' % (pattern(rnd, depth + 1),
+                                   rnd.choice(QUANTIFIERS[2:]))
+            else:
+                atom = rnd.choice(ATOMS)
+                if atom not in ('^', '$'):
+                    atom += rnd.choice(QUANTIFIERS)
+            items.append(atom)
+        branches.append(''.join(items))
+    return '|'.join(branches)
+
+
+def patterns(count, seed=0):
+    """``count`` random patterns, the same ones for the same ``seed``"""
+    rnd = random.Random(seed)
+    return [pattern(rnd) for _ in xrange(count)]
+
+
+def texts(rnd, count, max_len=6):
+    """``count`` random strings made of :py:data:`TEXT`"""
+    return [''.join(rnd.choice(TEXT) for _ in xrange(rnd.randint(0, max_len)))
+            for _ in xrange(count)]
+
+
+def damaged(rnd, pattern):
+    """
+    ``pattern`` cut short at a random place, and with one of
+    :py:data:`BREAKERS` inserted at another; either may still be valid
+    """
+    cut = rnd.randint(0, len(pattern))
+    at = rnd.randint(0, len(pattern))
+    return [pattern[:cut],
+            pattern[:at] + rnd.choice(BREAKERS) + pattern[at:]]
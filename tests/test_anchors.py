@@ -0,0 +1,72 @@
+"""
+``^`` and ``$`` must only match at the ends of the input, and a program
+compiled with ``anchored=False`` must find, from one start, the match that
+:py:func:`rajax.vm.search` finds by trying every offset.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.dfa import LazyDFA
+from tests.corpus import patterns, texts
+
+
+class AnchorTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_anchors(self):
+        cases = [
+            ('^a', 'ba', None),
+            ('^a', 'ab', (0, 1)),
+            ('a$', 'ab', None),
+            ('a$', 'ba', (1, 2)),
+            ('^$', '', (0, 0)),
+            ('^$', 'a', None),
+            ('b|^a', 'cab', (2, 3)),
+            ('(^|c)a', 'bca', (1, 3)),
+            ('a($|b)', 'aab', (1, 3)),
+            ('a*$', 'aab', (3, 3)),
+            ('^a{2}$', 'aa', (0, 2)),
+        ]
+        for pattern, s, want in cases:
+            program = cmd.parse(pattern, use_cache=False)
+            self.assertEqual(vm.search(program, s), want, (pattern, s))
+            self.assertEqual(LazyDFA(program).search(s), want, (pattern, s))
+        # ^ only matches at offset 0 even if the run starts later
+        program = cmd.parse('^a', use_cache=False)
+        self.assertEqual(vm.search(program, 'aa', 1), None)
+        # and $ only at endpos
+        program = cmd.parse('a$', use_cache=False)
+        self.assertEqual(vm.search(program, 'aab', 0, 2), (1, 2))
+
+    def test_starts_with_bol(self):
+        # Every match starts at ^, so no .*? loop is needed
+        for pattern in ('^ab', '^a|^b', '(^a)b*'):
+            self.assertEqual(cmd.parse(pattern, use_cache=False,
+                                       anchored=False),
+                             cmd.parse(pattern, use_cache=False), pattern)
+        self.assertNotEqual(cmd.parse('^a|b', use_cache=False,
+                                      anchored=False),
+                            cmd.parse('^a|b', use_cache=False))
+
+    def test_generated(self):
+        rnd = random.Random(0)
+        for pattern in patterns(800, seed=13):
+            anchored = cmd.parse(pattern, use_cache=False)
+            unanchored = cmd.parse(pattern, use_cache=False, anchored=False)
+            dfa = LazyDFA(unanchored)
+            for s in texts(rnd, 6):
+                want = vm.search(anchored, s)
+                self.assertEqual(vm.match(unanchored, s), want,
+                                 '%r %r' % (pattern, s))
+                self.assertEqual(dfa.match(s), want, '%r %r' % (pattern, s))
+                pos = rnd.randint(0, len(s))
+                self.assertEqual(vm.match(unanchored, s, pos),
+                                 vm.search(anchored, s, pos),
+                                 '%r %r %d' % (pattern, s, pos))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+:py:class:`rajax.batch.BatchMatcher` must give, for every string of a batch,
+what :py:class:`rajax.dfa.LazyDFA` gives for that string alone.
+"""
+import random
+import unittest
+
+from rajax import batch, cmd, parser
+from rajax.dfa import LazyDFA, TooManyStates
+from tests.corpus import patterns, texts
+
+
+@unittest.skipIf(batch.numpy is None, 'NumPy is not installed')
+class BatchMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def matchers(self, programs, **kwargs):
+        """``(LazyDFA, BatchMatcher)`` for the programs a table fits"""
+        for program in programs:
+            dfa = LazyDFA(program)
+            if dfa.counted:
+                continue
+            try:
+                yield dfa, batch.BatchMatcher(program, max_states=300,
+                                              **kwargs)
+            except TooManyStates:
+                continue
+
+    def test_match(self):
+        rnd = random.Random(0)
+        programs = [cmd.parse(p, use_cache=False)
+                    for p in patterns(300, seed=21)]
+        for dfa, matcher in self.matchers(programs):
+            strings = texts(rnd, 20, max_len=12)
+            got = matcher.match(strings)
+            for s, matched in zip(strings, got):
+                self.assertEqual(bool(matched), dfa.match(s) is not None,
+                                 repr(s))
+
+    def test_match_ids(self):
+        rnd = random.Random(1)
+        corpus = patterns(300, seed=22)
+        programs = [cmd.compile_set(corpus[i:i + 3], use_cache=False)
+                    for i in xrange(0, len(corpus), 3)]
+        for anchored in (True, False):
+            for full in (False, True):
+                for dfa, matcher in self.matchers(programs, anchored=anchored,
+                                                  full=full):
+                    strings = texts(rnd, 20, max_len=12) + [u'a\xe9']
+                    got = matcher.match_ids(strings)
+                    for s, row in zip(strings, got):
+                        want = dfa.match_set(
+                            s.encode('utf-8') if isinstance(s, unicode)
+                            else s, anchored=anchored, full=full)
+                        self.assertEqual(list(row.nonzero()[0]), want,
+                                         '%r anchored=%r full=%r'
+                                         % (s, anchored, full))
+
+    def test_empty_batch(self):
+        matcher = batch.BatchMatcher(cmd.parse('ab', use_cache=False))
+        self.assertEqual(matcher.match_ids([]).shape, (0, 1))
+        self.assertEqual(list(matcher.match(['', 'ab', 'a'])),
+                         [False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+:py:class:`rajax.cache.CompileCache` must stay within its limits, evict the
+least recently used programs first and never hand out its own copy of a
+program. :py:class:`rajax.cache.DiskCache` must only load entries written by
+the same format, and keep its directory under its size limit.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from rajax import cache as cache_module
+from rajax import cmd, parser
+from rajax.cache import CompileCache, DiskCache, program_size
+
+OPTIONS = {'opt_level': 1}
+
+
+class CompileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+        self.compiled = []
+
+    def compile(self, s, **options):
+        """A stand-in for cmd._compile: one instruction per character"""
+        self.compiled.append(s)
+        return [(0, ord(c), 0) for c in s]
+
+    def get(self, cache, s):
+        return cache.get(s, OPTIONS, self.compile)
+
+    def test_max_entries(self):
+        cache = CompileCache(max_entries=2)
+        for s in ('ab', 'cd', 'ab', 'ef'):
+            self.get(cache, s)
+        # 'cd' was used least recently
+        self.assertEqual(self.compiled, ['ab', 'cd', 'ef'])
+        self.assertEqual(len(cache), 2)
+        self.get(cache, 'ab')
+        self.get(cache, 'cd')
+        self.assertEqual(self.compiled, ['ab', 'cd', 'ef', 'cd'])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+                         (2, 4, 2))
+
+    def test_max_bytes(self):
+        size = program_size([(0, ord(c), 0) for c in 'abc'])
+        cache = CompileCache(max_bytes=2 * size)
+        for s in ('abc', 'def', 'ghi'):
+            self.get(cache, s)
+            self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.get(cache, 'def')
+        self.get(cache, 'abc')
+        self.assertEqual(self.compiled, ['abc', 'def', 'ghi', 'abc'])
+
+        # Too big to cache at all
+        cache.get('x' * 100, OPTIONS, self.compile)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+
+        cache.resize(max_bytes=size)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()['bytes'], size)
+
+    def test_hits_and_misses(self):
+        cache = CompileCache()
+        self.get(cache, 'ab')
+        self.get(cache, 'ab')
+        cache.get('ab', {'opt_level': 0}, self.compile)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_caller_modifies_program(self):
+        cache = CompileCache()
+        program = cmd.parse('ab*', use_cache=False)
+        first = cache.get('ab*', OPTIONS, lambda s, **o: list(program))
+        first.append(('junk',))
+        second = cache.get('ab*', OPTIONS, self.compile)
+        self.assertEqual(second, program)
+        second[0] = ('junk',)
+        del second[1:]
+        self.assertEqual(cache.get('ab*', OPTIONS, self.compile), program)
+        self.assertEqual(self.compiled, [])
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+        self.dir = tempfile.mkdtemp()
+        self.format = cache_module.FORMAT
+
+    def tearDown(self):
+        cache_module.FORMAT = self.format
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        for s in ('ab*', u'\u00e9+', '(a|b){2,3}'):
+            program = cmd.parse(s, use_cache=False)
+            DiskCache(self.dir).put(s, OPTIONS, program)
+            # Read back by another instance, as another process would
+            self.assertEqual(DiskCache(self.dir).get(s, OPTIONS), program)
+        self.assertEqual(DiskCache(self.dir).get('ab*', {'opt_level': 0}),
+                         None)
+
+    def test_other_format(self):
+        disk = DiskCache(self.dir)
+        program = cmd.parse('ab*', use_cache=False)
+        cache_module.FORMAT = ('0.0',) + self.format[1:]
+        disk.put('ab*', OPTIONS, program)
+        cache_module.FORMAT = self.format
+        self.assertEqual(disk.get('ab*', OPTIONS), None)
+
+        # An entry that can't be unpacked is deleted
+        path = disk._entry_path('ab*', OPTIONS)
+        with open(path, 'wb') as f:
+            f.write('not a program')
+        self.assertEqual(disk.get('ab*', OPTIONS), None)
+        self.assertFalse(os.path.exists(path))
+
+    def test_prune(self):
+        disk = DiskCache(self.dir, max_bytes=4096)
+        for i in xrange(200):
+            s = 'a{%d}b' % i
+            disk.put(s, OPTIONS, cmd.parse(s, use_cache=False))
+            self.assertLessEqual(disk.size(), disk.max_bytes)
+        # The newest entries are kept
+        self.assertNotEqual(disk.get('a{199}b', OPTIONS), None)
+        self.assertEqual(disk.get('a{0}b', OPTIONS), None)
+
+    def test_replace(self):
+        disk = DiskCache(self.dir)
+        programs = [cmd.parse(s, use_cache=False) for s in ('a', 'a{2,9}b')]
+        disk.put('b', OPTIONS, programs[0])
+        disk.put('b', OPTIONS, programs[0])
+        self.assertEqual(disk._approx_bytes, disk.size())
+        # Writing the same key again only counts the difference in size
+        for program in programs * 3:
+            disk.put('a', OPTIONS, program)
+            self.assertEqual(disk._approx_bytes, disk.size())
+        self.assertEqual(disk.get('a', OPTIONS), programs[1])
+
+    def test_stale_tmp(self):
+        disk = DiskCache(self.dir)
+        stale = os.path.join(self.dir, disk.tmp_prefix + 'stale')
+        fresh = os.path.join(self.dir, disk.tmp_prefix + 'fresh')
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write('x' * 100)
+        old = time.time() - cache_module.STALE_TMP_AGE - 1
+        os.utime(stale, (old, old))
+        disk.prune()
+        # A file another process is still writing is left alone
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+A bracket expression of several disjoint ranges compiles to one ``charset n``
+followed by ``n`` sorted, merged ``range`` records, and
+:py:func:`rajax.vm.charset_matches` must accept exactly the characters in
+them.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.const import CHAR, CHARSET, MATCH, RANGE
+from rajax.instructions import (
+    Instruction,
+    from_buffer,
+    make_charset,
+    normalize_ranges,
+    to_bytes,
+)
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+#: Nonmatching lists are complemented within 0 to this code point
+NEGATED_LIMIT = 0x10000
+
+
+def bracket(rnd):
+    """A random bracket expression and the ``(lo, hi)`` ranges it lists"""
+    parts = []
+    ranges = []
+    for _ in xrange(rnd.randint(1, 6)):
+        lo, hi = sorted(rnd.sample(ALPHABET, 2))
+        if rnd.random() < 0.5:
+            hi = lo
+        parts.append(lo if lo == hi else '%s-%s' % (lo, hi))
+        ranges.append((ord(lo), ord(hi)))
+    return '[%s]' % ''.join(parts), ranges
+
+
+def complement(ranges, limit=NEGATED_LIMIT):
+    """The ranges of ``0..limit`` not in the normalized ``ranges``"""
+    result = []
+    lo = 0
+    for r_lo, r_hi in ranges:
+        if r_lo > lo:
+            result.append((lo, r_lo - 1))
+        lo = r_hi + 1
+    if lo <= limit:
+        result.append((lo, limit))
+    return result
+
+
+def table(program):
+    """The ``(lo, hi)`` records of the ``charset`` at the start of a program"""
+    opcode, n, _ = program[0]
+    assert opcode == CHARSET
+    records = program[1:n + 1]
+    assert all(r[0] == RANGE for r in records)
+    return [(lo, hi) for _, lo, hi in records]
+
+
+def boundaries(ranges):
+    """Each side of every range boundary, within the code point space"""
+    codes = set()
+    for lo, hi in ranges:
+        codes.update([lo - 1, lo, hi, hi + 1])
+    return sorted(c for c in codes if c >= 0)
+
+
+class NormalizeRangesTest(unittest.TestCase):
+
+    def test_normalize(self):
+        cases = [
+            ([], []),
+            ([(5, 9)], [(5, 9)]),
+            ([(5, 9), (1, 2)], [(1, 2), (5, 9)]),
+            # Overlapping, touching, contained and repeated ranges merge
+            ([(1, 4), (3, 8)], [(1, 8)]),
+            ([(1, 4), (5, 8)], [(1, 8)]),
+            ([(1, 9), (3, 4)], [(1, 9)]),
+            ([(2, 2), (2, 2), (4, 4)], [(2, 2), (4, 4)]),
+            ([(7, 7), (1, 3), (4, 6), (9, 10)], [(1, 7), (9, 10)]),
+        ]
+        for ranges, want in cases:
+            self.assertEqual(normalize_ranges(ranges), want, ranges)
+
+    def test_make_charset(self):
+        def make(*chars):
+            instrs = make_charset([Instruction('char', *c) for c in chars])
+            return [i.to_opcode() for i in instrs]
+        self.assertEqual(make(('a',), ('b', 'd')),
+                         [(CHAR, ord('a'), ord('d'))])
+        self.assertEqual(make(('c',), ('c',)), [(CHAR, ord('c'), 0)])
+        self.assertEqual(make(('x',), ('a', 'c')),
+                         [(CHARSET, 2, 0), (RANGE, ord('a'), ord('c')),
+                          (RANGE, ord('x'), ord('x'))])
+
+
+class CharsetTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def check(self, pattern, ranges):
+        """``pattern`` compiles to a charset of ``ranges``, which must match"""
+        program = cmd.parse(pattern, use_cache=False)
+        if len(ranges) == 1:
+            # A single range needs no table
+            self.assertEqual(len(program), 2, pattern)
+            return program
+        self.assertEqual(table(program), ranges, pattern)
+        self.assertEqual(program[len(ranges) + 1][0], MATCH, pattern)
+        for c in boundaries(ranges):
+            want = any(lo <= c <= hi for lo, hi in ranges)
+            self.assertEqual(vm.charset_matches(program, 0, c), want,
+                             '%s %#x' % (pattern, c))
+            self.assertEqual(vm.fullmatch(program, [c]) is not None, want,
+                             '%s %#x' % (pattern, c))
+        return program
+
+    def test_generated(self):
+        rnd = random.Random(6)
+        for _ in xrange(300):
+            pattern, ranges = bracket(rnd)
+            ranges = normalize_ranges(ranges)
+            self.check(pattern, ranges)
+            self.check('[^%s]' % pattern[1:-1], complement(ranges))
+
+    def test_negated_limit(self):
+        program = self.check('[^a]', [(0, 0x60), (0x62, NEGATED_LIMIT)])
+        self.assertTrue(vm.charset_matches(program, 0, NEGATED_LIMIT))
+        self.assertFalse(vm.charset_matches(program, 0, NEGATED_LIMIT + 1))
+        self.check('[^0-9a-z]', [(0, ord('0') - 1), (ord('9') + 1, 0x60),
+                                 (ord('z') + 1, NEGATED_LIMIT)])
+        # Characters at or over the limit in the list are simply left out
+        self.check(u'[^a\U00010000]', [(0, 0x60), (0x62, 0xFFFF)])
+        self.check(u'[^a\uffff]', [(0, 0x60), (0x62, 0xFFFE),
+                                   (NEGATED_LIMIT, NEGATED_LIMIT)])
+
+    def test_packed(self):
+        rnd = random.Random(7)
+        for _ in xrange(100):
+            pattern, ranges = bracket(rnd)
+            for s in (pattern, '[^%s]' % pattern[1:-1], '(%s|x)+z' % pattern):
+                program = cmd.parse(s, use_cache=False)
+                packed = from_buffer(to_bytes(program))
+                self.assertEqual(packed.unpack(), program, s)
+                pcs = [pc for pc, inst in enumerate(program)
+                       if inst[0] == CHARSET]
+                for pc in pcs:
+                    for c in boundaries(table(program[pc:])):
+                        self.assertEqual(
+                            vm.charset_matches(packed, pc, c),
+                            vm.charset_matches(program, pc, c),
+                            '%s %#x' % (s, c))
+
+
+if __name__ == '__main__':
+    unittest.main()
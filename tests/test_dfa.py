@@ -0,0 +1,104 @@
+"""
+:py:class:`rajax.dfa.LazyDFA` must keep its cache within ``max_bytes`` and
+still find what :py:mod:`rajax.vm` finds.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.dfa import LazyDFA
+from tests.corpus import patterns, texts
+
+# Needs a state for every combination of the last 9 characters
+MANY_STATES = '(a|b)*a' + '(a|b)' * 8
+
+
+class LazyDFATest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_transitions_count(self):
+        # Two states, but a transition for every byte
+        program = cmd.parse('[^x]*x', use_cache=False)
+        text = ''.join(chr(i) for i in xrange(256) if chr(i) != 'x') * 3
+        for eviction in ('flush', 'lru'):
+            dfa = LazyDFA(program, max_bytes=4096, eviction=eviction,
+                          min_chars_per_state=0)
+            for s in (text + 'x', text[::-1] + 'x', text):
+                self.assertEqual(dfa.search(s), vm.search(program, s))
+                self.assertLessEqual(dfa.cache_bytes, dfa.max_bytes)
+                # Each reset makes room for many transitions
+                self.assertLess(dfa.stats['resets'], dfa.stats['misses'] // 20)
+
+    def test_code_points(self):
+        # The DFA hands the NFA input that it has already converted
+        program = cmd.parse(u'[^x]*x', use_cache=False)
+        s = u''.join(unichr(0x100 + i) for i in xrange(300)) + u'x'
+        self.assertEqual(LazyDFA(program).search(s), (0, 301))
+        self.assertEqual(LazyDFA(program).search(s), vm.search(program, s))
+
+    def assertSameMatches(self, dfa, program, s, msg):
+        for name in ('match', 'fullmatch', 'search'):
+            self.assertEqual(getattr(dfa, name)(s),
+                             getattr(vm, name)(program, s),
+                             '%s %s %r' % (name, msg, s))
+        self.assertLessEqual(dfa.cache_bytes, dfa.max_bytes)
+
+    def test_generated(self):
+        rnd = random.Random(0)
+        for pattern in patterns(600, seed=23):
+            program = cmd.parse(pattern, use_cache=False)
+            # One DFA for all of the texts, so states are shared between them
+            dfas = [LazyDFA(program)]
+            for eviction in ('flush', 'lru'):
+                dfas.append(LazyDFA(program, max_bytes=1024,
+                                    eviction=eviction))
+            for s in texts(rnd, 8):
+                for dfa in dfas:
+                    self.assertSameMatches(dfa, program, s, '%r %s' % (
+                        pattern, dfa.eviction))
+
+    def test_eviction(self):
+        program = cmd.parse(MANY_STATES, use_cache=False)
+        rnd = random.Random(1)
+        s = ''.join(rnd.choice('ab') for _ in xrange(3000))
+        for eviction in ('flush', 'lru'):
+            dfa = LazyDFA(program, max_bytes=8192, eviction=eviction,
+                          min_chars_per_state=0)
+            self.assertSameMatches(dfa, program, s, eviction)
+            self.assertSameMatches(dfa, program, s + 'b' * 9, eviction)
+            self.assertGreater(dfa.stats['evictions'], 0)
+            self.assertEqual(dfa.stats['fallbacks'], 0)
+
+    def test_thrashing(self):
+        # Far fewer characters per state built than asked for: the search is
+        # handed to the VM
+        program = cmd.parse(MANY_STATES, use_cache=False)
+        rnd = random.Random(2)
+        s = ''.join(rnd.choice('ab') for _ in xrange(3000))
+        for eviction in ('flush', 'lru'):
+            dfa = LazyDFA(program, max_bytes=8192, eviction=eviction,
+                          min_chars_per_state=1000)
+            self.assertEqual(dfa.fullmatch(s), vm.fullmatch(program, s))
+            self.assertEqual(dfa.stats['fallbacks'], 1)
+            set_program = cmd.compile_set([MANY_STATES, 'b{3}'],
+                                          use_cache=False)
+            dfa = LazyDFA(set_program, max_bytes=8192, eviction=eviction,
+                          min_chars_per_state=1000)
+            self.assertEqual(dfa.match_set(s, full=True),
+                             vm.match_set(set_program, s, full=True))
+            self.assertEqual(dfa.stats['fallbacks'], 1)
+
+    def test_counted(self):
+        # Counted loops are always run by the VM
+        program = cmd.parse('(a|b){2,40}c', use_cache=False)
+        dfa = LazyDFA(program)
+        self.assertTrue(dfa.counted)
+        for s in ('abc', 'ab' * 30 + 'c', 'xac', 'a' * 41 + 'c'):
+            self.assertSameMatches(dfa, program, s, 'counted')
+        self.assertEqual(dfa.stats['states'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+``rajax grep`` names files the way GNU grep does.
+"""
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+from rajax import grep
+
+
+class GrepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'f')
+        with open(self.path, 'wb') as f:
+            f.write('xa\nb\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_grep(self, args, stdin=''):
+        saved = sys.stdin, sys.stdout
+        sys.stdin, sys.stdout = StringIO.StringIO(stdin), StringIO.StringIO()
+        try:
+            status = grep.main(args)
+            return status, sys.stdout.getvalue()
+        finally:
+            sys.stdin, sys.stdout = saved
+
+    def test_stdin_name(self):
+        self.assertEqual(self.run_grep(['-l', 'a'], 'ab\nq\n'),
+                         (0, '(standard input)\n'))
+        self.assertEqual(self.run_grep(['a', '-', self.path], 'ab\nq\n'),
+                         (0, '(standard input):ab\n%s:xa\n' % self.path))
+        self.assertEqual(self.run_grep(['-l', 'a', '-', self.path], 'q\n'),
+                         (0, '%s\n' % self.path))
+
+    def test_no_match(self):
+        self.assertEqual(self.run_grep(['-c', 'z'], 'ab\n'), (1, '0\n'))
+
+    def test_newline_in_pattern(self):
+        # Lines are matched without their newline, so a pattern that needs
+        # one matches nothing, even where the newline is required literal text
+        with open(self.path, 'wb') as f:
+            f.write('xa\nb\nc\n')
+        for pattern in ('\\n', 'a\\nb', '[\\n]'):
+            self.assertEqual(self.run_grep(['-n', pattern, self.path]),
+                             (1, ''), pattern)
+            self.assertEqual(self.run_grep(['-v', pattern, self.path]),
+                             (0, 'xa\nb\nc\n'), pattern)
+            self.assertEqual(self.run_grep(['-vc', pattern], 'xa\nb\n'),
+                             (0, '2\n'), pattern)
+        self.assertEqual(self.run_grep(['-n', 'a|\\n', self.path]),
+                         (0, '1:xa\n'))
+        self.assertEqual(self.run_grep(['-v', 'a|\\n', self.path]),
+                         (0, 'b\nc\n'))
@@ -0,0 +1,65 @@
+"""
+Patterns far longer than the recursion limit must compile with both parsers:
+long literals, wide alternations and deeply nested groups.
+"""
+import sys
+import unittest
+
+from rajax import cmd, parser, vm
+
+BACKENDS = ('ply', 'rd')
+
+# Deeper than the recursion limit, to be sure nothing recurses on it
+DEPTH = 3 * sys.getrecursionlimit()
+
+
+class LongPatternTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def compile(self, pattern):
+        """The program for ``pattern``, the same from both parsers"""
+        programs = [cmd.parse(pattern, use_cache=False, backend=backend)
+                    for backend in BACKENDS]
+        self.assertEqual(programs[0], programs[1])
+        return programs[0]
+
+    def test_literal(self):
+        program = self.compile('ab' * 5000)
+        self.assertEqual(vm.match(program, 'ab' * 5000 + 'c'), (0, 10000))
+        self.assertEqual(vm.match(program, 'ab' * 4999), None)
+
+    def test_alternation(self):
+        words = ['w%04d' % i for i in xrange(5000)]
+        program = self.compile('|'.join(words))
+        self.assertEqual(vm.fullmatch(program, 'w4999'), (0, 5))
+        self.assertEqual(vm.fullmatch(program, 'w5000'), None)
+
+    def test_nested_concatenation(self):
+        # a(a(a(...))) is a concatenation nested DEPTH deep
+        program = self.compile('(a' * DEPTH + ')' * DEPTH)
+        self.assertEqual(vm.fullmatch(program, 'a' * DEPTH), (0, DEPTH))
+        self.assertEqual(vm.match(program, 'a' * (DEPTH - 1)), None)
+
+    def test_nested_groups(self):
+        program = self.compile('(' * DEPTH + 'a|b' + ')' * DEPTH + 'c')
+        self.assertEqual(vm.fullmatch(program, 'bc'), (0, 2))
+        program = self.compile('((a)*' * (DEPTH // 3) + ')' * (DEPTH // 3))
+        self.assertEqual(vm.fullmatch(program, 'aaa'), (0, 3))
+
+    def test_nested_errors(self):
+        # Both parsers report an unclosed group at the end, however deep
+        for pattern in ('(' * DEPTH + 'a', '(a' * DEPTH + ')' * DEPTH + ')'):
+            errors = []
+            for backend in BACKENDS:
+                try:
+                    cmd.parse(pattern, use_cache=False, backend=backend)
+                except TypeError as e:
+                    errors.append(str(e))
+            self.assertEqual(len(errors), 2)
+            self.assertEqual(errors[0], errors[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
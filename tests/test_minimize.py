@@ -0,0 +1,93 @@
+"""
+Codes in the same :py:class:`rajax.alphabet.Alphabet` class must be
+indistinguishable to the program, and a table minimized by
+:py:meth:`rajax.dfa.DFATable.minimize` must scan exactly like the table it
+came from.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.alphabet import Alphabet
+from rajax.dfa import LazyDFA, TooManyStates
+from tests.corpus import patterns, texts
+
+
+class AlphabetTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_classes(self):
+        alphabet = Alphabet(cmd.parse('[a-z]+[0-9]'), size=256)
+        self.assertEqual(alphabet.starts, [0, 48, 58, 97, 123])
+        self.assertEqual(alphabet.classify(ord('q')), 3)
+        self.assertEqual(alphabet.byte_classes[ord('5')], 1)
+        self.assertEqual(len(Alphabet(cmd.parse('.*'))), 1)
+
+    def test_generated(self):
+        # Every instruction treats the codes of a class like its first one
+        for pattern in patterns(300, seed=18) + [u'[\xe9-\u20ac]x']:
+            program = cmd.parse(pattern, use_cache=False)
+            alphabet = Alphabet(program)
+            ends = [start - 1 for start in alphabet.starts[1:]]
+            ends.append(alphabet.size - 1)
+            for cls, (lo, hi) in enumerate(zip(alphabet.starts, ends)):
+                for c in set([lo + 1, (lo + hi) // 2, hi]):
+                    if c > hi:
+                        continue
+                    self.assertEqual(alphabet.classify(c), cls)
+                    for pc in xrange(len(program)):
+                        self.assertEqual(vm.step(program, pc, c),
+                                         vm.step(program, pc, lo),
+                                         '%r %d %d' % (pattern, pc, c))
+            self.assertEqual(Alphabet(program, 256).byte_classes,
+                             [alphabet.classify(c) for c in xrange(256)])
+
+
+class MinimizeTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def assertSameScans(self, dfa, strings, **kwargs):
+        try:
+            table = dfa.table(minimize=False, max_states=300, **kwargs)
+        except TooManyStates:
+            return
+        small = table.minimize()
+        self.assertLessEqual(len(small), len(table))
+        # Nothing is left to merge
+        self.assertEqual(len(small.minimize()), len(small))
+        for s in strings:
+            self.assertEqual(small.scan(s)[1:], table.scan(s)[1:], repr(s))
+
+    def test_generated(self):
+        rnd = random.Random(0)
+        for pattern in patterns(400, seed=19):
+            dfa = LazyDFA(cmd.parse(pattern, use_cache=False))
+            if dfa.counted:
+                continue
+            strings = texts(rnd, 8, max_len=10)
+            for anchored in (True, False):
+                self.assertSameScans(dfa, strings, anchored=anchored)
+
+    def test_sets(self):
+        rnd = random.Random(1)
+        corpus = [p for p in patterns(200, seed=20)
+                  if not LazyDFA(cmd.parse(p, use_cache=False)).counted]
+        for i in xrange(0, len(corpus), 3):
+            dfa = LazyDFA(cmd.compile_set(corpus[i:i + 3], use_cache=False))
+            self.assertSameScans(dfa, texts(rnd, 8, max_len=10),
+                                 anchored=False, cut=False)
+
+    def test_merges(self):
+        # After a and after c the same b is needed: the start, one state for
+        # both, the match and the dead state
+        dfa = LazyDFA(cmd.parse('ab|cb', use_cache=False))
+        self.assertEqual(len(dfa.table(minimize=False)), 5)
+        self.assertEqual(len(dfa.table()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+:py:func:`rajax.optimize.optimize` must thread jumps, fold ``split``s and
+remove dead code without changing what a program matches, leave every jump
+target inside the program, and count exactly the changes it made.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.instructions import Instruction, serialize
+from rajax.optimize import optimize, thread_jumps
+from tests.corpus import patterns, texts
+
+
+def build(*instrs):
+    """Instructions from ``(cmd, arg1, arg2)`` tuples"""
+    return [Instruction(*i) for i in instrs]
+
+
+def tuples(instr_list):
+    return [(i.cmd, i.arg1, i.arg2) for i in instr_list]
+
+
+def splits(instr_list):
+    return sum(i.cmd == 'split' for i in instr_list)
+
+
+def targets(instr_list):
+    """Every program counter a ``jmp``, ``split`` or ``repeat`` can go to"""
+    for instr in instr_list:
+        if instr.cmd in ('jmp', 'repeat'):
+            yield instr.arg1
+        elif instr.cmd == 'split':
+            yield instr.arg1
+            yield instr.arg2
+
+
+class OptimizeTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def check(self, instrs, want, **counts):
+        """Optimize ``instrs`` into ``want``, with the given counts"""
+        stats = {}
+        result = optimize(build(*instrs), 1, stats)
+        self.assertEqual(tuples(result), want)
+        want_stats = {'threaded': 0, 'folded': 0, 'unreachable': 0,
+                      'fallthrough': 0, 'before': len(instrs),
+                      'after': len(want)}
+        want_stats.update(counts)
+        self.assertEqual(stats, want_stats)
+
+    def test_thread_jumps(self):
+        # Both the jmp at 2 and the one at 4 lead through the chain to 6.
+        # Then the jmp at 5 is unreachable and the one at 4 falls through.
+        self.check(
+            [('split', 1, 3), ('char', 'a'), ('jmp', 4), ('char', 'b'),
+             ('jmp', 5), ('jmp', 6), ('match',)],
+            [('split', 1, 3), ('char', 'a', None), ('jmp', 4, None),
+             ('char', 'b', None), ('match', None, None)],
+            threaded=2, unreachable=1, fallthrough=1)
+
+    def test_fold_splits(self):
+        # Both arms of the split end up at 3
+        self.check(
+            [('split', 1, 2), ('jmp', 3), ('jmp', 3), ('char', 'a'),
+             ('match',)],
+            [('char', 'a', None), ('match', None, None)],
+            threaded=2, folded=1, unreachable=2, fallthrough=1)
+        # An arm past the end of the program is a thread that dies
+        self.check(
+            [('char', 'a'), ('split', 0, 9), ('match',)],
+            [('char', 'a', None), ('jmp', 0, None)],
+            folded=1, unreachable=1)
+        self.check(
+            [('char', 'a'), ('split', 9, 2), ('match',)],
+            [('char', 'a', None), ('match', None, None)],
+            folded=1, fallthrough=1)
+
+    def test_dead_code(self):
+        self.check(
+            [('jmp', 3), ('char', 'x'), ('char', 'y'), ('char', 'a'),
+             ('jmp', 5), ('match',)],
+            [('char', 'a', None), ('match', None, None)],
+            unreachable=2, fallthrough=2)
+
+    def test_tables_move_with_their_instruction(self):
+        # The range records after a charset and the bounds record after a
+        # repeat are never run, but they are kept and renumbered with it
+        self.check(
+            [('jmp', 4), ('charset', 2), ('range', 97, 97), ('range', 99, 99),
+             ('charset', 2), ('range', 97, 97), ('range', 99, 99),
+             ('repeat', 4, 0), ('bounds', 2, 3), ('match',)],
+            [('charset', 2, None), ('range', 97, 97), ('range', 99, 99),
+             ('repeat', 0, 0), ('bounds', 2, 3), ('match', None, None)],
+            unreachable=3, fallthrough=1)
+
+    def test_level_zero(self):
+        instrs = [('jmp', 1), ('jmp', 2), ('match',)]
+        stats = {}
+        result = optimize(build(*instrs), 0, stats)
+        self.assertEqual(tuples(result), tuples(build(*instrs)))
+        self.assertEqual(stats['before'], stats['after'])
+
+    def test_generated(self):
+        rnd = random.Random(8)
+        inputs = texts(rnd, 40)
+        for pattern in patterns(300, seed=9):
+            root = cmd.tree(pattern)
+            instr_list = root.generate_instructions([])
+            instr_list.append(Instruction('match'))
+            stats = {}
+            result = optimize(instr_list, 1, stats)
+
+            n = len(result)
+            self.assertTrue(all(0 <= t < n for t in targets(result)),
+                            '%s %s' % (pattern, tuples(result)))
+            self.assertEqual(stats['before'], len(instr_list))
+            self.assertEqual(stats['after'], n)
+            self.assertEqual(stats['before'] - stats['after'],
+                             stats['unreachable'] + stats['fallthrough'],
+                             pattern)
+            # Each fold turns one split into a jmp
+            threaded = thread_jumps(instr_list, {'threaded': 0, 'folded': 0})
+            self.assertEqual(splits(instr_list) - splits(threaded),
+                             stats['folded'], pattern)
+
+            before = serialize(instr_list)
+            after = serialize(result)
+            for s in inputs:
+                for run in (vm.match, vm.fullmatch, vm.search):
+                    self.assertEqual(run(after, s), run(before, s),
+                                     '%s %r' % (pattern, s))
+
+
+if __name__ == '__main__':
+    unittest.main()
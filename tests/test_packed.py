@@ -0,0 +1,82 @@
+"""
+Programs packed by :py:func:`rajax.instructions.to_bytes` must read back
+unchanged from any buffer, and anything else must be refused with
+``ValueError``, which :py:class:`rajax.cache.DiskCache` relies on.
+"""
+import mmap
+import struct
+import tempfile
+import unittest
+
+from rajax import cmd, parser
+from rajax.instructions import PACKED_VERSION, from_buffer, to_bytes
+from tests.corpus import patterns
+
+
+class PackedTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_round_trip(self):
+        for pattern in patterns(200, seed=5) + [u'\u20ac[^\u00e9]+']:
+            program = cmd.parse(pattern, use_cache=False)
+            data = to_bytes(program)
+            for buf in (data, buffer(data), bytearray(data),
+                        memoryview(data)):
+                packed = from_buffer(buf)
+                self.assertEqual(packed.unpack(), program, pattern)
+                self.assertEqual(len(packed), len(program))
+                self.assertEqual(list(packed), program)
+                self.assertEqual(packed, program)
+
+    def test_mmap(self):
+        program = cmd.parse('a(b|c)*d{2,}', use_cache=False)
+        with tempfile.TemporaryFile() as f:
+            f.write(to_bytes(program))
+            f.flush()
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                packed = from_buffer(buf)
+                self.assertEqual(packed[0], program[0])
+                self.assertEqual(packed[-1], program[-1])
+                self.assertEqual(packed.unpack(), program)
+            finally:
+                buf.close()
+
+    def test_index(self):
+        packed = from_buffer(to_bytes(cmd.parse('ab', use_cache=False)))
+        self.assertRaises(IndexError, packed.__getitem__, len(packed))
+        self.assertRaises(IndexError, packed.__getitem__, -len(packed) - 1)
+        self.assertNotEqual(packed, [])
+
+    def test_layout(self):
+        # The same bytes on every host: little-endian, four bytes per field
+        program = [(1, 0x61, 0x11FFFF), (8, 2, 0xFFFFFFFF)]
+        self.assertEqual(
+            to_bytes(program),
+            'RJAX' '\x01\x00' '\x00\x00' '\x02\x00\x00\x00'
+            '\x01\x00\x00\x00' 'a\x00\x00\x00' '\xff\xff\x11\x00'
+            '\x08\x00\x00\x00' '\x02\x00\x00\x00' '\xff\xff\xff\xff')
+        self.assertEqual(from_buffer(to_bytes(program)).unpack(), program)
+
+    def test_bad_buffers(self):
+        data = to_bytes(cmd.parse('ab*', use_cache=False))
+        header = struct.calcsize('<4sHHI')
+        bad = [
+            '',
+            data[:header - 1],
+            # Header promises more instructions than follow
+            data[:-1],
+            data[:header],
+            'XXXX' + data[4:],
+            data[:4] + struct.pack('<H', PACKED_VERSION + 1) + data[6:],
+        ]
+        for buf in bad:
+            self.assertRaises(ValueError, from_buffer, buf)
+        # An empty program is fine
+        self.assertEqual(from_buffer(to_bytes([])).unpack(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
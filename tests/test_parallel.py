@@ -0,0 +1,134 @@
+"""
+Scanning a file with a pool of workers must select the same lines, with the
+same numbers, as scanning it in one process. Chaining the summaries of the
+pieces of an input must give what one scan of the whole input gives.
+"""
+import os
+import random
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+from rajax import cmd, grep, parallel, parser, vm
+from rajax.dfa import LazyDFA, TooManyStates
+from tests.corpus import patterns, texts
+
+PATTERNS = ['a', 'ab*c', '^b', '1$', '(a|c)[.]', '[^abc]+', 'x']
+
+
+class ParallelScanTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'f')
+        rnd = random.Random(0)
+        self.data = '\n'.join(texts(rnd, 500, max_len=12))
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def expected(self, g):
+        """``(lineno, start, end)`` of the lines ``g`` selects, one by one"""
+        result = []
+        start = 0
+        for lineno, line in enumerate(self.data.split('\n'), 1):
+            if g.line_matches(line) != g.invert:
+                result.append((lineno, start, start + len(line)))
+            start += len(line) + 1
+        return result
+
+    def test_split_lines(self):
+        ranges = parallel.split_lines(self.data, 100)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(self.data))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(self.data[end - 1], '\n')
+        self.assertEqual(parallel.split_lines('', 100), [])
+
+    def test_lines(self):
+        for pattern in PATTERNS:
+            for invert in (False, True):
+                g = grep.Grep(pattern, invert=invert)
+                want = self.expected(g)
+                with parallel.ParallelScan(g, jobs=3, chunk_size=97) as scan:
+                    self.assertEqual(list(scan.lines(self.path)), want,
+                                     '%r invert=%r' % (pattern, invert))
+                    self.assertEqual(scan.count(self.path), len(want))
+
+    def test_main(self):
+        # -j gives the same output as one process
+        for args in (['-n', 'ab'], ['-c', 'b'], ['-v', 'a'], ['-l', 'c']):
+            outputs = []
+            for jobs in ('1', '2'):
+                saved = sys.stdout
+                sys.stdout = StringIO.StringIO()
+                try:
+                    status = grep.main(args + ['-j', jobs, '--chunk-size',
+                                               '50', self.path])
+                    outputs.append((status, sys.stdout.getvalue()))
+                finally:
+                    sys.stdout = saved
+            self.assertEqual(outputs[0], outputs[1], args)
+
+
+class SpeculativeScanTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def tables(self, count, seed):
+        """``(pattern, program, table)`` for generated patterns that fit"""
+        for pattern in patterns(count, seed=seed):
+            program = cmd.parse(pattern, use_cache=False)
+            dfa = LazyDFA(program)
+            if dfa.counted:
+                continue
+            try:
+                table = dfa.table(anchored=False, max_states=200)
+            except TooManyStates:
+                continue
+            yield pattern, program, table
+
+    def composed(self, table, s, cuts):
+        """The result of :py:meth:`scan`, from summaries of the pieces"""
+        bounds = zip([0] + cuts, cuts + [len(s)])
+        states = xrange(len(table))
+        summaries = [parallel.summarize(table, s, start, end, states)
+                     for start, end in bounds]
+        state, last, ids = reduce(parallel.compose, summaries)[0]
+        ids = ids | table.match_ids[0]
+        if last is None and table.match_ids[0]:
+            last = 0
+        return table.finish(state, last, ids, len(s))
+
+    def test_compose(self):
+        rnd = random.Random(0)
+        for pattern, program, table in self.tables(400, seed=16):
+            for s in texts(rnd, 4, max_len=30):
+                if not s:
+                    continue
+                cuts = sorted(rnd.randint(1, len(s)) for _ in xrange(3))
+                whole = table.scan(s)
+                self.assertEqual(self.composed(table, s, cuts), whole,
+                                 '%r %r %r' % (pattern, s, cuts))
+                # The end of the leftmost-first match, as a search finds
+                m = vm.search(program, s)
+                self.assertEqual(whole[1], m and m[1], '%r %r' % (pattern, s))
+
+    def test_scan(self):
+        rnd = random.Random(1)
+        s = ''.join(texts(rnd, 200, max_len=10))
+        for pattern, _, table in list(self.tables(40, seed=17))[:5]:
+            scan = parallel.SpeculativeScan(table, jobs=3, chunk_size=64)
+            self.assertEqual(scan.scan(s), table.scan(s), pattern)
+            self.assertEqual(scan.scan(''), table.scan(''), pattern)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+The shipped :py:mod:`rajax.parsetab` must be loaded as is by the ply pinned in
+reqs.txt, not silently rebuilt on every start. Other versions of ply rebuild
+the tables in memory, which is slower but works.
+"""
+import unittest
+
+import ply.yacc as yacc
+
+from rajax import parser, parsetab
+
+#: The ply that writes and reads the shipped tables, as pinned in reqs.txt
+TABLE_PLY = '3.4'
+
+
+class ParseTabTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+        self.saved = parser._parser, yacc.LRGeneratedTable
+        parser._parser = None
+
+    def tearDown(self):
+        parser._parser, yacc.LRGeneratedTable = self.saved
+
+    @unittest.skipIf(yacc.__version__ != TABLE_PLY,
+                     'the shipped tables are for ply %s' % TABLE_PLY)
+    def test_tables_load(self):
+        def rebuild(*args, **kwargs):
+            raise AssertionError(
+                'parsetab.py was rejected by ply %s; regenerate it with'
+                ' parser.write_tables()' % yacc.__version__)
+        yacc.LRGeneratedTable = rebuild
+        self.assertEqual(parsetab._tabversion, yacc.__tabversion__)
+        self.assertEqual(parser.parse('ab').node_type, 're_expr')
+
+    def test_any_ply(self):
+        # With the shipped tables or without them, the parser works
+        self.assertEqual(parser.parse('ab').node_type, 're_expr')
+
+
+if __name__ == '__main__':
+    unittest.main()
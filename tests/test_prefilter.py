@@ -0,0 +1,145 @@
+"""
+:py:func:`rajax.prefilter.required_factors` must only ask for text that every
+match contains, and :py:class:`rajax.prefilter.PatternSet` must find the same
+patterns as running each of them.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, simplify, vm
+from rajax.prefilter import (
+    AhoCorasick,
+    PatternSet,
+    best_requirement,
+    required_factors,
+)
+from tests.corpus import patterns, texts
+
+
+def factors(pattern):
+    return required_factors(simplify.simplify(parser.parse(pattern)))
+
+
+class RequiredFactorsTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_factors(self):
+        cases = [
+            ('abc', [set(['abc'])]),
+            ('a(b|cd)e', [set(['a']), set(['b', 'cd']), set(['e'])]),
+            ('x(ab)+y', [set(['x']), set(['ab']), set(['y'])]),
+            ('a{2,3}', [set(['a'])]),
+            ('(ab|c*)d', [set(['d'])]),
+            ('a.b', [set(['a']), set(['b'])]),
+            ('a\\nb', [set(['a\nb'])]),
+            ('a*', []),
+            ('(ab)?', []),
+            ('a{0,2}', []),
+            ('.', []),
+            ('ab|c*', []),
+        ]
+        for pattern, want in cases:
+            self.assertEqual(factors(pattern), want, pattern)
+
+    def test_best_requirement(self):
+        self.assertEqual(best_requirement([]), None)
+        self.assertEqual(best_requirement(factors('a(bc|def)g')),
+                         set(['bc', 'def']))
+        self.assertEqual(best_requirement(factors('ab.c')), set(['ab']))
+
+    def test_generated(self):
+        # Every match contains one string of each requirement
+        rnd = random.Random(0)
+        for pattern in patterns(1000, seed=10):
+            program = cmd.parse(pattern, use_cache=False)
+            reqs = factors(pattern)
+            for s in texts(rnd, 8):
+                m = vm.search(program, s)
+                if m is None:
+                    continue
+                found = s[m[0]:m[1]]
+                for req in reqs:
+                    self.assertTrue(any(w in found for w in req),
+                                    '%r %r %r' % (pattern, found, req))
+
+
+class AhoCorasickTest(unittest.TestCase):
+
+    def test_find(self):
+        ac = AhoCorasick(['he', 'she', 'his', 'hers'])
+        self.assertEqual(ac.find('ushers'), set([0, 1, 3]))
+        self.assertEqual(ac.find('ahishe'), set([0, 1, 2]))
+        self.assertEqual(ac.find('h'), set())
+        self.assertEqual(AhoCorasick([u'\xe9t\xe9']).find(u'l\xe9t\xe9'),
+                         set([0]))
+
+    def test_generated(self):
+        rnd = random.Random(1)
+        for _ in xrange(200):
+            words = list(set(texts(rnd, 4, max_len=3)) - set(['']))
+            ac = AhoCorasick(words)
+            for s in texts(rnd, 8, max_len=12):
+                self.assertEqual(
+                    ac.find(s),
+                    set(i for i, w in enumerate(words) if w in s),
+                    '%r %r' % (words, s))
+
+
+class PatternSetTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_generated(self):
+        rnd = random.Random(2)
+        corpus = patterns(200, seed=12) + ['a\\nb', 'ab|c*', 'b{2}c']
+        pattern_set = PatternSet(corpus)
+        programs = [cmd.parse(p, use_cache=False) for p in corpus]
+        for s in texts(rnd, 30) + ['xa\nb', 'bbc']:
+            for anchored in (False, True):
+                run = vm.match if anchored else vm.search
+                want = [i for i, p in enumerate(programs)
+                        if run(p, s) is not None]
+                self.assertEqual(pattern_set.match_ids(s, anchored=anchored),
+                                 want, repr(s))
+        stats = pattern_set.stats
+        self.assertEqual(stats['inputs'], 64)
+        # Literal factors rule some patterns out
+        self.assertTrue(sum(stats['skipped']))
+
+    def test_options(self):
+        corpus = patterns(60, seed=13) + [u'\u00e9t\u00e9|b', u'x\u00e9+']
+        inputs = texts(random.Random(3), 20) + [u'\u00e9t\u00e9', u'ax\u00e9']
+        for options in ({'backend': 'rd'}, {'opt_level': 0}, {'utf8': True}):
+            pattern_set = PatternSet(corpus, **options)
+            programs = [cmd.parse(p, use_cache=False, **options)
+                        for p in corpus]
+            self.assertEqual(pattern_set.programs, programs)
+            for s in inputs:
+                if options.get('utf8'):
+                    s = s.encode('utf-8')
+                want = [i for i, p in enumerate(programs)
+                        if vm.search(p, s) is not None]
+                self.assertEqual(pattern_set.match_ids(s), want,
+                                 '%r %r' % (options, s))
+
+    def test_parses_once(self):
+        corpus = ['abc', 'a|bc', '(ab)+c']
+        calls = []
+        saved = cmd.BACKENDS['rd']
+
+        def counting_parse(s):
+            calls.append(s)
+            return saved(s)
+        cmd.BACKENDS['rd'] = counting_parse
+        try:
+            PatternSet(corpus, backend='rd')
+        finally:
+            cmd.BACKENDS['rd'] = saved
+        self.assertEqual(calls, corpus)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+:py:class:`rajax.profiling.CompileStats` must account for the same work
+whether patterns are compiled one at a time or as a set.
+"""
+import unittest
+
+from rajax import cmd, parser, profiling
+
+
+class CompileStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_optimizer_counts(self):
+        for compile_func, s in ((cmd.parse, 'a(b|c)*'),
+                                (cmd.compile_set, ['a(b|c)*', 'd?e'])):
+            stats = profiling.CompileStats()
+            program = compile_func(s, stats=stats)
+            opt = stats.optimizer
+            self.assertEqual(opt['after'], len(program), compile_func)
+            self.assertGreater(opt['threaded'], 0, compile_func)
+            self.assertEqual(stats.as_dict()['optimizer'], opt)
+            self.assertIn('optimizer removed', stats.format_table())
+
+    def test_opt_level_0(self):
+        stats = profiling.CompileStats()
+        program = cmd.compile_set(['ab', 'c*'], stats=stats, opt_level=0)
+        self.assertEqual(stats.optimizer['before'], len(program))
+        self.assertEqual(stats.optimizer['after'], len(program))
+
+
+if __name__ == '__main__':
+    unittest.main()
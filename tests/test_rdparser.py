@@ -0,0 +1,46 @@
+"""
+The recursive descent parser must give exactly the programs the PLY parser
+does, and fail with exactly the same errors.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser
+from tests.corpus import BAD_PATTERNS, damaged, patterns
+
+
+def outcome(pattern, backend, opt_level):
+    """The program for ``pattern``, or the type and message of its error"""
+    try:
+        return cmd.parse(pattern, use_cache=False, backend=backend,
+                         opt_level=opt_level)
+    except Exception as e:
+        return type(e), str(e)
+
+
+class BackendTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def assertSameOutcome(self, pattern):
+        for opt_level in (0, 1):
+            self.assertEqual(outcome(pattern, 'rd', opt_level),
+                             outcome(pattern, 'ply', opt_level),
+                             '%r at -O%d' % (pattern, opt_level))
+
+    def test_generated(self):
+        for pattern in patterns(2000, seed=13):
+            self.assertSameOutcome(pattern)
+
+    def test_errors(self):
+        for pattern in BAD_PATTERNS:
+            self.assertRaises(TypeError, cmd.parse, pattern, use_cache=False,
+                              backend='rd')
+            self.assertSameOutcome(pattern)
+
+    def test_damaged(self):
+        rnd = random.Random(0)
+        for pattern in patterns(1000, seed=14):
+            for bad in damaged(rnd, pattern):
+                self.assertSameOutcome(bad)
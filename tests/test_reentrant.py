@@ -0,0 +1,54 @@
+"""
+Lexing, parsing, code generation and visualization must give the same results
+when many threads compile at once as when one thread does.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from rajax import cmd, parser, visualize
+from tests.corpus import patterns
+
+THREADS = 16
+
+
+class ReentrantTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+        self.tmp = tempfile.mkdtemp()
+        # Switch threads as often as possible, so that any shared state is
+        # found
+        self.interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+
+    def tearDown(self):
+        sys.setcheckinterval(self.interval)
+        shutil.rmtree(self.tmp)
+
+    def compile(self, (i, pattern)):
+        """The program of ``pattern`` and the dot file of its full AST"""
+        program = cmd.parse(pattern, use_cache=False)
+        path = os.path.join(self.tmp, '%d.dot' % i)
+        visualize.ast_dot(parser.parse(pattern, fg=True), path)
+        with open(path) as f:
+            return program, f.read()
+
+    def test_threads(self):
+        corpus = list(enumerate(patterns(2000, seed=11)))
+        expected = map(self.compile, corpus)
+        pool = ThreadPool(THREADS)
+        try:
+            results = pool.map(self.compile, corpus, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        for (_, pattern), got, want in zip(corpus, results, expected):
+            self.assertEqual(got, want, pattern)
+
+
+if __name__ == '__main__':
+    unittest.main()
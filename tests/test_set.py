@@ -0,0 +1,63 @@
+"""
+A program built by :py:func:`rajax.cmd.compile_set` must report exactly the
+patterns whose own programs match.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.dfa import LazyDFA
+from tests.corpus import patterns, texts
+
+
+class CompileSetTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def assertSameMatches(self, group, strings):
+        programs = [cmd.parse(p, use_cache=False) for p in group]
+        anchored = cmd.compile_set(group, use_cache=False)
+        unanchored = cmd.compile_set(group, use_cache=False, anchored=False)
+        for s in strings:
+            for full in (False, True):
+                for anchor in (True, False):
+                    want = [i for i, p in enumerate(programs)
+                            if vm.run(p, s, anchored=anchor, full=full)
+                            is not None]
+                    got = vm.match_set(anchored, s, anchored=anchor,
+                                       full=full)
+                    self.assertEqual(got, want, '%r %r full=%r anchored=%r'
+                                     % (group, s, full, anchor))
+                    self.assertEqual(
+                        LazyDFA(anchored).match_set(s, anchored=anchor,
+                                                    full=full),
+                        want, group)
+                # The .*? prefix finds the same patterns in an anchored run
+                self.assertEqual(
+                    vm.match_set(unanchored, s, full=full),
+                    vm.match_set(anchored, s, anchored=False, full=full),
+                    '%r %r full=%r' % (group, s, full))
+
+    def test_generated(self):
+        rnd = random.Random(0)
+        corpus = patterns(600, seed=9)
+        while corpus:
+            n = rnd.randint(1, 4)
+            group, corpus = corpus[:n], corpus[n:]
+            self.assertSameMatches(group, texts(rnd, 6))
+
+    def test_shared_prefix(self):
+        # Every pattern starts with ^, so the set gets no .*? loop
+        group = ['^ab', '^a', '^b*']
+        self.assertEqual(cmd.compile_set(group, use_cache=False),
+                         cmd.compile_set(group, use_cache=False,
+                                         anchored=False))
+        self.assertSameMatches(group, ['ab', 'b', 'xab', ''])
+
+    def test_empty(self):
+        self.assertRaises(ValueError, cmd.compile_set, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
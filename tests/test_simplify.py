@@ -0,0 +1,44 @@
+"""
+Programs compiled with and without :py:mod:`rajax.simplify` and the peephole
+optimizer must find exactly the same matches.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from tests.corpus import patterns, texts
+
+
+class OptLevelTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def assertSameMatches(self, pattern, strings):
+        plain = cmd.parse(pattern, use_cache=False, opt_level=0)
+        optimized = cmd.parse(pattern, use_cache=False, opt_level=1)
+        for s in strings:
+            for run in (vm.match, vm.search, vm.fullmatch):
+                self.assertEqual(run(plain, s), run(optimized, s),
+                                 '%s(%r, %r)' % (run.__name__, pattern, s))
+
+    def test_nested_quantifiers_with_empty_bodies(self):
+        self.assertSameMatches('((a?|b)+)?', ['b', 'ab', ''])
+        self.assertSameMatches('((a*)+)?', ['aa', 'b'])
+
+    def test_counted_forms_with_empty_bodies(self):
+        # {1,}, {0,} and {0,1} become +, * and ?, which then meet the outer
+        # quantifier
+        self.assertSameMatches('((([^\\Wb])*|c|[a-c]){1,})?', ['bc1', 'c'])
+        self.assertSameMatches('((a?){1,})?', ['a', 'b'])
+        self.assertSameMatches('((a|b?){0,1})+', ['ab', 'b'])
+        self.assertSameMatches('(a?){1,}b', ['aab', 'b'])
+
+    def test_generated(self):
+        rnd = random.Random(0)
+        for pattern in patterns(1500, seed=8):
+            self.assertSameMatches(pattern, texts(rnd, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
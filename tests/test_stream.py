@@ -0,0 +1,76 @@
+"""
+:py:class:`rajax.stream.StreamMatcher` must give what :py:func:`rajax.vm.run`
+gives for the whole input, however the input is cut into chunks.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, vm
+from rajax.stream import StreamMatcher
+from tests.corpus import patterns, texts
+
+
+def chunked(rnd, s):
+    """``s`` cut at random places, sometimes into empty chunks"""
+    cuts = sorted(rnd.randint(0, len(s)) for _ in xrange(rnd.randint(0, 4)))
+    return [s[i:j] for i, j in zip([0] + cuts, cuts + [len(s)])]
+
+
+class StreamMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def assertSameMatch(self, program, s, chunks, anchored, full):
+        matcher = StreamMatcher(program, anchored=anchored, full=full)
+        decided = None
+        for chunk in chunks:
+            result = matcher.feed(chunk)
+            if matcher.done and decided is None:
+                decided = (result,)
+        got = matcher.finish()
+        want = vm.run(program, s, anchored=anchored, full=full)
+        msg = '%r anchored=%r full=%r' % (chunks, anchored, full)
+        self.assertEqual(got, want, msg)
+        if decided is not None:
+            # A result given before the end must not change
+            self.assertEqual(decided[0], got, msg)
+
+    def test_generated(self):
+        rnd = random.Random(0)
+        for pattern in patterns(600, seed=15):
+            program = cmd.parse(pattern, use_cache=False)
+            for s in texts(rnd, 4, max_len=10):
+                for anchored in (True, False):
+                    for full in (False, True):
+                        self.assertSameMatch(program, s, chunked(rnd, s),
+                                             anchored, full)
+
+    def test_early_result(self):
+        matcher = StreamMatcher(cmd.parse('ab+c'), anchored=False)
+        self.assertEqual(matcher.feed('xxa'), None)
+        self.assertEqual(matcher.feed('bb'), None)
+        self.assertEqual(matcher.feed('bcx'), (2, 7))
+        self.assertTrue(matcher.done)
+        # Later input is ignored
+        self.assertEqual(matcher.feed('abc'), (2, 7))
+        self.assertEqual(matcher.offset, 8)
+
+    def test_eol(self):
+        # Whether $ matches is only known at the end
+        matcher = StreamMatcher(cmd.parse('a$'), anchored=False)
+        self.assertEqual(matcher.feed('ba'), None)
+        self.assertFalse(matcher.done)
+        self.assertEqual(matcher.feed('a'), None)
+        self.assertEqual(matcher.finish(), (2, 3))
+
+    def test_unicode_chunks(self):
+        program = cmd.parse(u'\xe9+', use_cache=False)
+        matcher = StreamMatcher(program, anchored=False)
+        for chunk in (u'a\xe9', u'\xe9', u'b'):
+            matcher.feed(chunk)
+        self.assertEqual(matcher.finish(), (1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+A program compiled with ``utf8=True`` must find in UTF-8 encoded bytes
+exactly what the code point program finds in the decoded text, with offsets
+counted in bytes.
+"""
+import random
+import unittest
+
+from rajax import cmd, parser, utf8, vm
+from tests.corpus import patterns, texts
+
+# Characters of the corpus replaced by ones that take 2, 3 and 4 bytes
+WIDE = {u'a': u'\xe9', u'c': u'\u20ac', u'b': u'\U0001f600'}
+
+
+def widen(s):
+    return u''.join(WIDE.get(c, c) for c in unicode(s))
+
+
+def byte_offsets(text, m):
+    """``m`` in code points of ``text``, as offsets into its encoding"""
+    if m is None:
+        return None
+    return tuple(len(text[:i].encode('utf-8')) for i in m)
+
+
+class UTF8Test(unittest.TestCase):
+
+    def setUp(self):
+        parser.debug = False
+
+    def test_encode(self):
+        for c in (0, 0x7F, 0x80, 0x7FF, 0x800, 0xD7FF, 0xE000, 0xFFFF,
+                  0x10000, 0x10FFFF):
+            self.assertEqual(bytearray(utf8.encode(c)),
+                             bytearray(unichr(c).encode('utf-8')), hex(c))
+
+    def test_sequences(self):
+        # Each code point of the range is matched by exactly one sequence,
+        # and nothing else is
+        rnd = random.Random(0)
+        bounds = [0, 0x7F, 0x80, 0x7FF, 0x800, 0xD7FF, 0xD800, 0xDFFF,
+                  0xE000, 0xFFFF, 0x10000, 0x10FFFF]
+        for _ in xrange(300):
+            lo, hi = sorted(rnd.choice(bounds) + rnd.randint(-2, 2)
+                            for _ in xrange(2))
+            lo, hi = max(lo, 0), min(hi, 0x10FFFF)
+            seqs = utf8.sequences(lo, hi)
+            for c in set(rnd.choice(bounds) + rnd.randint(-3, 3)
+                         for _ in xrange(20)):
+                if not 0 <= c <= 0x10FFFF or 0xD800 <= c <= 0xDFFF:
+                    continue
+                enc = utf8.encode(c)
+                n = sum(1 for seq in seqs if len(seq) == len(enc) and
+                        all(b_lo <= b <= b_hi
+                            for b, (b_lo, b_hi) in zip(enc, seq)))
+                self.assertEqual(n, 1 if lo <= c <= hi else 0,
+                                 '%x-%x %x' % (lo, hi, c))
+
+    def test_generated(self):
+        rnd = random.Random(1)
+        for pattern in patterns(600, seed=14):
+            pattern = widen(pattern)
+            points = cmd.parse(pattern, use_cache=False)
+            for anchored in (True, False):
+                program = cmd.parse(pattern, use_cache=False, utf8=True,
+                                    anchored=anchored)
+                find = vm.match if anchored else vm.search
+                for text in texts(rnd, 6):
+                    text = widen(text)
+                    # The unanchored program searches from offset 0
+                    self.assertEqual(
+                        vm.match(program, text.encode('utf-8')),
+                        byte_offsets(text, find(points, text)),
+                        '%r %r anchored=%r' % (pattern, text, anchored))
+
+    def test_byte_pattern(self):
+        # A byte string pattern is decoded first
+        program = cmd.parse(u'\u20ac+'.encode('utf-8'), use_cache=False,
+                            utf8=True)
+        self.assertEqual(vm.match(program, u'\u20ac\u20acx'.encode('utf-8')),
+                         (0, 6))
+
+    def test_wildcard(self):
+        program = cmd.parse('.', use_cache=False, utf8=True)
+        for c in (u'a', u'\xe9', u'\u20ac', u'\U0001f600'):
+            self.assertEqual(vm.fullmatch(program, c.encode('utf-8')),
+                             (0, len(c.encode('utf-8'))), repr(c))
+        self.assertEqual(vm.fullmatch(program, u'ab'.encode('utf-8')), None)
+
+    def test_invalid_input(self):
+        # The search loop skips bytes that aren't valid UTF-8
+        program = cmd.parse(u'\u20ac', use_cache=False, utf8=True,
+                            anchored=False)
+        s = '\xff\x80' + u'\u20ac'.encode('utf-8')
+        self.assertEqual(vm.match(program, s), (2, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()